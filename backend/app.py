@@ -1,43 +1,83 @@
-from flask import Flask, send_from_directory
+from flask import Flask, jsonify, send_from_directory
 from config import Config
 from models import db
-from flask_migrate import Migrate
 from flask_jwt_extended import JWTManager
 from flask_login import LoginManager
-from routes.auth import auth_bp
-from routes.sample import sample_bp
-from routes.image import image_bp
 from flask_cors import CORS
+from utils.jobs import jobs
+from utils.cache import prompt_cache
+from utils.storage import init_storage
+from utils.serving import send_stored_image, send_index
+from utils.users import user_cache
+from utils.google import google_tokens
+from utils.quotas import quotas
+from utils.passwords import passwords
+from utils.providers import providers
+from utils.reaper import reaper
+from utils.ledger import ledger
+from utils.db import init_db
+from utils.metrics import init_metrics
+import importlib
+import logging
 import os
 
-def create_app():
+# Blueprint name -> (module, attribute, url prefix); modules are imported
+# only for the names in BLUEPRINTS
+BLUEPRINTS = {
+    'auth': ('routes.auth', 'auth_bp', '/auth'),
+    'sample': ('routes.sample', 'sample_bp', '/api'),
+    'image': ('routes.image', 'image_bp', '/image'),
+}
+
+def create_app(cli=True):
+    """Build the app. Web workers pass cli=False to skip Flask-Migrate
+    (alembic) and the maintenance commands, which only the CLI uses."""
     app = Flask(__name__, static_folder='../frontend/build/static', static_url_path='/static')
     app.config['JWT_SECRET_KEY'] = os.getenv('JWT_SECRET_KEY', 'default_key_for_dev')
     app.config.from_object(Config)
+    logging.basicConfig(level=app.config['LOG_LEVEL'])
     #app.config['DEBUG'] = True
 
     #static_app = Flask('static_app', static_folder='static', static_url_path='/static')
     # Initialize extensions
-    db.init_app(app)
+    init_db(app)
+    with app.app_context():
+        init_metrics(app, db.engine)
     jwt = JWTManager(app) 
     login_manager = LoginManager()
     login_manager.init_app(app)
-    migrate = Migrate(app, db)
+    jobs.init_app(app)
+    user_cache.init_app(app)
+    google_tokens.init_app(app)
+    quotas.init_app(app)
+    passwords.init_app(app)
+    prompt_cache.init_app(app)
+    providers.init_app(app)
+    init_storage(app)
+    reaper.init_app(app)
+    ledger.init_app(app)
+    if cli:
+        from flask_migrate import Migrate
+        from utils.storage import storage_migrate_command, backfill_variants_command
+        from utils.reaper import storage_gc_command
+        Migrate(app, db)
+        app.cli.add_command(backfill_variants_command)
+        app.cli.add_command(storage_migrate_command)
+        app.cli.add_command(storage_gc_command)
 
-    # Serve static files (images)
-    @app.route('/static/<path:filename>')
-    def serve_static(filename):
-        return send_from_directory('static', filename)
+    # Serve generated images (long-lived, conditional and range-aware)
+    @app.route('/static/images/<path:key>')
+    def serve_image(key):
+        return send_stored_image(f"images/{key}")
     
     # Serve React app
     @app.route('/', defaults={'path': ''})
     @app.route('/<path:path>')
     def serve(path):
-        if path.startswith('auth/') or path.startswith('api/') or path.startswith('image/'):
-            return app.send_static_file('index.html')
-        if path != "" and os.path.exists(os.path.join('../frontend/build', path)):
+        if path != "" and not path.startswith(('auth/', 'api/', 'image/')) \
+                and os.path.exists(os.path.join('../frontend/build', path)):
             return send_from_directory('../frontend/build', path)
-        return send_from_directory('../frontend/build', 'index.html')
+        return send_index('../frontend/build')
 
     # Update the CORS configuration
     CORS(app, resources={
@@ -60,20 +100,36 @@ def create_app():
         return response
 
     # Register Blueprints
-    app.register_blueprint(auth_bp, url_prefix='/auth')
-    app.register_blueprint(sample_bp, url_prefix='/api')
-    app.register_blueprint(image_bp, url_prefix='/image')
-
-    # Import User model for login manager
-    from models import User
+    for name in app.config['BLUEPRINTS']:
+        if name not in BLUEPRINTS:
+            raise ValueError(f"Unknown blueprint {name!r}")
+        module, attribute, url_prefix = BLUEPRINTS[name]
+        app.register_blueprint(getattr(importlib.import_module(module), attribute), url_prefix=url_prefix)
 
     @login_manager.user_loader
     def load_user(user_id):
-        return User.query.get(int(user_id))
+        return user_cache.get(user_id)
+
+    # Protected routes read the user via get_current_user(); it is looked up
+    # once per request and cached across requests
+    @jwt.user_lookup_loader
+    def load_jwt_user(_jwt_header, jwt_data):
+        return user_cache.get(jwt_data['sub'])
+
+    @jwt.user_lookup_error_loader
+    def jwt_user_not_found(_jwt_header, jwt_data):
+        return jsonify({"error": "User not found"}), 404
 
     return app
 
-app = create_app()
+def __getattr__(name):
+    # `from app import app` and `flask --app app` still work: the full app
+    # is built on first access rather than as a side effect of importing
+    if name == 'app':
+        global app
+        app = create_app()
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 if __name__ == '__main__': 
-    app.run(debug=False)
+    create_app().run(debug=False)
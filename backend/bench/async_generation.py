@@ -0,0 +1,130 @@
+# bench/async_generation.py
+"""Compare generation throughput of the threaded and async job paths.
+
+A local stub stands in for the image host: every download waits --delay
+seconds before the placeholder bytes are sent, like a slow upstream. Each
+mode runs in a fresh process (Config reads the environment at import), all
+jobs are submitted at once and the script reports jobs finished per second.
+
+    cd backend && python bench/async_generation.py --jobs 200 --delay 1
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PLACEHOLDER = os.path.join(BACKEND_DIR, 'static', 'images', 'placeholder.png')
+
+
+def start_stub(delay):
+    with open(PLACEHOLDER, 'rb') as f:
+        body = f.read()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            time.sleep(delay)
+            self.send_response(200)
+            self.send_header('Content-Type', 'image/png')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    ThreadingHTTPServer.request_queue_size = 1024
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def run_mode(jobs_count):
+    """Child process: submit every job, then wait for them all to settle"""
+    sys.path.insert(0, BACKEND_DIR)
+    from flask_jwt_extended import create_access_token
+    from app import app
+    from models import db, GenerationJob, User
+
+    with app.app_context():
+        db.create_all()
+        user = User(username='bench', email='bench@example.com')
+        user.set_password('bench')
+        db.session.add(user)
+        db.session.commit()
+        token = create_access_token(identity=str(user.id))
+
+    client = app.test_client()
+    headers = {'Authorization': f'Bearer {token}'}
+    start = time.perf_counter()
+    for i in range(jobs_count):
+        response = client.post('/image/generate', json={'customPrompt': f'bench {i}'}, headers=headers)
+        assert response.status_code == 202, response.get_json()
+    submitted = time.perf_counter() - start
+
+    with app.app_context():
+        while True:
+            pending = GenerationJob.query.filter(
+                GenerationJob.status.in_([GenerationJob.QUEUED, GenerationJob.RUNNING])).count()
+            if not pending:
+                break
+            db.session.close()
+            time.sleep(0.05)
+        failed = GenerationJob.query.filter_by(status=GenerationJob.FAILED).count()
+    elapsed = time.perf_counter() - start
+    print(f"{submitted:.3f} {elapsed:.3f} {failed}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--jobs', type=int, default=200)
+    parser.add_argument('--delay', type=float, default=1.0, help='stub upstream latency in seconds')
+    parser.add_argument('--workers', type=int, default=4, help='GENERATION_WORKERS for both modes')
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_mode(args.jobs)
+        return
+
+    server = start_stub(args.delay)
+    print(f"{args.jobs} jobs, {args.delay}s upstream latency, {args.workers} worker threads")
+    print(f"{'mode':<8}{'submit s':>10}{'total s':>10}{'jobs/s':>10}{'failed':>8}")
+    for mode in ('threads', 'async'):
+        with tempfile.TemporaryDirectory() as tmp:
+            env = dict(
+                os.environ,
+                SQLALCHEMY_DATABASE_URI=f"sqlite:///{os.path.join(tmp, 'bench.db')}",
+                IMAGE_STORAGE_ROOT=os.path.join(tmp, 'static'),
+                IMAGE_SCRATCH_DIR=os.path.join(tmp, 'scratch'),
+                GENERATION_BACKEND='fake',
+                FAKE_GENERATION_LATENCY='0',
+                FAKE_GENERATION_URL=f"http://127.0.0.1:{server.server_port}/image.png",
+                GENERATION_ASYNC='true' if mode == 'async' else 'false',
+                GENERATION_WORKERS=str(args.workers),
+                GENERATION_QUEUE_SIZE=str(args.jobs),
+                GENERATION_ASYNC_LIMIT=str(args.jobs),
+                HTTP_POOL_MAXSIZE=str(max(args.workers, 10)),
+                DERIVATIVES_ENABLED='false',
+                PROMPT_CACHE_ENABLED='false',
+            )
+            out = subprocess.run([sys.executable, os.path.abspath(__file__), '--child', '--jobs', str(args.jobs)],
+                                 cwd=BACKEND_DIR, env=env, capture_output=True, text=True)
+            if out.returncode != 0:
+                sys.exit(out.stderr)
+            submitted, elapsed, failed = out.stdout.split()[-3:]
+            print(f"{mode:<8}{float(submitted):>10.2f}{float(elapsed):>10.2f}"
+                  f"{args.jobs / float(elapsed):>10.1f}{failed:>8}")
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,167 @@
+# bench/db_stress.py
+"""Mixed read/write stress on the images table.
+
+Several processes (like gunicorn workers), each with several threads, run a
+mix of gallery page reads, inserts and deletes against one database for a
+fixed time, then report throughput, latency and errors such as
+"database is locked".
+
+    cd backend && python bench/db_stress.py --processes 4 --threads 8 --seconds 10
+    cd backend && python bench/db_stress.py --database-uri postgresql://...
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def worker(args, user_ids, results):
+    """One process: run threads until the deadline and report their numbers"""
+    sys.path.insert(0, BACKEND_DIR)
+    from sqlalchemy import select
+    from app import app
+    from models import db, Image
+    from utils.db import pool_stats
+
+    deadline = time.monotonic() + args.seconds
+    latencies = {'read': [], 'insert': [], 'delete': []}
+    errors = Counter()
+    lock = threading.Lock()
+
+    def run():
+        rng = random.Random()
+        mine = []
+        with app.app_context():
+            while time.monotonic() < deadline:
+                roll = rng.random()
+                if roll < args.read_ratio:
+                    op = 'read'
+                elif mine and roll > 1 - (1 - args.read_ratio) / 3:
+                    op = 'delete'
+                else:
+                    op = 'insert'
+                start = time.perf_counter()
+                try:
+                    if op == 'read':
+                        db.session.execute(
+                            select(Image.id, Image.image_path, Image.prompt, Image.generated_at)
+                            .where(Image.user_id == rng.choice(user_ids))
+                            .order_by(Image.generated_at.desc(), Image.id.desc()).limit(50)).all()
+                        db.session.rollback()
+                    elif op == 'insert':
+                        image = Image(prompt='stress', image_path=f'images/stress/{rng.getrandbits(64):x}.png',
+                                      user_id=rng.choice(user_ids))
+                        db.session.add(image)
+                        db.session.commit()
+                        mine.append(image.id)
+                    else:
+                        # Load, then delete, like DELETE /image/api/images/<id>
+                        image = db.session.get(Image, mine.pop(rng.randrange(len(mine))))
+                        db.session.delete(image)
+                        db.session.commit()
+                except Exception as e:
+                    db.session.rollback()
+                    with lock:
+                        errors[f"{op}: {str(e).splitlines()[0][:80]}"] += 1
+                    continue
+                with lock:
+                    latencies[op].append(time.perf_counter() - start)
+
+    threads = [threading.Thread(target=run) for _ in range(args.threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    with app.app_context():
+        stats = pool_stats()
+    results.put({'latencies': latencies, 'errors': dict(errors), 'pool': stats})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--processes', type=int, default=4)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--seed-images', type=int, default=5000)
+    parser.add_argument('--read-ratio', type=float, default=0.7)
+    parser.add_argument('--database-uri', help='defaults to a fresh SQLite file')
+    parser.add_argument('--json', action='store_true', help='print machine-readable results')
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    os.environ['SQLALCHEMY_DATABASE_URI'] = args.database_uri or f"sqlite:///{os.path.join(tmp, 'stress.db')}"
+    os.environ.setdefault('IMAGE_SCRATCH_DIR', os.path.join(tmp, 'scratch'))
+    sys.path.insert(0, BACKEND_DIR)
+    from app import app
+    from models import db, Image, User
+
+    with app.app_context():
+        db.create_all()
+        users = [User(username=f'stress{i}', email=f'stress{i}@example.com', password_hash='x')
+                 for i in range(args.users)]
+        db.session.add_all(users)
+        db.session.commit()
+        user_ids = [user.id for user in users]
+        db.session.add_all([Image(prompt='seed', image_path=f'images/seed/{i}.png', user_id=user_ids[i % len(user_ids)])
+                            for i in range(args.seed_images)])
+        db.session.commit()
+        db.engine.dispose()
+
+    ctx = multiprocessing.get_context('spawn')
+    results = ctx.Queue()
+    processes = [ctx.Process(target=worker, args=(args, user_ids, results)) for _ in range(args.processes)]
+    for process in processes:
+        process.start()
+    reports = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+
+    summary = {'config': {k: v for k, v in vars(args).items() if k != 'database_uri'}, 'ops': {}, 'errors': Counter()}
+    for op in ('read', 'insert', 'delete'):
+        values = [v for report in reports for v in report['latencies'][op]]
+        summary['ops'][op] = {
+            'count': len(values),
+            'per_second': len(values) / args.seconds,
+            'p50_ms': percentile(values, 50) * 1000,
+            'p95_ms': percentile(values, 95) * 1000,
+            'p99_ms': percentile(values, 99) * 1000,
+        }
+    for report in reports:
+        summary['errors'].update(report['errors'])
+    summary['pool'] = [report['pool'] for report in reports]
+
+    if args.json:
+        print(json.dumps(summary, indent=2))
+        return
+    print(f"{args.processes} processes x {args.threads} threads, {args.seconds}s")
+    print(f"{'op':<8}{'ops/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for op, numbers in summary['ops'].items():
+        print(f"{op:<8}{numbers['per_second']:>10.1f}{numbers['p50_ms']:>10.2f}"
+              f"{numbers['p95_ms']:>10.2f}{numbers['p99_ms']:>10.2f}")
+    print(f"errors: {sum(summary['errors'].values())}")
+    for message, count in summary['errors'].most_common(5):
+        print(f"  {count:>6}  {message}")
+    for i, stats in enumerate(summary['pool']):
+        print(f"pool[{i}]: checkouts={stats['checkouts']} timeouts={stats['timeouts']} "
+              f"avg_wait_ms={stats['avg_wait_ms']:.2f} max_wait_ms={stats['max_wait_ms']:.2f}")
+
+
+if __name__ == '__main__':
+    main()
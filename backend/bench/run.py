@@ -0,0 +1,387 @@
+# bench/run.py
+"""Offline load test: the app under waitress against local stubs.
+
+Scenarios:
+    login_storm     concurrent POST /auth/google-login, new then returning users
+    login_retry     a retry storm: --retry-logins concurrent google-logins spread
+                    over --retry-users tokens, all first logins; reports how many
+                    userinfo calls reached the Google stub
+    password_login  concurrent POST /auth/login while a probe pages the gallery;
+                    the probe's latency shows whether hashing starves other requests
+    generate_burst  concurrent POST /image/generate, waits for every job to settle
+    gallery         paging GET /image/user-images through a large seeded history
+    bulk_delete     deleting a seeded history, --delete-batch ids per request
+
+Each scenario reports request count, errors, throughput, p50/p95/p99 latency
+and the server's peak RSS. --output writes the results as JSON; --baseline
+compares against an earlier file and exits 1 on a regression.
+
+    cd backend && python bench/run.py --output bench.json
+    cd backend && python bench/run.py --scenario gallery --baseline bench.json
+"""
+
+import argparse
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from bench.stubs import start_stub_server  # noqa: E402
+
+SCENARIOS = ('login_storm', 'login_retry', 'password_login', 'generate_burst', 'gallery', 'bulk_delete')
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+class Server:
+    """The app in a child process, so its memory is measured on its own"""
+
+    def __init__(self, args, stub_url, workdir):
+        sock = socket.socket()
+        sock.bind(('127.0.0.1', 0))
+        self.port = sock.getsockname()[1]
+        sock.close()
+        self.url = f"http://127.0.0.1:{self.port}"
+
+        env = dict(
+            os.environ,
+            SQLALCHEMY_DATABASE_URI=f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+            IMAGE_STORAGE_ROOT=os.path.join(workdir, 'static'),
+            IMAGE_SCRATCH_DIR=os.path.join(workdir, 'scratch'),
+            GOOGLE_CLIENT_ID='bench',
+            GOOGLE_USERINFO_URL=f"{stub_url}/oauth2/v3/userinfo",
+            GENERATION_BACKEND='replicate',
+            GENERATION_QUEUE_SIZE=str(args.generate_jobs),
+            QUOTAS_ENABLED='false',
+            LOG_LEVEL='WARNING',
+        )
+        command = [sys.executable, os.path.join(BACKEND_DIR, 'bench', 'serve.py'),
+                   '--port', str(self.port), '--threads', str(args.server_threads),
+                   '--stub-url', stub_url, '--replicate-latency', str(args.replicate_latency),
+                   '--image-kb', str(args.image_kb),
+                   '--seed', f'bench-gallery={args.gallery_history}',
+                   '--seed', f'bench-delete={args.delete_images}']
+        # Own session, so stop() also takes down the derivative process pool
+        self.process = subprocess.Popen(command, cwd=BACKEND_DIR, env=env, start_new_session=True)
+
+        deadline = time.monotonic() + 120
+        while time.monotonic() < deadline:
+            try:
+                requests.get(f"{self.url}/metrics", timeout=1)
+                return
+            except requests.ConnectionError:
+                if self.process.poll() is not None:
+                    sys.exit("server exited during startup")
+                time.sleep(0.2)
+        sys.exit("server did not start")
+
+    def _status(self, field):
+        try:
+            with open(f"/proc/{self.process.pid}/status") as f:
+                for line in f:
+                    if line.startswith(field + ':'):
+                        return int(line.split()[1]) / 1024
+        except OSError:
+            pass
+        return None
+
+    def reset_peak_rss(self):
+        # Linux: writing 5 to clear_refs resets VmHWM
+        try:
+            with open(f"/proc/{self.process.pid}/clear_refs", 'w') as f:
+                f.write('5')
+        except OSError:
+            pass
+
+    def peak_rss_mb(self):
+        return self._status('VmHWM')
+
+    def stop(self):
+        os.killpg(self.process.pid, signal.SIGTERM)
+        self.process.wait(timeout=30)
+
+
+class Recorder:
+    """Thread-safe latency and error collection for one scenario"""
+
+    def __init__(self):
+        self.latencies = []
+        self.errors = {}
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    @property
+    def session(self):
+        if not hasattr(self.local, 'session'):
+            self.local.session = requests.Session()
+        return self.local.session
+
+    def request(self, method, url, expect=(200,), **kwargs):
+        start = time.perf_counter()
+        try:
+            response = self.session.request(method, url, timeout=120, **kwargs)
+        except requests.RequestException as e:
+            self.error(type(e).__name__)
+            return None
+        elapsed = time.perf_counter() - start
+        with self.lock:
+            self.latencies.append(elapsed)
+        if response.status_code not in expect:
+            self.error(f"HTTP {response.status_code}")
+            return None
+        return response
+
+    def error(self, key):
+        with self.lock:
+            self.errors[key] = self.errors.get(key, 0) + 1
+
+
+def login(server, name):
+    response = requests.post(f"{server.url}/auth/google-login", json={'token': name}, timeout=60)
+    response.raise_for_status()
+    return {'Authorization': f"Bearer {response.json()['token']}"}
+
+
+def login_storm(server, args, rec):
+    def one(i):
+        rec.request('POST', f"{server.url}/auth/google-login", json={'token': f'bench-user-{i}'})
+
+    with ThreadPoolExecutor(args.concurrency) as pool:
+        # First round creates the users, the second logs them back in
+        for _ in range(2):
+            list(pool.map(one, range(args.login_users)))
+    return {}
+
+
+def login_retry(server, args, rec):
+    def one(i):
+        rec.request('POST', f"{server.url}/auth/google-login", json={'token': f'bench-retry-{i % args.retry_users}'})
+
+    calls_before = server.stub.userinfo_calls
+    with ThreadPoolExecutor(args.concurrency) as pool:
+        list(pool.map(one, range(args.retry_logins)))
+    return {'userinfo_calls': server.stub.userinfo_calls - calls_before}
+
+
+def password_login(server, args, rec):
+    users = [f'bench-password-{i}' for i in range(args.password_users)]
+    with ThreadPoolExecutor(args.concurrency) as pool:
+        list(pool.map(lambda name: requests.post(f"{server.url}/auth/register", timeout=120, json={
+            'username': name, 'email': f'{name}@bench.local', 'password': 'correct horse'}), users))
+
+    headers = login(server, 'bench-gallery')
+    probe = Recorder()
+    stop = threading.Event()
+
+    def run_probe():
+        while not stop.is_set():
+            probe.request('GET', f"{server.url}/image/user-images", headers=headers, params={'limit': 10})
+            time.sleep(0.05)
+
+    def one(i):
+        rec.request('POST', f"{server.url}/auth/login",
+                    json={'email': f'{users[i % len(users)]}@bench.local', 'password': 'correct horse'})
+
+    probe_thread = threading.Thread(target=run_probe)
+    probe_thread.start()
+    try:
+        with ThreadPoolExecutor(args.concurrency) as pool:
+            list(pool.map(one, range(args.password_logins)))
+    finally:
+        stop.set()
+        probe_thread.join()
+    return {
+        'probe_requests': len(probe.latencies),
+        'probe_p50_ms': _ms(percentile(probe.latencies, 50)),
+        'probe_p95_ms': _ms(percentile(probe.latencies, 95)),
+    }
+
+
+def generate_burst(server, args, rec):
+    tokens = [login(server, f'bench-gen-{i}') for i in range(args.concurrency)]
+    start = time.perf_counter()
+    settle_times = []
+    settle_lock = threading.Lock()
+
+    def one(i):
+        headers = tokens[i % len(tokens)]
+        start = time.perf_counter()
+        response = rec.request('POST', f"{server.url}/image/generate", expect=(202,),
+                               json={'customPrompt': f'bench prompt {i}'}, headers=headers)
+        if response is None:
+            return
+        job_url = f"{server.url}/image/jobs/{response.json()['job']['id']}"
+        while True:
+            job = rec.session.get(job_url, headers=headers, timeout=60).json()
+            if job['status'] in ('done', 'failed'):
+                break
+            time.sleep(0.1)
+        if job['status'] == 'failed':
+            rec.error('job failed')
+            return
+        with settle_lock:
+            settle_times.append(time.perf_counter() - start)
+
+    with ThreadPoolExecutor(args.concurrency) as pool:
+        list(pool.map(one, range(args.generate_jobs)))
+    return {
+        'jobs_per_second': round(len(settle_times) / (time.perf_counter() - start), 2),
+        'job_p50_ms': _ms(percentile(settle_times, 50)),
+        'job_p95_ms': _ms(percentile(settle_times, 95)),
+    }
+
+
+def gallery(server, args, rec):
+    headers = login(server, 'bench-gallery')
+
+    def browse(_):
+        cursor = None
+        for _ in range(args.gallery_pages):
+            params = {'cursor': cursor} if cursor else {}
+            response = rec.request('GET', f"{server.url}/image/user-images", headers=headers, params=params)
+            if response is None:
+                return
+            cursor = response.json()['next_cursor']
+            if not cursor:
+                return
+
+    with ThreadPoolExecutor(args.concurrency) as pool:
+        list(pool.map(browse, range(args.concurrency)))
+    return {}
+
+
+def bulk_delete(server, args, rec):
+    headers = login(server, 'bench-delete')
+    ids = []
+    cursor = None
+    while True:
+        params = {'limit': 200, **({'cursor': cursor} if cursor else {})}
+        page = requests.get(f"{server.url}/image/user-images", headers=headers, params=params, timeout=60).json()
+        ids += [image['id'] for image in page['images']]
+        cursor = page['next_cursor']
+        if not cursor:
+            break
+
+    if args.delete_batch <= 1:
+        # One request per image, the pre-bulk baseline
+        with ThreadPoolExecutor(args.concurrency) as pool:
+            list(pool.map(lambda image_id: rec.request('DELETE', f"{server.url}/image/api/images/{image_id}",
+                                                       headers=headers), ids))
+    else:
+        chunks = [ids[i:i + args.delete_batch] for i in range(0, len(ids), args.delete_batch)]
+        with ThreadPoolExecutor(args.concurrency) as pool:
+            list(pool.map(lambda chunk: rec.request('DELETE', f"{server.url}/image/api/images",
+                                                    headers=headers, json={'ids': chunk}), chunks))
+    return {'deleted': len(ids)}
+
+
+def _ms(seconds):
+    return round(seconds * 1000, 2) if seconds is not None else None
+
+
+def run_scenario(name, server, args):
+    rec = Recorder()
+    server.reset_peak_rss()
+    start = time.perf_counter()
+    extra = globals()[name](server, args, rec)
+    elapsed = time.perf_counter() - start
+    return {
+        'requests': len(rec.latencies),
+        'errors': rec.errors,
+        'seconds': round(elapsed, 3),
+        'throughput_rps': round(len(rec.latencies) / elapsed, 2) if elapsed else None,
+        'p50_ms': _ms(percentile(rec.latencies, 50)),
+        'p95_ms': _ms(percentile(rec.latencies, 95)),
+        'p99_ms': _ms(percentile(rec.latencies, 99)),
+        'peak_rss_mb': server.peak_rss_mb(),
+        **extra,
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Return regression messages: p95 up or throughput down by more than tolerance"""
+    problems = []
+    for name, current in results['scenarios'].items():
+        before = baseline.get('scenarios', {}).get(name)
+        if not before:
+            continue
+        if before.get('p95_ms') and current['p95_ms'] and current['p95_ms'] > before['p95_ms'] * (1 + tolerance):
+            problems.append(f"{name}: p95 {before['p95_ms']}ms -> {current['p95_ms']}ms")
+        if before.get('throughput_rps') and current['throughput_rps'] and \
+                current['throughput_rps'] < before['throughput_rps'] * (1 - tolerance):
+            problems.append(f"{name}: throughput {before['throughput_rps']} -> {current['throughput_rps']} req/s")
+        if sum(current['errors'].values()) > sum(before['errors'].values()):
+            problems.append(f"{name}: errors {before['errors']} -> {current['errors']}")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scenario', action='append', choices=SCENARIOS, help='default: all')
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--server-threads', type=int, default=16)
+    parser.add_argument('--replicate-latency', type=float, default=2.0)
+    parser.add_argument('--cdn-latency', type=float, default=0.2)
+    parser.add_argument('--google-latency', type=float, default=0.1)
+    parser.add_argument('--image-kb', type=int, default=1024)
+    parser.add_argument('--login-users', type=int, default=200)
+    parser.add_argument('--retry-users', type=int, default=10)
+    parser.add_argument('--retry-logins', type=int, default=400)
+    parser.add_argument('--password-users', type=int, default=20)
+    parser.add_argument('--password-logins', type=int, default=200)
+    parser.add_argument('--generate-jobs', type=int, default=32)
+    parser.add_argument('--gallery-history', type=int, default=20000)
+    parser.add_argument('--gallery-pages', type=int, default=20)
+    parser.add_argument('--delete-images', type=int, default=500)
+    parser.add_argument('--delete-batch', type=int, default=100, help='ids per bulk DELETE; 1 deletes one at a time')
+    parser.add_argument('--output', help='write results JSON here')
+    parser.add_argument('--baseline', help='results JSON to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed relative regression')
+    args = parser.parse_args()
+
+    stub = start_stub_server(args.cdn_latency, args.google_latency)
+    workdir = tempfile.mkdtemp(prefix='bench-')
+    server = Server(args, stub.url, workdir)
+    server.stub = stub
+    results = {'config': vars(args), 'scenarios': {}}
+    try:
+        for name in args.scenario or SCENARIOS:
+            results['scenarios'][name] = run_scenario(name, server, args)
+            print(f"{name}: {json.dumps(results['scenarios'][name])}", file=sys.stderr)
+    finally:
+        server.stop()
+        stub.shutdown()
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            problems = compare(results, json.load(f), args.tolerance)
+        for problem in problems:
+            print(f"REGRESSION {problem}", file=sys.stderr)
+        sys.exit(1 if problems else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+# bench/serve.py
+"""Run the app under waitress with the Replicate stub installed.
+
+Started by bench/run.py; configuration comes from the environment like in
+production, plus the stub options below.
+"""
+
+import argparse
+import os
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def seed_history(app, name, count):
+    """Give user <name>@bench.local count Image rows, inserted in bulk"""
+    from datetime import datetime, timedelta
+    from models import db, Image, User
+
+    with app.app_context():
+        user = User(username=name, email=f'{name}@bench.local', password_hash='!')
+        db.session.add(user)
+        db.session.commit()
+        start = datetime.utcnow() - timedelta(seconds=count)
+        db.session.execute(Image.__table__.insert(), [
+            {'prompt': f'seeded {i}', 'image_path': f'images/seed/{i}.png',
+             'generated_at': start + timedelta(seconds=i), 'user_id': user.id}
+            for i in range(count)
+        ])
+        db.session.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--port', type=int, required=True)
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--stub-url', required=True)
+    parser.add_argument('--replicate-latency', type=float, default=2.0)
+    parser.add_argument('--image-kb', type=int, default=1024)
+    parser.add_argument('--seed', action='append', default=[], metavar='NAME=COUNT',
+                        help='seed a user with COUNT images (repeatable)')
+    args = parser.parse_args()
+
+    sys.path.insert(0, BACKEND_DIR)
+    from bench.stubs import install_replicate_stub
+    install_replicate_stub(args.stub_url, args.replicate_latency, args.image_kb)
+
+    from waitress import serve
+    from app import app
+    from models import db
+
+    with app.app_context():
+        db.create_all()
+    for spec in args.seed:
+        name, count = spec.split('=')
+        seed_history(app, name, int(count))
+
+    serve(app, host='127.0.0.1', port=args.port, threads=args.threads, _quiet=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+# bench/startup.py
+"""Measure cold start: wall time to boot the app and where imports spend it.
+
+Each run is a fresh interpreter under ``python -X importtime`` executing
+--code (by default what a WSGI worker does at boot). The report gives the
+median wall time and the packages with the largest self import time,
+summed per top-level package and taken as the median across runs.
+Configuration comes from the environment, as in production; point
+SQLALCHEMY_DATABASE_URI at a local database so connects don't dominate.
+
+    cd backend && python bench/startup.py --runs 7
+    cd backend && python bench/startup.py --code "from app import create_app; create_app()"
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+from collections import defaultdict
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_CODE = 'from wsgi import app'
+
+
+def parse_importtime(stderr):
+    """{top-level package: self microseconds} from -X importtime output"""
+    totals = defaultdict(int)
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, _cumulative, name = line[len('import time:'):].split('|')
+        totals[name.strip().split('.')[0]] += int(self_us)
+    return totals
+
+
+def run_once(code):
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code],
+                            cwd=BACKEND_DIR, capture_output=True, text=True)
+    elapsed = time.perf_counter() - start
+    if result.returncode != 0:
+        sys.exit(f"Startup failed:\n{result.stderr[-2000:]}")
+    return elapsed, parse_importtime(result.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--code', default=DEFAULT_CODE, help='Python executed in each fresh interpreter.')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=15, help='Packages listed in the report.')
+    args = parser.parse_args()
+
+    run_once(args.code)  # warm the bytecode and filesystem caches
+    walls, imports = [], defaultdict(list)
+    for _ in range(args.runs):
+        elapsed, totals = run_once(args.code)
+        walls.append(elapsed)
+        for package, self_us in totals.items():
+            imports[package].append(self_us)
+
+    medians = {package: statistics.median(samples + [0] * (args.runs - len(samples)))
+               for package, samples in imports.items()}
+    print(f"code: {args.code}")
+    print(f"wall: median {statistics.median(walls) * 1000:.0f} ms, "
+          f"min {min(walls) * 1000:.0f} ms over {args.runs} runs")
+    print(f"imports: {sum(medians.values()) / 1000:.0f} ms self time across {len(medians)} packages")
+    print(f"{'package':<28}{'self ms':>10}")
+    for package, self_us in sorted(medians.items(), key=lambda item: item[1], reverse=True)[:args.top]:
+        print(f"{package:<28}{self_us / 1000:>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+# bench/stubs.py
+"""Local stand-ins for the services the app calls: an image CDN, Google's
+userinfo endpoint and ``replicate.run``."""
+
+import io
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+_images = {}
+_images_lock = threading.Lock()
+
+
+def stub_png(kb):
+    """A PNG of roughly kb kilobytes; noise does not compress, so size tracks pixels"""
+    with _images_lock:
+        if kb not in _images:
+            from PIL import Image
+            side = max(8, int((kb * 1024 / 3) ** 0.5))
+            buffer = io.BytesIO()
+            Image.frombytes('RGB', (side, side), os.urandom(side * side * 3)).save(buffer, 'PNG')
+            _images[kb] = buffer.getvalue()
+        return _images[kb]
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """GET /images/<kb>.png          image CDN
+    GET /oauth2/v3/userinfo      Google userinfo; access_token <name> maps to <name>@bench.local
+    """
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path.startswith('/images/'):
+            time.sleep(self.server.cdn_latency)
+            kb = int(os.path.splitext(os.path.basename(url.path))[0])
+            self._send(200, stub_png(kb), 'image/png')
+        elif url.path == '/oauth2/v3/userinfo':
+            with self.server.lock:
+                self.server.userinfo_calls += 1
+            time.sleep(self.server.google_latency)
+            token = parse_qs(url.query).get('access_token', [''])[0]
+            if not token:
+                self._send(401, b'{"error": "invalid_token"}', 'application/json')
+            else:
+                self._send(200, json.dumps({'email': f'{token}@bench.local'}).encode(), 'application/json')
+        else:
+            self._send(404, b'', 'text/plain')
+
+    def _send(self, status, body, content_type):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_stub_server(cdn_latency=0.2, google_latency=0.1, port=0):
+    """Serve the stubs from a daemon thread; returns the server (see .url)"""
+    ThreadingHTTPServer.request_queue_size = 1024
+    server = ThreadingHTTPServer(('127.0.0.1', port), StubHandler)
+    server.daemon_threads = True
+    server.cdn_latency = cdn_latency
+    server.google_latency = google_latency
+    server.userinfo_calls = 0
+    server.lock = threading.Lock()
+    server.url = f"http://127.0.0.1:{server.server_port}"
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def install_replicate_stub(stub_url, latency=2.0, image_kb=1024):
+    """Replace replicate.run/async_run with a delay that returns a stub CDN URL"""
+    import asyncio
+    import replicate
+
+    image_url = f"{stub_url}/images/{image_kb}.png"
+
+    def run(model, input=None, **kwargs):
+        time.sleep(latency)
+        return [image_url]
+
+    async def async_run(model, input=None, **kwargs):
+        await asyncio.sleep(latency)
+        return [image_url]
+
+    replicate.run = run
+    replicate.async_run = async_run
@@ -1,16 +1,178 @@
 # config.py
 
+import json
 import os
-from dotenv import load_dotenv
 
 basedir = os.path.abspath(os.path.dirname(__file__))
-load_dotenv(os.path.join(basedir, '.env'))
+# Deployed instances get their environment from the platform; only pay for
+# python-dotenv when there is a .env file to read
+if os.path.exists(os.path.join(basedir, '.env')):
+    from dotenv import load_dotenv
+    load_dotenv(os.path.join(basedir, '.env'))
 
 class Config:
     SECRET_KEY = os.getenv('SECRET_KEY', 'default_secret_key') # Default for local development
     SQLALCHEMY_DATABASE_URI = os.getenv('SQLALCHEMY_DATABASE_URI', 'sqlite:///app.db')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+    # Engine profile (see utils/db.py); pool sizes are per process
+    DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 10))
+    DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', 10))
+    DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', 10))  # seconds to wait for a free connection
+    DB_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', 1800))  # replace connections older than this
+    DB_POOL_PRE_PING = os.getenv('DB_POOL_PRE_PING', 'true').lower() == 'true'
+    SQLITE_BUSY_TIMEOUT_MS = int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', 15000))
+    SQLITE_SYNCHRONOUS = os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL')  # NORMAL is durable enough under WAL
     REPLICATE_API_TOKEN = os.getenv('REPLICATE_API_TOKEN')
     FLASK_ENV = 'production'
     STATIC_FOLDER = '../frontend/build'
     STATIC_URL_PATH = '/'
+    # Blueprints to register (auth, image, sample); a worker serving part of
+    # the API skips importing the rest
+    BLUEPRINTS = [name.strip() for name in os.getenv('BLUEPRINTS', 'auth,image,sample').split(',') if name.strip()]
+
+    # Background generation jobs
+    GENERATION_WORKERS = int(os.getenv('GENERATION_WORKERS', 4))
+    GENERATION_QUEUE_SIZE = int(os.getenv('GENERATION_QUEUE_SIZE', 32))
+    GENERATION_BACKEND = os.getenv('GENERATION_BACKEND', 'replicate')  # 'replicate' or 'fake'
+    FAKE_GENERATION_LATENCY = float(os.getenv('FAKE_GENERATION_LATENCY', 2.0))
+    FAKE_GENERATION_URL = os.getenv('FAKE_GENERATION_URL')  # fake backend downloads from here if set
+    # Await model runs and downloads on an event loop instead of worker threads
+    GENERATION_ASYNC = os.getenv('GENERATION_ASYNC', 'false').lower() == 'true'
+    GENERATION_ASYNC_LIMIT = int(os.getenv('GENERATION_ASYNC_LIMIT', 256))  # in-flight async jobs per process
+    # Jobs queued or running longer than this at startup were lost in a restart; they are marked failed
+    GENERATION_JOB_TIMEOUT = float(os.getenv('GENERATION_JOB_TIMEOUT', 900))
+
+    # Model providers (see utils/providers.py): a JSON list of
+    # {"name", "type": "replicate"|"fake", ...}; GENERATION_BACKEND picks one when unset
+    GENERATION_PROVIDERS = json.loads(os.getenv('GENERATION_PROVIDERS', 'null'))
+    GENERATION_ROUTING = os.getenv('GENERATION_ROUTING', 'ordered')  # 'ordered' or 'latency'
+    GENERATION_FALLBACK = os.getenv('GENERATION_FALLBACK', 'true').lower() == 'true'
+    GENERATION_HEDGE = os.getenv('GENERATION_HEDGE', 'false').lower() == 'true'
+    # Seconds before the hedge starts; unset uses the running provider's recent p95
+    GENERATION_HEDGE_DELAY = float(os.environ['GENERATION_HEDGE_DELAY']) if os.getenv('GENERATION_HEDGE_DELAY') else None
+    GENERATION_HEDGE_MIN_SAMPLES = int(os.getenv('GENERATION_HEDGE_MIN_SAMPLES', 20))  # runs needed for a p95
+    GENERATION_STATS_WINDOW = int(os.getenv('GENERATION_STATS_WINDOW', 100))  # recent runs kept per provider
+    # A provider run taking longer counts as an error (then fallback applies); a spec's "timeout" overrides it
+    GENERATION_PROVIDER_TIMEOUT = float(os.getenv('GENERATION_PROVIDER_TIMEOUT', 120))
+
+    GOOGLE_USERINFO_URL = os.getenv('GOOGLE_USERINFO_URL', 'https://www.googleapis.com/oauth2/v3/userinfo')
+    # /auth/google-login token lookups (see utils/google.py), cached per process
+    GOOGLE_TOKEN_CACHE_TTL = int(os.getenv('GOOGLE_TOKEN_CACHE_TTL', 300))  # never past the token's expiry; 0 disables
+    GOOGLE_TOKEN_NEGATIVE_TTL = int(os.getenv('GOOGLE_TOKEN_NEGATIVE_TTL', 10))  # remember rejected tokens this long
+    GOOGLE_TOKEN_CACHE_MAX_ENTRIES = int(os.getenv('GOOGLE_TOKEN_CACHE_MAX_ENTRIES', 10000))
+
+    # Outbound HTTP (image downloads, Google userinfo)
+    HTTP_POOL_CONNECTIONS = int(os.getenv('HTTP_POOL_CONNECTIONS', 10))  # hosts kept in the pool
+    HTTP_POOL_MAXSIZE = int(os.getenv('HTTP_POOL_MAXSIZE', 10))  # connections per host
+    HTTP_CONNECT_TIMEOUT = float(os.getenv('HTTP_CONNECT_TIMEOUT', 5))
+    HTTP_READ_TIMEOUT = float(os.getenv('HTTP_READ_TIMEOUT', 30))
+    HTTP_RETRIES = int(os.getenv('HTTP_RETRIES', 3))
+    HTTP_BACKOFF_FACTOR = float(os.getenv('HTTP_BACKOFF_FACTOR', 0.5))
+    DOWNLOAD_CHUNK_SIZE = int(os.getenv('DOWNLOAD_CHUNK_SIZE', 64 * 1024))
+
+    # Prompt-level result cache (opt-in)
+    PROMPT_CACHE_ENABLED = os.getenv('PROMPT_CACHE_ENABLED', 'false').lower() == 'true'
+    PROMPT_CACHE_BACKEND = os.getenv('PROMPT_CACHE_BACKEND', 'memory')  # 'memory' or 'sqlite'
+    PROMPT_CACHE_PATH = os.getenv('PROMPT_CACHE_PATH')  # defaults to instance/prompt_cache.db
+    PROMPT_CACHE_TTL = int(os.getenv('PROMPT_CACHE_TTL', 7 * 24 * 3600))
+    PROMPT_CACHE_MAX_ENTRIES = int(os.getenv('PROMPT_CACHE_MAX_ENTRIES', 10000))
+    # A thread waits this long for another caller's run of the same prompt, then runs its own
+    PROMPT_CACHE_FLIGHT_WAIT = float(os.getenv('PROMPT_CACHE_FLIGHT_WAIT', 300))
+
+    # /image/user-images pagination
+    USER_IMAGES_PAGE_SIZE = int(os.getenv('USER_IMAGES_PAGE_SIZE', 50))
+    USER_IMAGES_MAX_PAGE_SIZE = int(os.getenv('USER_IMAGES_MAX_PAGE_SIZE', 200))
+    SEARCH_PAGE_SIZE = int(os.getenv('SEARCH_PAGE_SIZE', 20))  # /image/search results; capped like pages
+
+    # Thumbnails and format variants built after each generation
+    DERIVATIVES_ENABLED = os.getenv('DERIVATIVES_ENABLED', 'true').lower() == 'true'
+    DERIVATIVE_WIDTHS = [int(w) for w in os.getenv('DERIVATIVE_WIDTHS', '256,512,1024').split(',')]
+    DERIVATIVE_FORMATS = os.getenv('DERIVATIVE_FORMATS', 'webp,png').split(',')  # webp, avif, png, jpeg
+    DERIVATIVE_WORKERS = int(os.getenv('DERIVATIVE_WORKERS', 2))
+
+    # Generated images are stored under images/ab/cd/<sha256>.<ext> keys
+    STORAGE_BACKEND = os.getenv('STORAGE_BACKEND', 'local')  # 'local' or 's3'
+    IMAGE_STORAGE_ROOT = os.getenv('IMAGE_STORAGE_ROOT', os.path.join(basedir, 'static'))
+    # Local working directory for downloads and derivatives before they are stored
+    IMAGE_SCRATCH_DIR = os.getenv('IMAGE_SCRATCH_DIR', os.path.join(basedir, 'instance', 'scratch'))
+    S3_BUCKET = os.getenv('S3_BUCKET')
+    S3_PREFIX = os.getenv('S3_PREFIX', '')
+    S3_ENDPOINT_URL = os.getenv('S3_ENDPOINT_URL')  # e.g. a MinIO or moto server
+    S3_REGION = os.getenv('S3_REGION')
+    S3_PUBLIC_URL = os.getenv('S3_PUBLIC_URL')  # CDN/public bucket base; presigned URLs when unset
+    S3_PRESIGN_EXPIRES = int(os.getenv('S3_PRESIGN_EXPIRES', 3600))
+    S3_MULTIPART_THRESHOLD = int(os.getenv('S3_MULTIPART_THRESHOLD', 8 * 1024 * 1024))
+    S3_MULTIPART_CHUNKSIZE = int(os.getenv('S3_MULTIPART_CHUNKSIZE', 8 * 1024 * 1024))
+
+    # DELETE /image/api/images and orphaned-file collection (flask storage-gc)
+    BULK_DELETE_MAX_IDS = int(os.getenv('BULK_DELETE_MAX_IDS', 500))
+    STORAGE_GC_INTERVAL = int(os.getenv('STORAGE_GC_INTERVAL', 0))  # seconds between in-process runs; 0 = cron only
+    STORAGE_GC_GRACE = int(os.getenv('STORAGE_GC_GRACE', 3600))  # files younger than this are never collected
+    STORAGE_GC_BATCH_SIZE = int(os.getenv('STORAGE_GC_BATCH_SIZE', 500))
+
+    # GET /image/export and POST /image/import (see utils/archive.py)
+    EXPORT_BATCH_SIZE = int(os.getenv('EXPORT_BATCH_SIZE', 500))  # rows read per query while streaming
+    IMPORT_BATCH_SIZE = int(os.getenv('IMPORT_BATCH_SIZE', 200))  # rows inserted per commit
+    IMPORT_MAX_BYTES = int(os.getenv('IMPORT_MAX_BYTES', 512 * 1024 * 1024))  # upload size; spooled to disk
+    IMPORT_MAX_IMAGES = int(os.getenv('IMPORT_MAX_IMAGES', 10000))
+    IMPORT_MAX_IMAGE_BYTES = int(os.getenv('IMPORT_MAX_IMAGE_BYTES', 50 * 1024 * 1024))
+
+    # Generation ledger and its rollups (see utils/ledger.py); GET /image/stats
+    # and /api/generation-stats read the rollups only
+    LEDGER_ENABLED = os.getenv('LEDGER_ENABLED', 'true').lower() == 'true'
+    LEDGER_BATCH_SIZE = int(os.getenv('LEDGER_BATCH_SIZE', 100))  # entries per insert
+    LEDGER_FLUSH_INTERVAL = float(os.getenv('LEDGER_FLUSH_INTERVAL', 2.0))  # seconds an entry may wait for a batch
+    LEDGER_QUEUE_SIZE = int(os.getenv('LEDGER_QUEUE_SIZE', 10000))  # entries beyond this are dropped
+    # Price of one model run by model id; runs of unlisted models have no cost
+    GENERATION_RUN_COSTS = json.loads(os.getenv('GENERATION_RUN_COSTS', 'null')) or {
+        'black-forest-labs/flux-schnell': 0.003,
+    }
+    STATS_MAX_BUCKETS = int(os.getenv('STATS_MAX_BUCKETS', 744))  # hours or days per report
+    STATS_TOP_USERS = int(os.getenv('STATS_TOP_USERS', 20))
+    ADMIN_EMAILS = {email.strip().lower() for email in os.getenv('ADMIN_EMAILS', '').split(',') if email.strip()}
+
+    # HTTP caching for served files
+    INDEX_MAX_AGE = int(os.getenv('INDEX_MAX_AGE', 60))
+    IMAGE_SENDFILE_MODE = os.getenv('IMAGE_SENDFILE_MODE')  # None, 'x-accel' or 'x-sendfile'
+    IMAGE_ACCEL_PREFIX = os.getenv('IMAGE_ACCEL_PREFIX', '/protected-images')  # nginx internal location
+
+    # POST /image/generate/batch
+    BATCH_MAX_ITEMS = int(os.getenv('BATCH_MAX_ITEMS', 8))
+    BATCH_CONCURRENCY = int(os.getenv('BATCH_CONCURRENCY', 4))  # model runs in flight per batch
+
+    # Per-user generation quotas; tiers map to {per_minute, burst, concurrent}
+    QUOTAS_ENABLED = os.getenv('QUOTAS_ENABLED', 'true').lower() == 'true'
+    QUOTA_BACKEND = os.getenv('QUOTA_BACKEND', 'memory')  # 'memory' (single process) or 'redis'
+    QUOTA_REDIS_URL = os.getenv('QUOTA_REDIS_URL', 'redis://localhost:6379/0')
+    QUOTA_SLOT_TTL = int(os.getenv('QUOTA_SLOT_TTL', 900))  # in-flight slots held longer are dropped
+    QUOTA_TIERS = json.loads(os.getenv('QUOTA_TIERS', 'null')) or {
+        'free': {'per_minute': 6, 'burst': 8, 'concurrent': 2},
+        'pro': {'per_minute': 60, 'burst': 20, 'concurrent': 8},
+    }
+
+    # Logging and metrics; /metrics aggregates gunicorn workers when
+    # PROMETHEUS_MULTIPROC_DIR is set
+    LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+    ACCESS_LOG_SAMPLE_RATE = float(os.getenv('ACCESS_LOG_SAMPLE_RATE', 0.01))  # errors and slow requests always logged
+    ACCESS_LOG_SLOW_SECONDS = float(os.getenv('ACCESS_LOG_SLOW_SECONDS', 1.0))
+    # Scrapers send "Authorization: Bearer <METRICS_TOKEN>"; /metrics is not served while it is unset
+    METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+
+    # Password hashing (see utils/passwords.py); older hashes are upgraded on login
+    PASSWORD_HASHER = os.getenv('PASSWORD_HASHER', 'argon2')  # 'argon2' (argon2id) or 'werkzeug'
+    ARGON2_TIME_COST = int(os.getenv('ARGON2_TIME_COST', 2))
+    ARGON2_MEMORY_COST = int(os.getenv('ARGON2_MEMORY_COST', 19456))  # KiB
+    ARGON2_PARALLELISM = int(os.getenv('ARGON2_PARALLELISM', 1))
+    PASSWORD_HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS', 2))  # hashing processes; 0 hashes inline
+    PASSWORD_HASH_QUEUE = int(os.getenv('PASSWORD_HASH_QUEUE', 32))  # hashes allowed to wait for a worker
+    PASSWORD_HASH_WAIT_TIMEOUT = float(os.getenv('PASSWORD_HASH_WAIT_TIMEOUT', 5))  # then 503
+
+    # JWT user lookups
+    USER_CACHE_TTL = int(os.getenv('USER_CACHE_TTL', 60))
+    USER_CACHE_MAX_ENTRIES = int(os.getenv('USER_CACHE_MAX_ENTRIES', 10000))
+
+    # GET /image/jobs/<id>/events (Server-Sent Events)
+    JOB_EVENTS_HEARTBEAT = float(os.getenv('JOB_EVENTS_HEARTBEAT', 15))  # keepalive and DB re-check interval
+    JOB_EVENTS_TIMEOUT = float(os.getenv('JOB_EVENTS_TIMEOUT', 600))  # close streams for jobs that never settle
+    JOB_EVENTS_TOKEN_TTL = int(os.getenv('JOB_EVENTS_TOKEN_TTL', 60))  # seconds a job's events_url can be opened
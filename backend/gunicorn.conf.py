@@ -0,0 +1,31 @@
+# gunicorn.conf.py
+#
+# gunicorn wsgi:app
+#
+# Job event streams (/image/jobs/<id>/events) stay open for up to
+# JOB_EVENTS_TIMEOUT seconds. A sync or gthread worker holds a thread
+# for each one, so a handful of watchers would take every worker. The
+# gevent worker monkey-patches the stdlib before the app is imported:
+# the EventHub queues, the utils/aio loop thread and the waits on the
+# spawn process pools all become cooperative, and an open stream costs
+# one greenlet.
+
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+workers = int(os.getenv('WEB_CONCURRENCY', 2))
+worker_class = 'gevent'
+# Concurrent requests (open streams included) per worker
+worker_connections = int(os.getenv('WORKER_CONNECTIONS', 1000))
+# Streams send a heartbeat every JOB_EVENTS_HEARTBEAT seconds; this only
+# bounds how long a silent worker may hang before it is restarted
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 60))
+graceful_timeout = 30
+
+
+def child_exit(server, worker):
+    # With PROMETHEUS_MULTIPROC_DIR each worker writes its own metric files;
+    # a dead worker's live gauges must stop counting towards /metrics
+    if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,26 @@
+"""add (user_id, generated_at desc, id desc) index on images
+
+Revision ID: 3f8d2b7a91c4
+Revises: 5e3a8c1f7b24
+Create Date: 2026-10-18 10:41:07.518233
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f8d2b7a91c4'
+down_revision = '5e3a8c1f7b24'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('images', schema=None) as batch_op:
+        batch_op.create_index('ix_images_user_generated_at_id', ['user_id', sa.text('generated_at DESC'), sa.text('id DESC')], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('images', schema=None) as batch_op:
+        batch_op.drop_index('ix_images_user_generated_at_id')
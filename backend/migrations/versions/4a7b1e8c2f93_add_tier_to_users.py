@@ -0,0 +1,26 @@
+"""add tier column to users
+
+Revision ID: 4a7b1e8c2f93
+Revises: 9d4c7e2f5a10
+Create Date: 2026-10-18 15:02:41.318204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4a7b1e8c2f93'
+down_revision = '9d4c7e2f5a10'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('tier', sa.String(length=20), server_default='free', nullable=False))
+
+
+def downgrade():
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.drop_column('tier')
@@ -0,0 +1,55 @@
+"""restore images.image_path and generated_at
+
+Revision ID: 5e3a8c1f7b24
+Revises: 7c1e9a4b2d6f
+Create Date: 2026-10-18 10:22:18.940365
+
+0abf76e31045 replaced image_path and generated_at with url and a few prompt
+fields the Image model never used. This puts the model's columns back,
+carrying url and created_at over, so the rest of the chain applies.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5e3a8c1f7b24'
+down_revision = '7c1e9a4b2d6f'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('images', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('image_path', sa.String(length=500), nullable=True))
+        batch_op.add_column(sa.Column('generated_at', sa.DateTime(), nullable=True))
+
+    op.execute("UPDATE images SET image_path = url, generated_at = created_at")
+
+    with op.batch_alter_table('images', schema=None) as batch_op:
+        batch_op.alter_column('image_path',
+               existing_type=sa.String(length=500),
+               nullable=False)
+        batch_op.drop_column('created_at')
+        batch_op.drop_column('lighting')
+        batch_op.drop_column('mood')
+        batch_op.drop_column('style')
+        batch_op.drop_column('url')
+
+
+def downgrade():
+    with op.batch_alter_table('images', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('url', sa.String(length=500), nullable=True))
+        batch_op.add_column(sa.Column('style', sa.String(length=100), nullable=True))
+        batch_op.add_column(sa.Column('mood', sa.String(length=100), nullable=True))
+        batch_op.add_column(sa.Column('lighting', sa.String(length=100), nullable=True))
+        batch_op.add_column(sa.Column('created_at', sa.DateTime(), nullable=True))
+
+    op.execute("UPDATE images SET url = image_path, created_at = generated_at")
+
+    with op.batch_alter_table('images', schema=None) as batch_op:
+        batch_op.alter_column('url',
+               existing_type=sa.String(length=500),
+               nullable=False)
+        batch_op.drop_column('generated_at')
+        batch_op.drop_column('image_path')
@@ -0,0 +1,42 @@
+"""add generation_jobs table
+
+Revision ID: 7c1e9a4b2d6f
+Revises: 0abf76e31045
+Create Date: 2026-10-18 09:12:31.402118
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7c1e9a4b2d6f'
+down_revision = '0abf76e31045'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('generation_jobs',
+    sa.Column('id', sa.String(length=32), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('status', sa.String(length=20), nullable=False),
+    sa.Column('payload', sa.Text(), nullable=False),
+    sa.Column('image_id', sa.Integer(), nullable=True),
+    sa.Column('error', sa.Text(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('started_at', sa.DateTime(), nullable=True),
+    sa.Column('finished_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['image_id'], ['images.id'], ondelete='SET NULL'),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('generation_jobs', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_generation_jobs_user_id'), ['user_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('generation_jobs', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_generation_jobs_user_id'))
+
+    op.drop_table('generation_jobs')
@@ -0,0 +1,26 @@
+"""add result column to generation_jobs
+
+Revision ID: 9d4c7e2f5a10
+Revises: e2a9f6c1b3d8
+Create Date: 2026-10-18 14:20:13.662091
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9d4c7e2f5a10'
+down_revision = 'e2a9f6c1b3d8'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('generation_jobs', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('result', sa.Text(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('generation_jobs', schema=None) as batch_op:
+        batch_op.drop_column('result')
@@ -0,0 +1,26 @@
+"""add variants column to images
+
+Revision ID: b5e04c3d8a17
+Revises: 3f8d2b7a91c4
+Create Date: 2026-10-18 11:26:52.804419
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b5e04c3d8a17'
+down_revision = '3f8d2b7a91c4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('images', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('variants', sa.Text(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('images', schema=None) as batch_op:
+        batch_op.drop_column('variants')
@@ -0,0 +1,54 @@
+"""add full-text search index over image prompts
+
+Revision ID: c8f1d2e4a6b9
+Revises: 4a7b1e8c2f93
+Create Date: 2026-10-18 17:40:12.508114
+
+SQLite only (FTS5); other databases fall back to LIKE search. Note that
+batch_alter_table on images recreates the table on SQLite and drops these
+triggers, so later migrations touching images must recreate them.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c8f1d2e4a6b9'
+down_revision = '4a7b1e8c2f93'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    op.execute(
+        "CREATE VIRTUAL TABLE images_fts USING fts5("
+        "prompt, owner, tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+    )
+    op.execute(
+        "CREATE TRIGGER images_fts_insert AFTER INSERT ON images BEGIN "
+        "INSERT INTO images_fts(rowid, prompt, owner) VALUES (new.id, coalesce(new.prompt, ''), 'u' || new.user_id); END"
+    )
+    op.execute(
+        "CREATE TRIGGER images_fts_delete AFTER DELETE ON images BEGIN "
+        "DELETE FROM images_fts WHERE rowid = old.id; END"
+    )
+    op.execute(
+        "CREATE TRIGGER images_fts_update AFTER UPDATE OF prompt, user_id ON images BEGIN "
+        "UPDATE images_fts SET prompt = coalesce(new.prompt, ''), owner = 'u' || new.user_id WHERE rowid = new.id; END"
+    )
+    op.execute(
+        "INSERT INTO images_fts(rowid, prompt, owner) "
+        "SELECT id, coalesce(prompt, ''), 'u' || user_id FROM images"
+    )
+    op.execute("INSERT INTO images_fts(images_fts) VALUES ('optimize')")
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    op.execute("DROP TRIGGER IF EXISTS images_fts_update")
+    op.execute("DROP TRIGGER IF EXISTS images_fts_delete")
+    op.execute("DROP TRIGGER IF EXISTS images_fts_insert")
+    op.execute("DROP TABLE IF EXISTS images_fts")
@@ -0,0 +1,35 @@
+"""add stored_files table and images.image_path index
+
+Revision ID: e2a9f6c1b3d8
+Revises: b5e04c3d8a17
+Create Date: 2026-10-18 13:02:44.190736
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e2a9f6c1b3d8'
+down_revision = 'b5e04c3d8a17'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('stored_files',
+    sa.Column('path', sa.String(length=500), nullable=False),
+    sa.Column('size', sa.BigInteger(), nullable=True),
+    sa.Column('refcount', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('path')
+    )
+    with op.batch_alter_table('images', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_images_image_path'), ['image_path'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('images', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_images_image_path'))
+
+    op.drop_table('stored_files')
@@ -0,0 +1,70 @@
+"""add generation_ledger and generation_rollups tables
+
+Revision ID: f3b7c9d1e5a2
+Revises: c8f1d2e4a6b9
+Create Date: 2026-10-18 21:14:37.602918
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3b7c9d1e5a2'
+down_revision = 'c8f1d2e4a6b9'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('generation_ledger',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('job_id', sa.String(length=32), nullable=True),
+    sa.Column('image_id', sa.Integer(), nullable=True),
+    sa.Column('provider', sa.String(length=50), nullable=True),
+    sa.Column('model', sa.String(length=200), nullable=True),
+    sa.Column('outcome', sa.String(length=10), nullable=False),
+    sa.Column('cache', sa.String(length=10), nullable=False),
+    sa.Column('model_seconds', sa.Float(), nullable=True),
+    sa.Column('download_seconds', sa.Float(), nullable=True),
+    sa.Column('bytes', sa.BigInteger(), nullable=True),
+    sa.Column('cost', sa.Float(), nullable=True),
+    sa.Column('error', sa.String(length=500), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('generation_ledger', schema=None) as batch_op:
+        batch_op.create_index('ix_generation_ledger_created_at', ['created_at'], unique=False)
+        batch_op.create_index('ix_generation_ledger_user_created_at', ['user_id', 'created_at'], unique=False)
+
+    op.create_table('generation_rollups',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('granularity', sa.String(length=4), nullable=False),
+    sa.Column('bucket', sa.DateTime(), nullable=False),
+    sa.Column('model', sa.String(length=200), nullable=False),
+    sa.Column('runs', sa.Integer(), nullable=False),
+    sa.Column('errors', sa.Integer(), nullable=False),
+    sa.Column('cache_hits', sa.Integer(), nullable=False),
+    sa.Column('model_runs', sa.Integer(), nullable=False),
+    sa.Column('model_seconds', sa.Float(), nullable=False),
+    sa.Column('download_seconds', sa.Float(), nullable=False),
+    sa.Column('bytes', sa.BigInteger(), nullable=False),
+    sa.Column('cost', sa.Float(), nullable=False),
+    sa.PrimaryKeyConstraint('user_id', 'granularity', 'bucket', 'model')
+    )
+    with op.batch_alter_table('generation_rollups', schema=None) as batch_op:
+        batch_op.create_index('ix_generation_rollups_granularity_bucket', ['granularity', 'bucket'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('generation_rollups', schema=None) as batch_op:
+        batch_op.drop_index('ix_generation_rollups_granularity_bucket')
+
+    op.drop_table('generation_rollups')
+    with op.batch_alter_table('generation_ledger', schema=None) as batch_op:
+        batch_op.drop_index('ix_generation_ledger_user_created_at')
+        batch_op.drop_index('ix_generation_ledger_created_at')
+
+    op.drop_table('generation_ledger')
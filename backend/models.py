@@ -2,8 +2,9 @@
 
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
-from werkzeug.security import generate_password_hash, check_password_hash
+from utils.passwords import passwords
 from datetime import datetime
+import uuid
 
 db = SQLAlchemy()
 
@@ -13,20 +14,106 @@ class User(UserMixin, db.Model):
     username = db.Column(db.String(80), unique=True, nullable=False)
     email = db.Column(db.String(120), unique=True, nullable=False)
     password_hash = db.Column(db.String(128), nullable=False)
+    tier = db.Column(db.String(20), nullable=False, default='free', server_default='free')  # key into QUOTA_TIERS
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
     images = db.relationship('Image', backref='user', lazy=True)
 
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = passwords.hash(password)
 
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        """Verify a password; an outdated hash is upgraded in place (caller commits)"""
+        matches, needs_rehash = passwords.verify(self.password_hash, password)
+        if needs_rehash:
+            self.password_hash = passwords.hash(password)
+        return matches
 
 class Image(db.Model):
     __tablename__ = 'images'
     id = db.Column(db.Integer, primary_key=True)
     prompt = db.Column(db.Text, nullable=True)
-    image_path = db.Column(db.String(500), nullable=False)
+    image_path = db.Column(db.String(500), nullable=False, index=True)
+    variants = db.Column(db.Text, nullable=True)  # JSON {format: {width: path}}
     generated_at = db.Column(db.DateTime, default=datetime.utcnow)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
\ No newline at end of file
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_images_user_generated_at_id', 'user_id', generated_at.desc(), id.desc()),
+    )
+
+class StoredFile(db.Model):
+    """Reference count for a content-addressed file shared by Image rows"""
+    __tablename__ = 'stored_files'
+    path = db.Column(db.String(500), primary_key=True)
+    size = db.Column(db.BigInteger, nullable=True)
+    refcount = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class GenerationJob(db.Model):
+    __tablename__ = 'generation_jobs'
+
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+
+    id = db.Column(db.String(32), primary_key=True, default=lambda: uuid.uuid4().hex)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
+    status = db.Column(db.String(20), nullable=False, default=QUEUED)
+    payload = db.Column(db.Text, nullable=False)
+    image_id = db.Column(db.Integer, db.ForeignKey('images.id', ondelete='SET NULL'), nullable=True)
+    result = db.Column(db.Text, nullable=True)  # JSON per-item report for batch jobs
+    error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+    image = db.relationship('Image')
+
+class GenerationLedgerEntry(db.Model):
+    """One generation attempt and what it cost; rows are only ever inserted"""
+    __tablename__ = 'generation_ledger'
+    id = db.Column(db.Integer, primary_key=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    # Not foreign keys: jobs and images may be deleted, the ledger is kept
+    job_id = db.Column(db.String(32), nullable=True)
+    image_id = db.Column(db.Integer, nullable=True)
+    provider = db.Column(db.String(50), nullable=True)
+    model = db.Column(db.String(200), nullable=True)
+    outcome = db.Column(db.String(10), nullable=False)  # 'ok' or 'error'
+    cache = db.Column(db.String(10), nullable=False)  # 'hit', 'miss' or 'off'
+    model_seconds = db.Column(db.Float, nullable=True)  # None when no model ran
+    download_seconds = db.Column(db.Float, nullable=True)
+    bytes = db.Column(db.BigInteger, nullable=True)
+    cost = db.Column(db.Float, nullable=True)  # GENERATION_RUN_COSTS price of the model run
+    error = db.Column(db.String(500), nullable=True)
+
+    __table_args__ = (
+        db.Index('ix_generation_ledger_user_created_at', 'user_id', 'created_at'),
+        db.Index('ix_generation_ledger_created_at', 'created_at'),
+    )
+
+class GenerationRollup(db.Model):
+    """Ledger totals per hour or day, user and model, updated as entries are
+    written; user_id 0 holds the totals over all users"""
+    __tablename__ = 'generation_rollups'
+    # Key order makes one user's (or the all-users) report a range scan
+    user_id = db.Column(db.Integer, primary_key=True)
+    granularity = db.Column(db.String(4), primary_key=True)  # 'hour' or 'day'
+    bucket = db.Column(db.DateTime, primary_key=True)  # start of the hour or day, UTC
+    model = db.Column(db.String(200), primary_key=True)  # '' when no provider answered
+    runs = db.Column(db.Integer, nullable=False, default=0)
+    errors = db.Column(db.Integer, nullable=False, default=0)
+    cache_hits = db.Column(db.Integer, nullable=False, default=0)
+    model_runs = db.Column(db.Integer, nullable=False, default=0)
+    model_seconds = db.Column(db.Float, nullable=False, default=0.0)
+    download_seconds = db.Column(db.Float, nullable=False, default=0.0)
+    bytes = db.Column(db.BigInteger, nullable=False, default=0)
+    cost = db.Column(db.Float, nullable=False, default=0.0)
+
+    __table_args__ = (
+        # Per-user totals across users (top users in the admin report)
+        db.Index('ix_generation_rollups_granularity_bucket', 'granularity', 'bucket'),
+    )
@@ -1,9 +1,12 @@
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, jsonify, request, current_app
 from models import db, User
-from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity
-import requests
+from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity, get_current_user
 import os
+import logging
+from utils.google import google_tokens, google_user, InvalidGoogleToken
+from utils.passwords import PasswordHashBusy
 
+logger = logging.getLogger(__name__)
 auth_bp = Blueprint('auth', __name__)
 
 @auth_bp.route('/google-login', methods=['POST'])
@@ -21,28 +24,27 @@ def google_login():
     if not token:
         return jsonify({"error": "Missing token in request"}), 400
 
+    # Lifetime the client got with the token; it can only shorten the cache TTL
     try:
-        # Use the access token to fetch user info from Google's userinfo endpoint
-        userinfo_response = requests.get(
-            f'https://www.googleapis.com/oauth2/v3/userinfo?access_token={token}'
-        )
+        expires_in = float(data['expires_in']) if data.get('expires_in') is not None else None
+    except (TypeError, ValueError):
+        return jsonify({"error": "expires_in must be a number of seconds"}), 400
 
-        if userinfo_response.status_code != 200:
-            return jsonify({"error": "Failed to fetch user info from Google"}), 401
+    try:
+        # Google's userinfo for the access token; cached, and shared by
+        # concurrent logins with the same token
+        try:
+            user_info = google_tokens.verify(token, expires_in)
+        except InvalidGoogleToken as e:
+            return jsonify({"error": str(e)}), 401
 
-        user_info = userinfo_response.json()
         email = user_info.get('email')
 
         if not email:
             raise ValueError("Token verification failed: No email in user info")
 
-        # Check if the user exists in the database
-        user = User.query.filter_by(email=email).first()
-        if not user:
-            # If the user doesn't exist, create one
-            user = User(email=email)
-            db.session.add(user)
-            db.session.commit()
+        # Existing user, or one created now (safe against concurrent first logins)
+        user = google_user(email)
 
         # Generate a JWT token for the user
         access_token = create_access_token(identity=str(user.id), additional_claims={"email": email})
@@ -85,7 +87,10 @@ def register():
         username=data['username'],
         email=data['email']
     )
-    new_user.set_password(data['password'])
+    try:
+        new_user.set_password(data['password'])
+    except PasswordHashBusy as e:
+        return jsonify({"error": str(e)}), 503, {'Retry-After': '1'}
     
     try:
         db.session.add(new_user)
@@ -103,8 +108,16 @@ def login():
         return jsonify({"error": "Missing required fields"}), 400
     
     user = User.query.filter_by(email=data['email']).first()
-    
-    if user and user.check_password(data['password']):
+
+    try:
+        valid = user is not None and user.check_password(data['password'])
+    except PasswordHashBusy as e:
+        return jsonify({"error": str(e)}), 503, {'Retry-After': '1'}
+
+    if valid:
+        if db.session.is_modified(user):
+            # check_password upgraded an old hash
+            db.session.commit()
         access_token = create_access_token(identity=str(user.id), additional_claims={"sub": str(user.id)})
         return jsonify({
             "success": True,
@@ -122,11 +135,10 @@ def login():
 @jwt_required()
 def get_user():
     current_user = get_jwt_identity()
-    print("Current User ID:", current_user)  # Log the current user ID
+    logger.debug("Current User ID: %s", current_user)
 
-    user = User.query.get(current_user)
-    if user is None:
-        return jsonify({"msg": "User not found"}), 404
+    # Loaded (and cached) by the JWT user_lookup_loader
+    user = get_current_user()
 
     return jsonify({
         "user": {
@@ -140,12 +152,8 @@ def get_user():
 @jwt_required()
 def verify_token():
     try:
-        current_user_id = get_jwt_identity()
-        user = User.query.get(current_user_id)
-        
-        if not user:
-            return jsonify({'success': False, 'error': 'User not found'}), 404
-            
+        user = get_current_user()
+
         return jsonify({
             'success': True,
             'user': {
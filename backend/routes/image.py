@@ -1,119 +1,582 @@
 # routes/image.py
 
-from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify, abort, current_app
-from flask_login import login_required, current_user
-from flask_jwt_extended import jwt_required, get_jwt_identity  # Import jwt_required and get_jwt_identity
-from models import db, Image, User
-from utils.replicate import generate_image  # Import the synchronous function
-from flask_wtf import FlaskForm
-from wtforms import TextAreaField, SubmitField
-from wtforms.validators import DataRequired, Length
+from flask import Blueprint, url_for, request, jsonify, current_app, Response, stream_with_context
+from flask_jwt_extended import jwt_required, get_jwt_identity, get_current_user  # Import jwt_required and get_jwt_identity
+from models import db, Image, GenerationJob
+from sqlalchemy import delete, select, tuple_
+from utils.replicate import generate_image, async_generate_image
+from utils.providers import providers
+from utils.prompts import parse_prompt, InvalidPrompt, CUSTOM_PROMPT_MAX_LENGTH
+from utils.cache import prompt_cache, cache_key
+from utils.derivatives import srcset, variant_paths
+from utils.storage import get_storage, ingest_image, add_reference, release_reference, release_references
+from utils.reaper import reaper
+from utils.search import search_images, similar_images
+from utils.archive import export_archive, import_archive, InvalidArchive
+from utils.jobs import jobs, QueueFullError, report_progress
+from utils.ledger import ledger, parse_range, report
+from utils.quotas import quotas, QuotaExceeded
+from utils.events import event_hub, format_sse, stream_token, stream_token_user
 import os
+import base64
+import json
 from datetime import datetime
 import logging
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from werkzeug.exceptions import RequestEntityTooLarge
 
 
-logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
 image_bp = Blueprint('image', __name__)
 
-class ImageForm(FlaskForm):
-    prompt = TextAreaField('Enter Image Description', validators=[DataRequired(), Length(min=5, max=500)])
-    style = TextAreaField('Enter Style (optional)', validators=[Length(max=100)])
-    submit = SubmitField('Generate Image')
+def _encode_cursor(generated_at, image_id):
+    raw = f"{generated_at.isoformat()}|{image_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def _decode_cursor(cursor):
+    generated_at, image_id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+    return datetime.fromisoformat(generated_at), int(image_id)
 
 @image_bp.route('/user-images', methods=['GET'])
 @jwt_required()
 def get_user_images():
-    current_user_id = get_jwt_identity()
-    user = User.query.get(current_user_id)
-    
-    if not user:
-        return jsonify({"error": "User not found"}), 404
-        
-    images = Image.query.filter_by(user_id=current_user_id).order_by(Image.generated_at.desc()).all()
-    
+    user = get_current_user()
+
+    try:
+        limit = min(int(request.args.get('limit', current_app.config['USER_IMAGES_PAGE_SIZE'])),
+                    current_app.config['USER_IMAGES_MAX_PAGE_SIZE'])
+        cursor = request.args.get('cursor')
+        after = _decode_cursor(cursor) if cursor else None
+    except ValueError:
+        return jsonify({"error": "Invalid limit or cursor"}), 400
+    if limit < 1:
+        return jsonify({"error": "Invalid limit or cursor"}), 400
+
+    # Column-only keyset query on (generated_at, id); served by
+    # ix_images_user_generated_at_id, no ORM objects are built
+    query = select(Image.id, Image.image_path, Image.variants, Image.prompt, Image.generated_at) \
+        .where(Image.user_id == user.id) \
+        .order_by(Image.generated_at.desc(), Image.id.desc()) \
+        .limit(limit + 1)
+    if after:
+        query = query.where(tuple_(Image.generated_at, Image.id) < tuple_(*after))
+    rows = db.session.execute(query).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = _encode_cursor(rows[-1].generated_at, rows[-1].id)
+
+    # Resolve the storage URL prefix once instead of calling url_for per row
+    image_url = get_storage().url_builder()
+
     return jsonify({
         "images": [{
-            "id": image.id,
-            "url": url_for('static', filename=image.image_path, _external=True),  # Add _external=True
-            "prompt": image.prompt,
-            "generated_at": image.generated_at.isoformat()
-        } for image in images]
+            "id": row.id,
+            "url": image_url(row.image_path),
+            "srcset": srcset(row.variants, image_url),
+            "prompt": row.prompt,
+            "generated_at": row.generated_at.isoformat()
+        } for row in rows],
+        "next_cursor": next_cursor
     }), 200
 
+def _serialize_image(image, image_url=None):
+    image_url = image_url or get_storage().url_builder()
+    return {
+        'id': image.id,
+        'url': image_url(image.image_path),
+        'srcset': srcset(image.variants, image_url),
+        'prompt': image.prompt,
+        'generated_at': image.generated_at.isoformat()
+    }
+
+@image_bp.route('/search', methods=['GET'])
+@jwt_required()
+def search_user_images():
+    """Search the caller's prompts: ?q= matches every word (prefixes too) ranked
+    by BM25; mode=similar, or similar_to=<image id>, ranks by prompt similarity"""
+    current_user_id = int(get_jwt_identity())
+    query = request.args.get('q', '').strip()
+    mode = request.args.get('mode', 'text')
+    try:
+        limit = min(int(request.args.get('limit', current_app.config['SEARCH_PAGE_SIZE'])),
+                    current_app.config['USER_IMAGES_MAX_PAGE_SIZE'])
+        similar_to = int(request.args['similar_to']) if 'similar_to' in request.args else None
+    except ValueError:
+        return jsonify({"error": "Invalid limit or similar_to"}), 400
+    if limit < 1 or mode not in ('text', 'similar'):
+        return jsonify({"error": "Invalid limit or mode"}), 400
+    if len(query) > CUSTOM_PROMPT_MAX_LENGTH:
+        return jsonify({"error": f"q must be at most {CUSTOM_PROMPT_MAX_LENGTH} characters"}), 400
+
+    if similar_to is not None:
+        source = db.session.get(Image, similar_to)
+        if not source or source.user_id != current_user_id:
+            return jsonify({"error": "Image not found"}), 404
+        mode = 'similar'
+        results = similar_images(current_user_id, source.prompt or '', limit, exclude_id=source.id)
+    elif not query:
+        return jsonify({"error": "q is required"}), 400
+    elif mode == 'similar':
+        results = similar_images(current_user_id, query, limit)
+    else:
+        results = search_images(current_user_id, query, limit)
+
+    rows = {row.id: row for row in db.session.execute(
+        select(Image.id, Image.image_path, Image.variants, Image.prompt, Image.generated_at)
+        .where(Image.id.in_([image_id for image_id, _ in results]))
+    )} if results else {}
+    image_url = get_storage().url_builder()
+
+    return jsonify({
+        "mode": mode,
+        "images": [{**_serialize_image(rows[image_id], image_url), "score": score}
+                   for image_id, score in results if image_id in rows]
+    }), 200
+
+@image_bp.route('/export', methods=['GET'])
+@jwt_required()
+def export_images():
+    """Download the caller's gallery as a zip (manifest.json plus images/),
+    streamed while it is built"""
+    user = get_current_user()
+    filename = f"gallery-{user.id}-{datetime.utcnow():%Y%m%d}.zip"
+    return Response(stream_with_context(export_archive(user.id)), mimetype='application/zip',
+                    headers={'Content-Disposition': f'attachment; filename="{filename}"',
+                             'Cache-Control': 'no-store', 'X-Accel-Buffering': 'no'})
+
+@image_bp.route('/import', methods=['POST'])
+@jwt_required()
+def import_images():
+    """Add the images of an exported zip (multipart field "archive") to the caller's gallery"""
+    # Larger uploads are refused before any of the body is read
+    request.max_content_length = current_app.config['IMPORT_MAX_BYTES']
+    try:
+        upload = request.files.get('archive')
+    except RequestEntityTooLarge:
+        return jsonify({"error": f"Archive must be at most {current_app.config['IMPORT_MAX_BYTES']} bytes"}), 413
+    if upload is None:
+        return jsonify({"error": "archive file is required"}), 400
+
+    try:
+        # Multipart uploads are spooled to a temp file, which zipfile can seek
+        stats = import_archive(int(get_jwt_identity()), upload.stream)
+    except InvalidArchive as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error in import_images: {str(e)}")
+        return jsonify({"error": "Failed to import archive"}), 500
+    return jsonify(stats), 200
+
+@image_bp.route('/stats', methods=['GET'])
+@jwt_required()
+def generation_stats():
+    """The caller's generations per hour or day (?period=, ?since=, ?until=):
+    runs, errors, cache hits, model and download time, bytes and cost by model"""
+    try:
+        period, since, until = parse_range(request.args.get('period', 'day'), request.args.get('since'),
+                                           request.args.get('until'), current_app.config['STATS_MAX_BUCKETS'])
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(report(int(get_jwt_identity()), period, since, until)), 200
+
+def _store_result(result):
+    """Move a generated scratch file into storage, updating result in place"""
+    try:
+        report_progress('saving')
+        # Identical bytes collapse onto one content-addressed file
+        result['image_path'], result['variants'], result['size'] = ingest_image(result['image_path'])
+    except Exception:
+        if os.path.exists(result['image_path']):
+            os.remove(result['image_path'])
+        raise
+    return result
+
+def _prompt_cache_key(final_prompt):
+    return cache_key(final_prompt, providers.model_id, providers.model_input)
+
+def _stored_file_exists(cached):
+    # A cached result is only usable while its file is still stored
+    return get_storage().exists(cached['image_path'])
+
+def _cache_mode(use_cache=True):
+    # What the ledger records for a generation that did not come from the cache
+    return 'miss' if use_cache and prompt_cache.enabled else 'off'
+
+def _generate_result(final_prompt, user_id, use_cache=True):
+    """Run the model on a built prompt and move the output into storage; no
+    DB row is written.
+
+    Returns (result, cache) where cache is 'hit', 'miss' or 'off'.
+    """
+    def run():
+        return _store_result(generate_image(final_prompt, user_id))
+
+    if use_cache and prompt_cache.enabled:
+        # Identical prompts reuse the stored file instead of a new model run
+        result, hit = prompt_cache.get_or_compute(_prompt_cache_key(final_prompt), run, is_valid=_stored_file_exists)
+        return result, 'hit' if hit else 'miss'
+    return run(), 'off'
+
+def _new_image(result, user_id):
+    return Image(
+        prompt=result['final_prompt'],  # Store the combined prompt string
+        image_path=result['image_path'],
+        variants=json.dumps(result['variants']) if result['variants'] else None,
+        user_id=user_id
+    )
+
+def _save_image(result, user_id, cache):
+    # Create new image record with the combined prompt
+    new_image = _new_image(result, user_id)
+    db.session.add(new_image)
+    add_reference(new_image.image_path, result['size'])
+    db.session.commit()
+    ledger.record(user_id, 'ok', cache, result, new_image.id)
+    return new_image.id, None
+
+def _generate_and_save(payload, user_id):
+    """Job handler: run the model and persist the resulting Image row"""
+    result, cache = None, _cache_mode()
+    try:
+        result, cache = _generate_result(payload['prompt'], user_id)
+        return _save_image(result, user_id, cache)
+    except Exception as e:
+        ledger.record(user_id, 'error', cache, result, error=e)
+        raise
+
+async def _generate_result_async(final_prompt, user_id):
+    """_generate_result for the event loop; storage borrows a worker thread"""
+    async def run():
+        return await jobs.run_sync(_store_result, await async_generate_image(final_prompt, user_id))
+
+    if prompt_cache.enabled:
+        # Identical prompts in flight on the loop share one model run
+        result, hit = await prompt_cache.get_or_compute_async(
+            _prompt_cache_key(final_prompt), run, jobs.run_sync, is_valid=_stored_file_exists)
+        return result, 'hit' if hit else 'miss'
+    return await run(), 'off'
+
+async def _generate_and_save_async(payload, user_id):
+    """Async job handler: the model run and download are awaited on the event
+    loop; storage and DB writes borrow a worker thread"""
+    result, cache = None, _cache_mode()
+    try:
+        result, cache = await _generate_result_async(payload['prompt'], user_id)
+        return await jobs.run_sync(_save_image, result, user_id, cache)
+    except Exception as e:
+        ledger.record(user_id, 'error', cache, result, error=e)
+        raise
+
+def _generate_batch(payload, user_id):
+    """Job handler: fan a batch out to the model, then insert every row at once"""
+    app = current_app._get_current_object()
+    items = payload['items']
+
+    def work(final_prompt):
+        with app.app_context():
+            return _generate_result(final_prompt, user_id, use_cache=payload['use_cache'])
+
+    results = [None] * len(items)
+    with ThreadPoolExecutor(max_workers=min(len(items), app.config['BATCH_CONCURRENCY'])) as pool:
+        futures = {pool.submit(work, final_prompt): index for index, final_prompt in enumerate(items)}
+        for future in as_completed(futures):
+            try:
+                results[futures[future]] = future.result()
+            except Exception as e:
+                results[futures[future]] = e
+
+    failed, created = [], []
+    for index, outcome in enumerate(results):
+        if isinstance(outcome, Exception):
+            failed.append((index, outcome))
+            ledger.record(user_id, 'error', _cache_mode(payload['use_cache']), error=outcome)
+        else:
+            result, cache = outcome
+            created.append((index, result, cache, _new_image(result, user_id)))
+    db.session.add_all([image for _, _, _, image in created])
+    sizes = {result['image_path']: result['size'] for _, result, _, _ in created}
+    for path, count in Counter(image.image_path for _, _, _, image in created).items():
+        add_reference(path, sizes[path], count)
+    try:
+        db.session.commit()
+    except Exception as e:
+        for _, result, cache, _ in created:
+            ledger.record(user_id, 'error', cache, result, error=e)
+        raise
+    for _, result, cache, image in created:
+        ledger.record(user_id, 'ok', cache, result, image.id)
+
+    items = [{'index': index, 'error': str(error)} for index, error in failed]
+    items += [{'index': index, 'image_id': image.id} for index, _, _, image in created]
+    return None, {'items': sorted(items, key=lambda item: item['index'])}
+
+def _accepted_job(job):
+    """Body of a 202 for a queued job: where to poll it and where to stream it"""
+    return {
+        'success': True,
+        'job': {
+            'id': job.id,
+            'status': job.status,
+            'url': url_for('image.get_job', job_id=job.id, _external=True),
+            'events_url': url_for('image.job_events', job_id=job.id, token=stream_token(job.id, job.user_id),
+                                  _external=True)
+        }
+    }
+
+def _submit_generation(payload, handler, cost=1):
+    """Charge the caller's quota and queue a job; its slot frees when the job settles"""
+    user = get_current_user()
+    slot = quotas.acquire(user, cost)
+    try:
+        return jobs.submit(user.id, payload, handler, on_finish=lambda: quotas.release(user.id, slot))
+    except Exception:
+        quotas.release(user.id, slot)
+        raise
+
 @image_bp.route('/generate', methods=['POST'])
 @jwt_required()
 def generate_image_route():
     try:
-        current_user_id = get_jwt_identity()
-        data = request.json
-
-        # Generate the image
-        result = generate_image(data, current_user_id)
-        
-        # Create new image record with the combined prompt
-        new_image = Image(
-            prompt=result['final_prompt'],  # Store the combined prompt string
-            image_path=result['image_path'],
-            user_id=current_user_id
-        )
-        
-        db.session.add(new_image)
-        db.session.commit()
+        # Reject malformed or oversized prompts before any quota, queue or model
+        # work. The prompt is built here once; the job carries the result
+        prompt = parse_prompt(request.get_json(silent=True))
+
+        # Queue the generation and return immediately
+        handler = _generate_and_save_async if current_app.config['GENERATION_ASYNC'] else _generate_and_save
+        job = _submit_generation({'prompt': prompt.prompt}, handler)
 
-        return jsonify({
-            'success': True,
-            'image': {
-                'id': new_image.id,
-                'url': url_for('static', filename=new_image.image_path, _external=True),
-                'prompt': new_image.prompt,
-                'generated_at': new_image.generated_at.isoformat()
-            }
-        })
+        return jsonify(_accepted_job(job)), 202
 
+    except InvalidPrompt as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except QuotaExceeded as e:
+        return jsonify({'success': False, 'error': str(e)}), 429, {'Retry-After': str(e.retry_after)}
+    except QueueFullError as e:
+        return jsonify({'success': False, 'error': str(e)}), 503, {'Retry-After': '5'}
     except Exception as e:
+        db.session.rollback()
         return jsonify({'success': False, 'error': str(e)}), 400
 
+@image_bp.route('/generate/batch', methods=['POST'])
+@jwt_required()
+def generate_batch_route():
+    data = request.json or {}
+    max_items = current_app.config['BATCH_MAX_ITEMS']
+
+    if 'prompts' in data:
+        items = data['prompts']
+        use_cache = True
+    elif 'prompt' in data:
+        num_outputs = data.get('num_outputs', 1)
+        if not isinstance(num_outputs, int) or num_outputs < 1:
+            return jsonify({'success': False, 'error': 'num_outputs must be a positive integer'}), 400
+        # Variations of one prompt must not collapse onto a cached result
+        items = [data['prompt']] * num_outputs
+        use_cache = False
+    else:
+        return jsonify({'success': False, 'error': 'Provide prompts or prompt with num_outputs'}), 400
+
+    if not isinstance(items, list) or not items:
+        return jsonify({'success': False, 'error': 'Prompts must be a non-empty list of prompt objects'}), 400
+    if len(items) > max_items:
+        return jsonify({'success': False, 'error': f'At most {max_items} images per batch'}), 400
+
+    # Every item is validated and built up front; one bad prompt rejects the whole batch
+    parsed = []
+    for index, item in enumerate(items):
+        try:
+            parsed.append(parse_prompt(item).prompt)
+        except InvalidPrompt as e:
+            return jsonify({'success': False, 'error': f'Prompt {index}: {e}'}), 400
+    items = parsed
+
+    try:
+        # A batch holds one in-flight slot but costs one token per image
+        job = _submit_generation({'items': items, 'use_cache': use_cache}, _generate_batch, cost=len(items))
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except QuotaExceeded as e:
+        return jsonify({'success': False, 'error': str(e)}), 429, {'Retry-After': str(e.retry_after)}
+    except QueueFullError as e:
+        return jsonify({'success': False, 'error': str(e)}), 503, {'Retry-After': '5'}
+
+    return jsonify(_accepted_job(job)), 202
+
+def _job_response(job):
+    response = {
+        'id': job.id,
+        'status': job.status,
+        'created_at': job.created_at.isoformat(),
+        'started_at': job.started_at.isoformat() if job.started_at else None,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None
+    }
+    # SQLite reuses the ids of deleted images and the jobs' image_id is not
+    # cleared, so a row under a job's id only counts if the job's user owns it
+    if job.status == GenerationJob.DONE and job.image and job.image.user_id == job.user_id:
+        response['image'] = _serialize_image(job.image)
+    elif job.status == GenerationJob.DONE and job.result:
+        # Batch job: load all created images in one query
+        items = json.loads(job.result)['items']
+        image_ids = [item['image_id'] for item in items if 'image_id' in item]
+        images = {image.id: image for image in Image.query.filter(Image.id.in_(image_ids),
+                                                                  Image.user_id == job.user_id)}
+        image_url = get_storage().url_builder()
+        response['items'] = [
+            {'index': item['index'], 'image': _serialize_image(images[item['image_id']], image_url)}
+            if item.get('image_id') in images else
+            {'index': item['index'], 'error': item.get('error', 'Image was deleted')}
+            for item in items
+        ]
+    elif job.status == GenerationJob.FAILED:
+        response['error'] = job.error
+    return response
+
+@image_bp.route('/jobs/<job_id>', methods=['GET'])
+@jwt_required()
+def get_job(job_id):
+    current_user_id = int(get_jwt_identity())
+    job = db.session.get(GenerationJob, job_id)
+
+    if not job or job.user_id != current_user_id:
+        return jsonify({"error": "Job not found"}), 404
+
+    return jsonify(_job_response(job)), 200
+
+@image_bp.route('/jobs/<job_id>/events', methods=['GET'])
+@jwt_required(optional=True)
+def job_events(job_id):
+    """Stream job state changes as Server-Sent Events until the job settles.
+
+    EventSource cannot send headers, so besides a bearer token this takes the
+    short-lived ?token= from the job's events_url.
+    """
+    identity = get_jwt_identity()
+    if identity is not None:
+        current_user_id = int(identity)
+    elif 'token' in request.args:
+        current_user_id = stream_token_user(request.args['token'], job_id)
+        if current_user_id is None:
+            return jsonify({"error": "Invalid or expired stream token"}), 401
+    else:
+        return jsonify({"error": "Missing authorization"}), 401
+    job = db.session.get(GenerationJob, job_id)
+
+    if not job or job.user_id != current_user_id:
+        return jsonify({"error": "Job not found"}), 404
+
+    # Subscribe before reading the current state so no transition is missed
+    subscription = event_hub.subscribe(job_id)
+    db.session.refresh(job)
+    initial = _job_response(job)
+    # Idle streams must not pin a pooled DB connection
+    db.session.close()
+
+    config = current_app.config
+    finished = (GenerationJob.DONE, GenerationJob.FAILED)
+
+    def stream():
+        try:
+            yield format_sse(initial)
+            if initial['status'] in finished:
+                return
+            deadline = time.monotonic() + config['JOB_EVENTS_TIMEOUT']
+            while time.monotonic() < deadline:
+                event = subscription.get(config['JOB_EVENTS_HEARTBEAT'])
+                if event is None:
+                    # The job may be running in another process; check the table
+                    status = db.session.get(GenerationJob, job_id).status
+                    db.session.close()
+                    if status not in finished:
+                        yield ': keepalive\n\n'
+                        continue
+                elif event['status'] not in finished:
+                    yield format_sse(event)
+                    continue
+                # Final event carries the same payload as GET /image/jobs/<id>
+                yield format_sse(_job_response(db.session.get(GenerationJob, job_id)))
+                db.session.close()
+                return
+        finally:
+            subscription.close()
+
+    return Response(stream_with_context(stream()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 @image_bp.route('/api/images/<int:image_id>', methods=['DELETE'])
 @jwt_required()
 def delete_image(image_id):
     try:
         current_user_id = int(get_jwt_identity())
-        user = User.query.get(current_user_id)
         image = Image.query.get(image_id)
 
-        if not user:
-            return jsonify({"error": "User not found"}), 404
-
         if not image:
-            logging.debug(f"Image not found for ID: {image_id}")
+            logger.debug("Image not found for ID: %s", image_id)
             return jsonify({"error": "Image not found"}), 404
 
         # Log the user IDs for debugging
-        logging.debug(f"Current User ID: {current_user_id}, Image User ID: {image.user_id}")
+        logger.debug("Current User ID: %s, Image User ID: %s", current_user_id, image.user_id)
 
-           # Check if the image belongs to the current user
+        # Check if the image belongs to the current user
         if image.user_id != current_user_id:
-            logging.debug("Unauthorized access attempt.")
+            logger.debug("Unauthorized access attempt.")
             return jsonify({"error": "Unauthorized to delete this image"}), 403
 
 
-        # Delete the actual image file
-        try:
-            file_path = os.path.join(current_app.static_folder, image.image_path)
-            if os.path.exists(file_path):
-                os.remove(file_path)
-        except Exception as e:
-            logging.error(f"Error deleting file: {str(e)}")
-            # Continue with database deletion even if file deletion fails
+        # Drop this row's reference; the file goes only with the last one
+        remaining = release_reference(image.image_path)
+        files = {image.image_path: variant_paths(image.variants)}
 
         # Delete from database
         db.session.delete(image)
         db.session.commit()
 
+        if remaining <= 0:
+            reaper.enqueue(files)
+
         return jsonify({"message": "Image deleted successfully"}), 200
 
     except Exception as e:
         db.session.rollback()
-        logging.error(f"Error in delete_image: {str(e)}")
+        logger.error(f"Error in delete_image: {str(e)}")
         return jsonify({"error": "Failed to delete image"}), 500
+
+@image_bp.route('/api/images', methods=['DELETE'])
+@jwt_required()
+def delete_images():
+    """Delete a list of the caller's images with one statement; files are reaped later"""
+    ids = (request.get_json(silent=True) or {}).get('ids')
+    max_ids = current_app.config['BULK_DELETE_MAX_IDS']
+    if not isinstance(ids, list) or not ids or \
+            not all(isinstance(image_id, int) and not isinstance(image_id, bool) for image_id in ids):
+        return jsonify({"error": "ids must be a non-empty list of image ids"}), 400
+    if len(ids) > max_ids:
+        return jsonify({"error": f"At most {max_ids} images per request"}), 400
+
+    current_user_id = int(get_jwt_identity())
+    try:
+        # Other users' ids simply match nothing and are reported as not found
+        rows = db.session.execute(
+            delete(Image)
+            .where(Image.id.in_(set(ids)), Image.user_id == current_user_id)
+            .returning(Image.id, Image.image_path, Image.variants)
+        ).all()
+        orphaned = release_references(Counter(row.image_path for row in rows)) if rows else []
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error in delete_images: {str(e)}")
+        return jsonify({"error": "Failed to delete images"}), 500
+
+    variants = {row.image_path: row.variants for row in rows}
+    reaper.enqueue({path: variant_paths(variants[path]) for path in orphaned})
+
+    deleted = sorted(row.id for row in rows)
+    return jsonify({
+        "deleted": deleted,
+        "not_found": sorted(set(ids) - set(deleted))
+    }), 200
@@ -1,11 +1,60 @@
 # routes/sample.py
 
-from flask import Blueprint, jsonify
+from functools import wraps
+from flask import Blueprint, jsonify, request, current_app
 from flask_login import login_required, current_user
+from flask_jwt_extended import jwt_required, get_current_user
+from utils.cache import prompt_cache
+from utils.users import user_cache
+from utils.google import google_tokens
+from utils.db import pool_stats
+from utils.providers import providers
+from utils.ledger import ALL_USERS, parse_range, report, top_users
 
 sample_bp = Blueprint('sample', __name__)
 
+def admin_required(view):
+    """403 unless the JWT user's email is in ADMIN_EMAILS; goes under @jwt_required()"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if get_current_user().email.lower() not in current_app.config['ADMIN_EMAILS']:
+            return jsonify({"error": "Forbidden"}), 403
+        return view(*args, **kwargs)
+    return wrapper
+
 @sample_bp.route('/protected')
 @login_required
 def protected():
     return jsonify({'message': f'Hello, {current_user.username}! This is a protected route.'}), 200
+
+@sample_bp.route('/cache-stats')
+@jwt_required()
+@admin_required
+def cache_stats():
+    return jsonify({'prompt_cache': prompt_cache.stats(), 'user_cache': user_cache.stats(),
+                    'google_tokens': google_tokens.stats()}), 200
+
+@sample_bp.route('/pool-stats')
+@jwt_required()
+@admin_required
+def db_pool_stats():
+    return jsonify(pool_stats()), 200
+
+@sample_bp.route('/provider-stats')
+@jwt_required()
+@admin_required
+def provider_stats():
+    return jsonify({'routing': providers.routing, 'providers': providers.snapshot()}), 200
+
+@sample_bp.route('/generation-stats')
+@jwt_required()
+@admin_required
+def generation_stats():
+    """Generations across all users per hour or day, and the busiest users"""
+    try:
+        period, since, until = parse_range(request.args.get('period', 'day'), request.args.get('since'),
+                                           request.args.get('until'), current_app.config['STATS_MAX_BUCKETS'])
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({**report(ALL_USERS, period, since, until),
+                    'top_users': top_users(period, since, until, current_app.config['STATS_TOP_USERS'])}), 200
@@ -0,0 +1,164 @@
+# tests/conftest.py
+"""Shared fixtures. Each app gets its own SQLite file, local storage under
+tmp_path and the fake model provider; tests override Config per app."""
+
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from flask_jwt_extended import create_access_token
+
+from app import create_app
+from config import Config
+from models import db, User
+from utils.users import user_cache
+
+TEST_CONFIG = {
+    'GENERATION_BACKEND': 'fake',
+    'FAKE_GENERATION_LATENCY': 0.01,
+    'GENERATION_PROVIDERS': None,
+    'DERIVATIVES_ENABLED': False,
+    'QUOTAS_ENABLED': False,
+    'LEDGER_ENABLED': False,
+    'PROMPT_CACHE_ENABLED': False,
+    'STORAGE_BACKEND': 'local',
+    'ACCESS_LOG_SAMPLE_RATE': 0.0,
+    'PASSWORD_HASH_WORKERS': 0,
+}
+
+
+@pytest.fixture
+def make_app(tmp_path, monkeypatch):
+    """create_app over a fresh database; keyword arguments override Config"""
+    apps = []
+
+    def make(cli=False, create_tables=True, **overrides):
+        settings = {
+            **TEST_CONFIG,
+            'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'app.db'}",
+            'IMAGE_STORAGE_ROOT': str(tmp_path / 'static'),
+            'IMAGE_SCRATCH_DIR': str(tmp_path / 'scratch'),
+            'PROMPT_CACHE_PATH': str(tmp_path / 'prompt_cache.db'),
+            **overrides,
+        }
+        for name, value in settings.items():
+            monkeypatch.setattr(Config, name, value, raising=False)
+        monkeypatch.setenv('JWT_SECRET_KEY', 'test-only-secret-long-enough-for-hs256')
+        # Ids restart with every database; drop users cached for the last one
+        user_cache.clear()
+        app = create_app(cli=cli)
+        app.config['TESTING'] = True
+        if create_tables:
+            with app.app_context():
+                db.create_all()
+        apps.append(app)
+        return app
+
+    yield make
+    for app in apps:
+        with app.app_context():
+            db.session.remove()
+            db.engine.dispose()
+
+
+@pytest.fixture
+def app(make_app):
+    return make_app()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def make_user():
+    """Add a user to app; returns (user id, Authorization headers)"""
+    def make(app, email, tier='free'):
+        with app.app_context():
+            user = User(username=email, email=email, password_hash='!', tier=tier)
+            db.session.add(user)
+            db.session.commit()
+            token = create_access_token(identity=str(user.id))
+            return user.id, {'Authorization': f'Bearer {token}'}
+    return make
+
+
+class StubServer:
+    """Local HTTP server whose paths are answered by plain functions.
+
+    A route gets the BaseHTTPRequestHandler and writes the response itself.
+    Every request is recorded as (path, client port, monotonic time), and
+    max_active is the most requests that were ever being handled at once.
+    """
+
+    def __init__(self):
+        self.routes = {}
+        self.requests = []
+        self.active = 0
+        self.max_active = 0
+        self._lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'  # keep-alive, so connection reuse is visible
+
+            def do_GET(self):
+                path = self.path.split('?')[0]
+                with stub._lock:
+                    stub.requests.append((path, self.client_address[1], time.monotonic()))
+                    stub.active += 1
+                    stub.max_active = max(stub.max_active, stub.active)
+                try:
+                    stub.routes[path](self)
+                finally:
+                    with stub._lock:
+                        stub.active -= 1
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, args=(0.05,), daemon=True).start()
+
+    def url(self, path):
+        return f'http://127.0.0.1:{self.server.server_port}{path}'
+
+    def hits(self, path):
+        return [request for request in self.requests if request[0] == path]
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    @staticmethod
+    def respond(handler, status=200, body=b'', headers=None):
+        """Write a complete response from a route"""
+        handler.send_response(status)
+        for name, value in {'Content-Length': str(len(body)), **(headers or {})}.items():
+            handler.send_header(name, value)
+        handler.end_headers()
+        handler.wfile.write(body)
+
+
+@pytest.fixture
+def stub_server():
+    server = StubServer()
+    yield server
+    server.close()
+
+
+@pytest.fixture
+def wait_for_job():
+    """Poll GET /image/jobs/<id> until the job settles; returns its JSON"""
+    def wait(client, job_id, headers, timeout=10):
+        deadline = time.monotonic() + timeout
+        while True:
+            job = client.get(f'/image/jobs/{job_id}', headers=headers).get_json()
+            if job['status'] in ('done', 'failed'):
+                return job
+            assert time.monotonic() < deadline, f"job {job_id} still {job['status']}"
+            time.sleep(0.02)
+    return wait
@@ -0,0 +1,17 @@
+# tests/test_admin.py
+
+import pytest
+
+ADMIN_ONLY = ['/api/cache-stats', '/api/pool-stats', '/api/provider-stats', '/api/generation-stats']
+
+
+@pytest.mark.parametrize('path', ADMIN_ONLY)
+def test_stats_are_admin_only(make_app, make_user, path):
+    app = make_app(ADMIN_EMAILS={'admin@example.com'})
+    client = app.test_client()
+    _, user = make_user(app, 'someone@example.com')
+    _, admin = make_user(app, 'Admin@Example.com')
+
+    assert client.get(path).status_code == 401
+    assert client.get(path, headers=user).status_code == 403
+    assert client.get(path, headers=admin).status_code == 200
@@ -0,0 +1,116 @@
+# tests/test_archive.py
+
+import io
+import json
+import zipfile
+
+from PIL import Image as PILImage
+
+from models import db, Image, StoredFile
+from utils.storage import add_reference, ingest_image
+
+
+def _generate(client, headers, wait_for_job, prompt):
+    response = client.post('/image/generate', json={'customPrompt': prompt}, headers=headers)
+    return wait_for_job(client, response.get_json()['job']['id'], headers)['image']
+
+
+def _add_image(app, user_id, tmp_path, prompt, color):
+    """Store a small PNG of its own for user_id"""
+    src = tmp_path / 'scratch' / f'{color}.png'
+    PILImage.new('RGB', (8, 8), color).save(src)
+    with app.app_context():
+        image_path, _, size = ingest_image(str(src))
+        db.session.add(Image(prompt=prompt, image_path=image_path, user_id=user_id))
+        add_reference(image_path, size)
+        db.session.commit()
+        return image_path
+
+
+def _import(client, headers, data):
+    return client.post('/image/import', headers=headers, content_type='multipart/form-data',
+                       data={'archive': (io.BytesIO(data), 'gallery.zip')})
+
+
+def _zip(members):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as archive:
+        for name, data in members.items():
+            archive.writestr(name, data)
+    return buffer.getvalue()
+
+
+def test_export_import_round_trip_dedupes_files(make_app, make_user, wait_for_job, tmp_path):
+    app = make_app(EXPORT_BATCH_SIZE=1, IMPORT_BATCH_SIZE=2)
+    client = app.test_client()
+    owner_id, owner = make_user(app, 'owner@example.com')
+    _, other = make_user(app, 'other@example.com')
+    _generate(client, owner, wait_for_job, 'a red fox')
+    _generate(client, owner, wait_for_job, 'a blue heron')
+    _add_image(app, owner_id, tmp_path, 'a green field', 'green')
+
+    response = client.get('/image/export', headers=owner)
+    assert response.status_code == 200 and response.is_streamed
+    assert response.headers['Content-Disposition'].startswith('attachment; filename="gallery-')
+    data = response.get_data()
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        assert archive.namelist()[0] == 'manifest.json'
+        manifest = json.loads(archive.read('manifest.json'))
+        assert [entry['prompt'] for entry in manifest['images']] == ['a red fox', 'a blue heron', 'a green field']
+        assert sorted(archive.namelist()[1:]) == sorted(entry['file'] for entry in manifest['images'])
+        with app.app_context():
+            for entry in manifest['images']:
+                image = db.session.get(Image, entry['id'])
+                assert archive.read(entry['file']) == (tmp_path / 'static' / image.image_path).read_bytes()
+    files = sorted((tmp_path / 'static').rglob('*.png'))
+
+    response = _import(client, other, data)
+    assert response.get_json() == {'imported': 3, 'skipped': 0, 'failed': []}
+    gallery = client.get('/image/user-images', headers=other).get_json()['images']
+    assert sorted(image['prompt'] for image in gallery) == ['a blue heron', 'a green field', 'a red fox']
+    assert {image['generated_at'] for image in gallery} == {entry['generated_at'] for entry in manifest['images']}
+    # Identical bytes: the import only adds references
+    assert sorted((tmp_path / 'static').rglob('*.png')) == files
+    with app.app_context():
+        assert sorted(stored.refcount for stored in StoredFile.query) == [2, 4]
+
+    # Importing the same archive again changes nothing
+    assert _import(client, other, data).get_json() == {'imported': 0, 'skipped': 3, 'failed': []}
+
+
+def test_export_skips_missing_files(client, app, make_user, tmp_path):
+    user_id, headers = make_user(app, 'owner@example.com')
+    image_path = _add_image(app, user_id, tmp_path, 'a green field', 'green')
+    _add_image(app, user_id, tmp_path, 'a red field', 'red')
+    (tmp_path / 'static' / image_path).unlink()
+
+    with zipfile.ZipFile(io.BytesIO(client.get('/image/export', headers=headers).get_data())) as archive:
+        assert len(json.loads(archive.read('manifest.json'))['images']) == 2
+        assert len(archive.namelist()) == 2
+
+
+def test_bad_archives_and_members(client, app, make_user):
+    _, headers = make_user(app, 'owner@example.com')
+    assert client.post('/image/import', headers=headers).status_code == 400
+    assert _import(client, headers, b'not a zip').get_json()['error'] == 'Not a zip archive'
+    assert _import(client, headers, _zip({'images/1.png': b''})).get_json()['error'] == \
+        'Archive has no valid manifest.json'
+
+    png = io.BytesIO()
+    PILImage.new('RGB', (4, 4)).save(png, format='PNG')
+    manifest = {'version': 1, 'images': [
+        {'file': 'images/1.png', 'prompt': 'fine', 'generated_at': '2024-05-01T12:00:00+02:00'},
+        {'file': 'images/2.png', 'prompt': 'broken'},
+        {'file': 'images/3.txt', 'prompt': 'text'},
+        {'file': 'images/4.png', 'prompt': 7},
+    ]}
+    response = _import(client, headers, _zip({
+        'manifest.json': json.dumps(manifest), 'images/1.png': png.getvalue(), 'images/2.png': b'not a png',
+        'images/3.txt': b'text', 'images/4.png': png.getvalue(), 'extra.png': png.getvalue()}))
+    assert response.get_json() == {'imported': 1, 'skipped': 0, 'failed': [
+        {'file': 'images/2.png', 'error': 'not a readable image'},
+        {'file': 'images/3.txt', 'error': 'unsupported file type'},
+        {'file': 'images/4.png', 'error': 'prompt must be a string'},
+    ]}
+    image = client.get('/image/user-images', headers=headers).get_json()['images'][0]
+    assert (image['prompt'], image['generated_at']) == ('fine', '2024-05-01T10:00:00')
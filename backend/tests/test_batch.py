@@ -0,0 +1,50 @@
+# tests/test_batch.py
+
+from models import db, Image
+
+
+def test_batch_reports_every_item(client, app, make_user, wait_for_job):
+    _, headers = make_user(app, 'batch@example.com')
+
+    response = client.post('/image/generate/batch', headers=headers, json={
+        'prompts': [{'customPrompt': 'a red fox'}, {'customPrompt': 'a blue heron'}]})
+    assert response.status_code == 202
+
+    job = wait_for_job(client, response.get_json()['job']['id'], headers)
+    assert job['status'] == 'done'
+    assert [item['index'] for item in job['items']] == [0, 1]
+    assert [item['image']['prompt'] for item in job['items']] == ['a red fox', 'a blue heron']
+
+
+def test_bad_prompt_rejects_the_whole_batch(client, app, make_user):
+    _, headers = make_user(app, 'batch@example.com')
+
+    response = client.post('/image/generate/batch', headers=headers, json={
+        'prompts': [{'customPrompt': 'a red fox'}, {'customPrompt': ''}]})
+    assert response.status_code == 400
+    assert response.get_json()['error'].startswith('Prompt 1:')
+
+
+def test_reused_image_ids_do_not_leak_into_old_jobs(client, app, make_user, wait_for_job):
+    _, owner = make_user(app, 'owner@example.com')
+    other_id, _ = make_user(app, 'other@example.com')
+
+    single = client.post('/image/generate', headers=owner, json={'customPrompt': 'a red fox'})
+    batch = client.post('/image/generate/batch', headers=owner, json={
+        'prompts': [{'customPrompt': 'a blue heron'}, {'customPrompt': 'a grey owl'}]})
+    single_id, batch_id = single.get_json()['job']['id'], batch.get_json()['job']['id']
+    image_ids = [wait_for_job(client, single_id, owner)['image']['id']]
+    image_ids += [item['image']['id'] for item in wait_for_job(client, batch_id, owner)['items']]
+
+    for image_id in image_ids:
+        assert client.delete(f'/image/api/images/{image_id}', headers=owner).status_code == 200
+    # SQLite hands the freed ids to the next rows; here another user's
+    with app.app_context():
+        db.session.add_all([Image(id=image_id, prompt='not yours', image_path='images/other.png', user_id=other_id)
+                            for image_id in image_ids])
+        db.session.commit()
+
+    job = client.get(f'/image/jobs/{single_id}', headers=owner).get_json()
+    assert job['status'] == 'done' and 'image' not in job
+    job = client.get(f'/image/jobs/{batch_id}', headers=owner).get_json()
+    assert job['items'] == [{'index': 0, 'error': 'Image was deleted'}, {'index': 1, 'error': 'Image was deleted'}]
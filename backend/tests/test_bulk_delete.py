@@ -0,0 +1,100 @@
+# tests/test_bulk_delete.py
+
+import os
+import time
+
+import pytest
+from sqlalchemy import event
+
+from models import db, Image, StoredFile
+
+OLD = time.time() - 7200
+
+
+def _generate(client, headers, wait_for_job, prompt):
+    response = client.post('/image/generate', json={'customPrompt': prompt}, headers=headers)
+    return wait_for_job(client, response.get_json()['job']['id'], headers)['image']
+
+
+def _wait_until_gone(path, timeout=5):
+    deadline = time.monotonic() + timeout
+    while path.exists():
+        assert time.monotonic() < deadline, f"{path} was not reaped"
+        time.sleep(0.02)
+
+
+def _write(path, data=b'bytes', mtime=OLD):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(data)
+    os.utime(path, (mtime, mtime))
+
+
+@pytest.mark.parametrize('ids', [None, [], ['1'], [True], [1, 2, 3]])
+def test_bad_id_lists_are_rejected(make_app, make_user, ids):
+    app = make_app(BULK_DELETE_MAX_IDS=2)
+    _, headers = make_user(app, 'bulk@example.com')
+    response = app.test_client().delete('/image/api/images', json={'ids': ids}, headers=headers)
+    assert response.status_code == 400
+
+
+def test_one_statement_deletes_only_the_callers_images(client, app, make_user, wait_for_job, tmp_path):
+    _, owner = make_user(app, 'owner@example.com')
+    _, other = make_user(app, 'other@example.com')
+    mine = [_generate(client, owner, wait_for_job, f'fox {n}')['id'] for n in range(3)]
+    theirs = _generate(client, other, wait_for_job, 'heron')
+    stored = tmp_path / 'static' / theirs['url'].split('/static/')[-1]
+
+    statements = []
+
+    def record(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', record)
+    try:
+        response = client.delete('/image/api/images', json={'ids': [*mine[:2], theirs['id'], 9999]}, headers=owner)
+    finally:
+        event.remove(engine, 'before_cursor_execute', record)
+
+    assert response.status_code == 200
+    assert response.get_json() == {'deleted': sorted(mine[:2]), 'not_found': sorted([theirs['id'], 9999])}
+    assert sum(statement.startswith('DELETE FROM images') for statement in statements) == 1
+    with app.app_context():
+        assert sorted(image.id for image in Image.query) == sorted([mine[2], theirs['id']])
+        # All four rows shared the placeholder's bytes; two still refer to it
+        assert db.session.get(StoredFile, theirs['url'].split('/static/')[-1]).refcount == 2
+    assert stored.is_file()
+
+    client.delete('/image/api/images', json={'ids': [mine[2]]}, headers=owner)
+    client.delete('/image/api/images', json={'ids': [theirs['id']]}, headers=other)
+    _wait_until_gone(stored)
+
+
+def test_gc_removes_only_unreferenced_files(make_app, make_user, tmp_path):
+    app = make_app(cli=True)
+    user_id, _ = make_user(app, 'gc@example.com')
+    static = tmp_path / 'static' / 'images'
+    _write(static / 'kept.png')
+    _write(static / 'kept_w256.webp')
+    _write(static / 'orphan.png', b'orphan')
+    _write(static / 'orphan_w256.webp', b'orphan')
+    _write(static / 'fresh.png', mtime=time.time())
+    _write(static / 'placeholder.png')
+    with app.app_context():
+        db.session.add_all([Image(prompt='kept', image_path='images/kept.png', user_id=user_id),
+                            Image(prompt='gone', image_path='images/gone.png', user_id=user_id)])
+        db.session.commit()
+    runner = app.test_cli_runner()
+
+    result = runner.invoke(args=['storage-gc', '--dry-run', '--batch-size', '2'])
+    assert 'Scanned 6 files. Found 2 orphaned (12 bytes)' in result.output
+    assert (static / 'orphan.png').is_file()
+
+    result = runner.invoke(args=['storage-gc', '--batch-size', '2', '--missing-rows', 'delete'])
+    assert 'Removed 2 orphaned (12 bytes)' in result.output
+    assert 'Checked 2 rows, 1 point at missing files' in result.output
+    assert sorted(path.name for path in static.iterdir()) == [
+        'fresh.png', 'kept.png', 'kept_w256.webp', 'placeholder.png']
+    with app.app_context():
+        assert [image.prompt for image in Image.query] == ['kept']
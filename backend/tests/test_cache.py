@@ -0,0 +1,166 @@
+# tests/test_cache.py
+
+import asyncio
+import threading
+
+import pytest
+
+from utils.cache import MemoryBackend, PromptCache
+
+
+async def run_inline(fn, *args):
+    return fn(*args)
+
+
+def memory_cache():
+    cache = PromptCache()
+    cache.backend = MemoryBackend(max_entries=10, ttl=60)
+    return cache
+
+
+def test_async_flight_runs_compute_once():
+    cache = memory_cache()
+    runs = []
+
+    async def compute():
+        runs.append(1)
+        await asyncio.sleep(0.05)
+        return {'image_path': 'a.png'}
+
+    async def main():
+        return await asyncio.gather(*(cache.get_or_compute_async('k', compute, run_inline) for _ in range(5)))
+
+    results = asyncio.run(main())
+    assert len(runs) == 1
+    assert sorted(hit for _, hit in results) == [False, True, True, True, True]
+    assert all(value == {'image_path': 'a.png'} for value, _ in results)
+    assert cache.stats()['misses'] == 1 and cache.stats()['coalesced'] == 4
+    # The next caller is a plain hit
+    assert asyncio.run(cache.get_or_compute_async('k', compute, run_inline)) == ({'image_path': 'a.png'}, True)
+
+
+def test_async_flight_shares_the_error_and_is_cleared():
+    cache = memory_cache()
+    runs = []
+
+    async def fail():
+        runs.append(1)
+        await asyncio.sleep(0.05)
+        raise RuntimeError('model down')
+
+    async def main():
+        return await asyncio.gather(*(cache.get_or_compute_async('k', fail, run_inline) for _ in range(3)),
+                                    return_exceptions=True)
+
+    errors = asyncio.run(main())
+    assert len(runs) == 1
+    assert all(isinstance(error, RuntimeError) for error in errors)
+    assert not cache._flights and cache.backend.get('k') is None
+
+    async def succeed():
+        return {'image_path': 'b.png'}
+
+    assert asyncio.run(cache.get_or_compute_async('k', succeed, run_inline)) == ({'image_path': 'b.png'}, False)
+
+
+def test_sync_and_async_misses_share_one_flight():
+    cache = memory_cache()
+    runs = []
+    started, release = threading.Event(), threading.Event()
+
+    def compute():
+        runs.append('sync')
+        started.set()
+        release.wait(5)
+        return {'image_path': 'a.png'}
+
+    async def compute_async():
+        runs.append('async')
+        return {'image_path': 'b.png'}
+
+    thread_result = []
+    thread = threading.Thread(target=lambda: thread_result.append(cache.get_or_compute('k', compute)))
+    thread.start()
+    assert started.wait(5)
+    threading.Timer(0.05, release.set).start()
+    # The coroutine misses while the thread computes, and waits for it
+    result = asyncio.run(cache.get_or_compute_async('k', compute_async, run_inline))
+    thread.join(5)
+
+    assert runs == ['sync']
+    assert thread_result == [({'image_path': 'a.png'}, False)]
+    assert result == ({'image_path': 'a.png'}, True)
+    assert not cache._flights
+
+
+def test_threads_stop_waiting_on_a_stuck_flight():
+    cache = memory_cache()
+    cache.flight_wait = 0.05
+    started, release = threading.Event(), threading.Event()
+
+    def stuck():
+        started.set()
+        release.wait(5)
+        return {'image_path': 'a.png'}
+
+    leader = threading.Thread(target=cache.get_or_compute, args=('k', stuck))
+    leader.start()
+    assert started.wait(5)
+
+    assert cache.get_or_compute('k', lambda: {'image_path': 'b.png'}) == ({'image_path': 'b.png'}, False)
+    release.set()
+    leader.join(5)
+
+
+class LateBackend(MemoryBackend):
+    """Misses the first get, as if another caller's flight landed just after it"""
+
+    def __init__(self):
+        super().__init__(max_entries=10, ttl=60)
+        self.missed = False
+
+    def get(self, key):
+        if not self.missed:
+            self.missed = True
+            self.set(key, {'image_path': 'landed.png'})
+            return None
+        return super().get(key)
+
+
+def test_leader_rechecks_before_computing():
+    cache = PromptCache()
+    cache.backend = LateBackend()
+    assert cache.get_or_compute('k', lambda: pytest.fail('computed again')) == ({'image_path': 'landed.png'}, True)
+
+    cache.backend = LateBackend()
+
+    async def compute():
+        pytest.fail('computed again')
+
+    assert asyncio.run(cache.get_or_compute_async('k', compute, run_inline)) == ({'image_path': 'landed.png'}, True)
+    assert not cache._flights
+
+
+@pytest.mark.parametrize('backend', ['memory', 'sqlite'])
+def test_concurrent_async_generations_share_one_model_run(make_app, make_user, wait_for_job, backend):
+    app = make_app(GENERATION_ASYNC=True, PROMPT_CACHE_ENABLED=True, PROMPT_CACHE_BACKEND=backend,
+                   FAKE_GENERATION_LATENCY=0.3)
+    client = app.test_client()
+    _, headers = make_user(app, 'cache@example.com')
+    cache = app.extensions['prompt_cache']
+    before = cache.stats()  # the counters live on the module singleton
+
+    job_ids = [client.post('/image/generate', json={'customPrompt': 'a red  fox'},
+                           headers=headers).get_json()['job']['id'] for _ in range(4)]
+    images = [wait_for_job(client, job_id, headers)['image'] for job_id in job_ids]
+
+    stats = cache.stats()
+    assert stats['misses'] - before['misses'] == 1
+    assert stats['coalesced'] - before['coalesced'] == 3
+    assert len({image['url'] for image in images}) == 1
+    assert len({image['id'] for image in images}) == 4
+
+
+def test_apps_without_the_cache_do_not_inherit_one(make_app):
+    assert make_app(PROMPT_CACHE_ENABLED=True, PROMPT_CACHE_BACKEND='memory').extensions['prompt_cache'].enabled
+    assert not make_app().extensions['prompt_cache'].enabled
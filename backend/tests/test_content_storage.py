@@ -0,0 +1,80 @@
+# tests/test_content_storage.py
+
+import hashlib
+import time
+
+from models import db, Image, StoredFile
+from utils.storage import content_path, is_content_path
+
+
+def _generate(client, headers, wait_for_job, prompt):
+    response = client.post('/image/generate', json={'customPrompt': prompt}, headers=headers)
+    return wait_for_job(client, response.get_json()['job']['id'], headers)['image']
+
+
+def _wait_until_gone(path, timeout=5):
+    deadline = time.monotonic() + timeout
+    while path.exists():
+        assert time.monotonic() < deadline, f"{path} was not reaped"
+        time.sleep(0.02)
+
+
+def test_content_paths_are_sharded_by_digest():
+    digest = hashlib.sha256(b'png bytes').hexdigest()
+    key = content_path(digest, '.png')
+    assert key == f'images/{digest[:2]}/{digest[2:4]}/{digest}.png'
+    assert is_content_path(key)
+    assert not is_content_path('images/user_1_20240101.png')
+
+
+def test_identical_images_share_one_counted_file(client, app, make_user, wait_for_job, tmp_path):
+    _, headers = make_user(app, 'storage@example.com')
+
+    # The fake provider writes the same placeholder bytes every time
+    first = _generate(client, headers, wait_for_job, 'a fox')
+    second = _generate(client, headers, wait_for_job, 'a heron')
+    key = first['url'].split('/static/')[-1]
+    assert second['url'] == first['url'] and is_content_path(key)
+    stored = tmp_path / 'static' / key
+    assert hashlib.sha256(stored.read_bytes()).hexdigest() in key
+    assert [path.name for path in (tmp_path / 'static').rglob('*.png')] == [stored.name]
+    with app.app_context():
+        assert db.session.get(StoredFile, key).refcount == 2
+
+    # The file outlives every row but the last
+    assert client.delete(f"/image/api/images/{first['id']}", headers=headers).status_code == 200
+    with app.app_context():
+        assert db.session.get(StoredFile, key).refcount == 1
+    assert stored.is_file()
+
+    assert client.delete(f"/image/api/images/{second['id']}", headers=headers).status_code == 200
+    with app.app_context():
+        assert db.session.get(StoredFile, key) is None
+    _wait_until_gone(stored)
+
+
+def test_migrate_moves_flat_files_into_the_sharded_layout(make_app, make_user, tmp_path):
+    app = make_app(cli=True)
+    user_id, _ = make_user(app, 'storage@example.com')
+    flat = tmp_path / 'static' / 'images' / 'user_1_20240101.png'
+    flat.parent.mkdir(parents=True)
+    flat.write_bytes(b'flat png bytes')
+    with app.app_context():
+        db.session.add_all([Image(prompt='one', image_path='images/user_1_20240101.png', user_id=user_id),
+                            Image(prompt='two', image_path='images/user_1_20240101.png', user_id=user_id),
+                            Image(prompt='gone', image_path='images/user_1_19990101.png', user_id=user_id)])
+        db.session.commit()
+
+    result = app.test_cli_runner().invoke(args=['storage-migrate'])
+    assert 'Migration complete: 1 moved, 1 missing' in result.output
+    key = content_path(hashlib.sha256(b'flat png bytes').hexdigest(), '.png')
+    assert not flat.exists()
+    assert (tmp_path / 'static' / key).read_bytes() == b'flat png bytes'
+    with app.app_context():
+        assert {image.prompt: image.image_path for image in Image.query} == {
+            'one': key, 'two': key, 'gone': 'images/user_1_19990101.png'}
+        assert db.session.get(StoredFile, key).refcount == 2
+
+    # Running it again finds nothing left to move
+    result = app.test_cli_runner().invoke(args=['storage-migrate'])
+    assert 'Migration complete: 0 moved, 1 missing' in result.output
@@ -0,0 +1,74 @@
+# tests/test_derivatives.py
+
+import json
+
+from PIL import Image as PILImage
+
+from models import db, Image
+from utils.derivatives import make_derivatives, srcset, supported_formats, variant_paths
+
+
+def test_variants_cover_each_width_and_format(tmp_path):
+    source = tmp_path / 'source.png'
+    PILImage.new('RGBA', (800, 400), (200, 40, 40, 255)).save(source)
+
+    variants = make_derivatives(str(source), str(tmp_path / 'work'), 'images/ab/cd/abcd.png', [256, 512, 1024],
+                                ['webp', 'jpeg'])
+    assert variants == {
+        'webp': {'256': 'images/ab/cd/abcd_w256.webp', '512': 'images/ab/cd/abcd_w512.webp',
+                 '800': 'images/ab/cd/abcd_w800.webp'},
+        'jpeg': {'256': 'images/ab/cd/abcd_w256.jpg', '512': 'images/ab/cd/abcd_w512.jpg',
+                 '800': 'images/ab/cd/abcd_w800.jpg'},
+    }
+    with PILImage.open(tmp_path / 'work' / 'images/ab/cd/abcd_w256.webp') as small:
+        assert (small.format, small.size) == ('WEBP', (256, 128))
+    with PILImage.open(tmp_path / 'work' / 'images/ab/cd/abcd_w800.jpg') as full:
+        assert (full.format, full.mode) == ('JPEG', 'RGB')
+    assert not list((tmp_path / 'work').rglob('*.part'))
+
+
+def test_srcset_lists_widths_in_order():
+    variants = json.dumps({'webp': {'1024': 'b_w1024.webp', '256': 'b_w256.webp'}})
+    assert srcset(variants, lambda path: f'/static/{path}') == {
+        'webp': '/static/b_w256.webp 256w, /static/b_w1024.webp 1024w'}
+    assert sorted(variant_paths(variants)) == ['b_w1024.webp', 'b_w256.webp']
+    assert srcset(None, str) == {} and variant_paths(None) == []
+    assert supported_formats(['webp', 'gif']) == ['webp']
+
+
+def test_generated_images_come_with_a_srcset(make_app, make_user, wait_for_job):
+    app = make_app(DERIVATIVES_ENABLED=True, DERIVATIVE_WIDTHS=[256], DERIVATIVE_FORMATS=['webp', 'png'])
+    client = app.test_client()
+    _, headers = make_user(app, 'derivatives@example.com')
+
+    response = client.post('/image/generate', json={'customPrompt': 'a lighthouse'}, headers=headers)
+    image = wait_for_job(client, response.get_json()['job']['id'], headers)['image']
+    # The placeholder is 768px wide
+    assert sorted(image['srcset']) == ['png', 'webp']
+    urls = [entry.split()[0] for entry in image['srcset']['webp'].split(', ')]
+    assert [entry.split()[1] for entry in image['srcset']['webp'].split(', ')] == ['256w', '768w']
+    for url in urls:
+        assert client.get(url).status_code == 200
+
+    listed = client.get('/image/user-images', headers=headers).get_json()['images'][0]
+    assert listed['srcset'] == image['srcset']
+
+
+def test_backfill_derives_rows_without_variants(make_app, make_user, tmp_path):
+    app = make_app(cli=True, DERIVATIVES_ENABLED=True, DERIVATIVE_WIDTHS=[64], DERIVATIVE_FORMATS=['webp'])
+    user_id, _ = make_user(app, 'derivatives@example.com')
+    (tmp_path / 'static' / 'images').mkdir(parents=True)
+    PILImage.new('RGB', (128, 128)).save(tmp_path / 'static' / 'images' / 'old.png')
+    with app.app_context():
+        db.session.add_all([Image(prompt='old', image_path='images/old.png', user_id=user_id),
+                            Image(prompt='old again', image_path='images/old.png', user_id=user_id),
+                            Image(prompt='gone', image_path='images/missing.png', user_id=user_id)])
+        db.session.commit()
+
+    result = app.test_cli_runner().invoke(args=['backfill-variants'])
+    assert 'Backfill complete: 2 done, 1 failed' in result.output
+    with app.app_context():
+        variants = {image.prompt: image.variants for image in Image.query}
+    assert json.loads(variants['old']) == {'webp': {'64': 'images/old_w64.webp', '128': 'images/old_w128.webp'}}
+    assert variants['old again'] == variants['old'] and variants['gone'] is None
+    assert (tmp_path / 'static' / 'images' / 'old_w64.webp').is_file()
@@ -0,0 +1,183 @@
+# tests/test_events.py
+"""Job event streams: who may open them, and that under the gunicorn config
+one gevent worker keeps serving everything else while hundreds are open."""
+
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import pytest
+import requests
+
+from models import db, GenerationJob
+from utils.events import stream_token
+
+BACKEND = Path(__file__).resolve().parent.parent
+STREAMS = 200
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture
+def gunicorn(tmp_path):
+    """Start `gunicorn wsgi:app` with gunicorn.conf.py and one worker;
+    keyword arguments become environment variables. Returns the base URL."""
+    servers = []
+
+    def start(**env):
+        port = free_port()
+        env = {
+            **os.environ,
+            'PORT': str(port),
+            'WEB_CONCURRENCY': '1',
+            'JWT_SECRET_KEY': 'test-only-secret-long-enough-for-hs256',
+            'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'app.db'}",
+            'IMAGE_STORAGE_ROOT': str(tmp_path / 'static'),
+            'IMAGE_SCRATCH_DIR': str(tmp_path / 'scratch'),
+            'GENERATION_BACKEND': 'fake',
+            'QUOTAS_ENABLED': 'false',
+            'LEDGER_ENABLED': 'false',
+            'ACCESS_LOG_SAMPLE_RATE': '0',
+            **env,
+        }
+        process = subprocess.Popen([sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'wsgi:app'],
+                                   cwd=BACKEND, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        servers.append(process)
+        base = f'http://127.0.0.1:{port}'
+        deadline = time.monotonic() + 30
+        while True:
+            assert process.poll() is None, process.stderr.read().decode()
+            try:
+                requests.get(f'{base}/auth/verify-token', timeout=1)
+                return base
+            except requests.ConnectionError:
+                assert time.monotonic() < deadline, "gunicorn did not start"
+                time.sleep(0.1)
+
+    yield start
+    for process in servers:
+        process.terminate()
+        process.wait(timeout=30)
+        process.stderr.close()
+
+
+def open_stream(base, job_id, token):
+    """Send the SSE request and read up to the first event; the socket stays open"""
+    host, port = base.removeprefix('http://').split(':')
+    sock = socket.create_connection((host, int(port)), timeout=10)
+    sock.sendall(f'GET /image/jobs/{job_id}/events?token={token} HTTP/1.1\r\n'
+                 f'Host: {host}\r\nAccept: text/event-stream\r\n\r\n'.encode())
+    received = b''
+    while b'data:' not in received:
+        chunk = sock.recv(4096)
+        assert chunk, received
+        received += chunk
+    assert received.startswith(b'HTTP/1.1 200'), received
+    return sock, received
+
+
+def read_event(sock, received, status, timeout=10):
+    """Read the stream until an event with the given status arrives"""
+    sock.settimeout(timeout)
+    while True:
+        for block in received.split(b'\n\n'):
+            for line in block.split(b'\n'):
+                if line.startswith(b'data:') and json.loads(line[5:])['status'] == status:
+                    return json.loads(line[5:])
+        chunk = sock.recv(4096)
+        assert chunk, received
+        received += chunk
+
+
+def test_events_url_opens_only_its_own_job(make_app, make_user):
+    app = make_app()
+    client = app.test_client()
+    _, headers = make_user(app, 'watcher@example.com')
+
+    def generate():
+        response = client.post('/image/generate', json={'customPrompt': 'a lighthouse'}, headers=headers)
+        return response.get_json()['job']
+
+    job, other = generate(), generate()
+    # No Authorization header: the URL's token is enough, and the access token is not in it
+    response = client.get(job['events_url'])
+    assert response.status_code == 200
+    events = [json.loads(line[5:]) for line in response.get_data(as_text=True).splitlines()
+              if line.startswith('data:')]
+    assert events[-1]['id'] == job['id'] and events[-1]['status'] == 'done'
+    assert headers['Authorization'].removeprefix('Bearer ') not in job['events_url']
+
+    token = job['events_url'].split('token=')[1]
+    assert client.get(f"/image/jobs/{other['id']}/events?token={token}").status_code == 401
+    assert client.get(f"/image/jobs/{job['id']}/events?token=forged").status_code == 401
+    assert client.get(f"/image/jobs/{job['id']}/events").status_code == 401
+    access_token = headers['Authorization'].removeprefix('Bearer ')
+    assert client.get(f"/image/jobs/{job['id']}/events?jwt={access_token}").status_code == 401
+    # Bearer auth still works for clients that can send headers
+    assert client.get(f"/image/jobs/{job['id']}/events", headers=headers).status_code == 200
+
+
+def test_stream_tokens_expire(make_app, make_user):
+    app = make_app(JOB_EVENTS_TOKEN_TTL=-1)
+    client = app.test_client()
+    _, headers = make_user(app, 'watcher@example.com')
+
+    job = client.post('/image/generate', json={'customPrompt': 'a fox'}, headers=headers).get_json()['job']
+    assert client.get(job['events_url']).status_code == 401
+
+
+def test_open_streams_do_not_exhaust_the_worker(make_app, make_user, gunicorn):
+    app = make_app()
+    user_id, headers = make_user(app, 'watcher@example.com')
+    with app.app_context():
+        jobs = [GenerationJob(user_id=user_id, payload='{}') for _ in range(STREAMS)]
+        db.session.add_all(jobs)
+        db.session.commit()
+        job_ids = [job.id for job in jobs]
+        tokens = [stream_token(job_id, user_id) for job_id in job_ids]
+
+    # The async path runs on the utils/aio loop thread; derivatives and
+    # password hashes go to spawn process pools
+    base = gunicorn(GENERATION_ASYNC='true', FAKE_GENERATION_LATENCY='0.2',
+                    DERIVATIVES_ENABLED='true', DERIVATIVE_WORKERS='1', PASSWORD_HASH_WORKERS='1',
+                    JOB_EVENTS_HEARTBEAT='0.5')
+    streams = [open_stream(base, job_id, token) for job_id, token in zip(job_ids, tokens)]
+
+    try:
+        started = time.monotonic()
+        response = requests.get(f'{base}/image/jobs/{job_ids[0]}', headers=headers, timeout=5)
+        assert response.status_code == 200 and response.json()['status'] == 'queued'
+
+        account = {'username': 'late', 'email': 'late@example.com', 'password': 'correct horse battery'}
+        assert requests.post(f'{base}/auth/register', json=account, timeout=10).status_code == 201
+        login = requests.post(f'{base}/auth/login', json=account, timeout=10)
+        assert login.status_code == 200
+
+        generate = requests.post(f'{base}/image/generate', json={'customPrompt': 'a lighthouse at dusk'},
+                                 headers=headers, timeout=5)
+        assert generate.status_code == 202
+        job_url = generate.json()['job']['url']
+        while (job := requests.get(job_url, headers=headers, timeout=5).json())['status'] not in ('done', 'failed'):
+            assert time.monotonic() - started < 20, job
+            time.sleep(0.1)
+        assert job['status'] == 'done', job
+        assert job['image']['srcset']  # derivatives came back from the process pool
+        assert time.monotonic() - started < 20
+
+        # Jobs settled elsewhere reach their streams through the heartbeat re-check
+        with app.app_context():
+            db.session.get(GenerationJob, job_ids[-1]).status = GenerationJob.DONE
+            db.session.commit()
+        sock, received = streams[-1]
+        assert read_event(sock, received, 'done')['id'] == job_ids[-1]
+    finally:
+        for sock, _ in streams:
+            sock.close()
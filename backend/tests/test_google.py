@@ -0,0 +1,222 @@
+# tests/test_google.py
+"""Google token lookups against a stub userinfo endpoint."""
+
+import json
+import threading
+import time
+
+import pytest
+import requests
+from sqlalchemy import event
+
+from models import db, User
+from utils import http
+from utils.google import InvalidGoogleToken, google_tokens
+
+
+class Clock:
+    """Stands in for the time module inside utils.google"""
+
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def google(make_app, stub_server, monkeypatch):
+    """An app whose GOOGLE_USERINFO_URL is the stub; set stub_server.routes['/userinfo']"""
+    def make(**overrides):
+        monkeypatch.setattr(http, '_session', None)
+        monkeypatch.setenv('GOOGLE_CLIENT_ID', 'test-client')
+        app = make_app(GOOGLE_USERINFO_URL=stub_server.url('/userinfo'), **overrides)
+        contexts.append(app.app_context())
+        contexts[-1].push()
+        return app
+
+    contexts = []
+    google_tokens.clear()
+    yield make
+    google_tokens.clear()
+    for context in contexts:
+        context.pop()
+    if http._session is not None:
+        http._session.close()
+
+
+def userinfo(stub_server, body=None, status=200):
+    payload = json.dumps(body or {'email': 'ada@example.com'}).encode()
+    stub_server.routes['/userinfo'] = lambda handler: stub_server.respond(
+        handler, status, payload, {'Content-Type': 'application/json'})
+
+
+def test_answers_are_cached_for_the_ttl(google, stub_server, monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr('utils.google.time', clock)
+    google(GOOGLE_TOKEN_CACHE_TTL=300)
+    userinfo(stub_server)
+
+    assert google_tokens.verify('token-a')['email'] == 'ada@example.com'
+    clock.now += 299
+    google_tokens.verify('token-a')
+    assert len(stub_server.hits('/userinfo')) == 1
+    clock.now += 2
+    google_tokens.verify('token-a')
+    assert len(stub_server.hits('/userinfo')) == 2
+    # Each token is its own entry
+    google_tokens.verify('token-b')
+    assert len(stub_server.hits('/userinfo')) == 3
+
+
+# What https://www.googleapis.com/oauth2/v3/userinfo returns: no expiry in it
+USERINFO = {
+    'sub': '110248495921238986420',
+    'name': 'Ada Lovelace',
+    'given_name': 'Ada',
+    'family_name': 'Lovelace',
+    'picture': 'https://lh3.googleusercontent.com/a/ACg8ocJ-example=s96-c',
+    'email': 'ada@example.com',
+    'email_verified': True,
+}
+# Google access tokens are opaque
+ACCESS_TOKEN = 'ya29.a0AcM612xExampleOpaqueAccessToken0163'
+
+
+def test_ttl_never_outlives_the_token(google, stub_server, monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr('utils.google.time', clock)
+    client = google(GOOGLE_TOKEN_CACHE_TTL=300).test_client()
+    userinfo(stub_server, USERINFO)
+
+    def login(**extra):
+        response = client.post('/auth/google-login', json={'token': ACCESS_TOKEN, **extra})
+        assert response.status_code == 200, response.get_json()
+        return response.get_json()
+
+    # The client passes on the expires_in it got with the token
+    assert login(expires_in=10)['user']['email'] == 'ada@example.com'
+    clock.now += 9
+    login(expires_in=1)
+    assert len(stub_server.hits('/userinfo')) == 1
+    clock.now += 2
+    login(expires_in=3599)
+    assert len(stub_server.hits('/userinfo')) == 2
+
+    # Without it the configured TTL applies; a longer lifetime never extends it
+    clock.now += 299
+    login()
+    assert len(stub_server.hits('/userinfo')) == 2
+    clock.now += 2
+    login()
+    assert len(stub_server.hits('/userinfo')) == 3
+
+    bad = client.post('/auth/google-login', json={'token': ACCESS_TOKEN, 'expires_in': 'soon'})
+    assert bad.status_code == 400
+
+
+def test_tokeninfo_style_answers_bound_the_ttl(google, stub_server, monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr('utils.google.time', clock)
+    google(GOOGLE_TOKEN_CACHE_TTL=300)
+    userinfo(stub_server, {'email': 'ada@example.com', 'expires_in': '10'})
+
+    google_tokens.verify('token-a')
+    clock.now += 9
+    google_tokens.verify('token-a')
+    assert len(stub_server.hits('/userinfo')) == 1
+    clock.now += 2
+    google_tokens.verify('token-a')
+    assert len(stub_server.hits('/userinfo')) == 2
+
+
+def test_rejections_are_cached_briefly_and_outages_not_at_all(google, stub_server, monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr('utils.google.time', clock)
+    google(GOOGLE_TOKEN_NEGATIVE_TTL=10, HTTP_RETRIES=1, HTTP_BACKOFF_FACTOR=0)
+
+    userinfo(stub_server, {'error': 'invalid_token'}, status=401)
+    for _ in range(2):
+        with pytest.raises(InvalidGoogleToken):
+            google_tokens.verify('revoked')
+    assert len(stub_server.hits('/userinfo')) == 1
+    clock.now += 11
+    userinfo(stub_server)
+    assert google_tokens.verify('revoked')['email'] == 'ada@example.com'
+
+    # The session gives up on a 503 after its retries; nothing is cached
+    userinfo(stub_server, {'error': 'backend'}, status=503)
+    for _ in range(2):
+        with pytest.raises(requests.exceptions.RetryError):
+            google_tokens.verify('unlucky')
+    assert len(stub_server.hits('/userinfo')) == 2 + 2 * 2
+
+
+def test_concurrent_lookups_share_one_call(google, stub_server):
+    app = google()
+    release = threading.Event()
+
+    def slow(handler):
+        release.wait(5)
+        stub_server.respond(handler, 200, b'{"email": "ada@example.com"}', {'Content-Type': 'application/json'})
+
+    stub_server.routes['/userinfo'] = slow
+    results = []
+
+    def verify():
+        with app.app_context():
+            results.append(google_tokens.verify('token-a'))
+
+    coalesced = google_tokens.stats()['coalesced']  # counters live on the module singleton
+    threads = [threading.Thread(target=verify) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    # Every caller is in (or waiting on) the one flight before Google answers
+    while google_tokens.stats()['coalesced'] - coalesced < 7 and any(thread.is_alive() for thread in threads):
+        time.sleep(0.01)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert len(stub_server.hits('/userinfo')) == 1
+    assert results == [{'email': 'ada@example.com'}] * 8
+
+
+def test_concurrent_first_logins_create_one_user(google, stub_server):
+    app = google()
+    logins = 8
+    userinfo(stub_server, {'email': 'new@example.com'})
+    # Hold each INSERT until every login has looked for the user and found
+    # none, so all but one lose the race on the unique email
+    inserting = threading.Barrier(logins, timeout=5)
+    lost = []
+
+    def before_execute(conn, cursor, statement, parameters, context, executemany):
+        if statement.startswith('INSERT INTO users'):
+            inserting.wait()
+
+    def after_rollback(session):
+        lost.append(session)
+
+    responses = []
+
+    def login(index):
+        # A distinct token each, so the lookups are not coalesced
+        responses.append(app.test_client().post('/auth/google-login', json={'token': f'token-{index}'}))
+
+    event.listen(db.engine, 'before_cursor_execute', before_execute)
+    event.listen(db.session, 'after_rollback', after_rollback)
+    try:
+        threads = [threading.Thread(target=login, args=(index,)) for index in range(logins)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', before_execute)
+        event.remove(db.session, 'after_rollback', after_rollback)
+
+    assert [response.status_code for response in responses] == [200] * logins
+    assert len(lost) == logins - 1
+    assert len({response.get_json()['user']['id'] for response in responses}) == 1
+    assert User.query.filter_by(email='new@example.com').count() == 1
@@ -0,0 +1,157 @@
+# tests/test_http.py
+
+import os
+import socket
+import threading
+import time
+
+import pytest
+import requests
+
+from utils import http
+
+
+@pytest.fixture
+def http_app(make_app, monkeypatch):
+    """An app context with fast HTTP settings and a fresh shared session"""
+    def make(**overrides):
+        monkeypatch.setattr(http, '_session', None)
+        settings = {'HTTP_RETRIES': 3, 'HTTP_BACKOFF_FACTOR': 0.2, 'HTTP_CONNECT_TIMEOUT': 0.5,
+                    'HTTP_READ_TIMEOUT': 0.5, 'HTTP_POOL_MAXSIZE': 10, 'DOWNLOAD_CHUNK_SIZE': 1024}
+        app = make_app(**{**settings, **overrides})
+        context = app.app_context()
+        context.push()
+        contexts.append(context)
+        return app
+
+    contexts = []
+    yield make
+    for context in contexts:
+        context.pop()
+    if http._session is not None:
+        http._session.close()
+
+
+def test_retries_server_errors_with_backoff(http_app, stub_server):
+    http_app()
+    statuses = iter([503, 502, 200])
+    stub_server.routes['/flaky'] = lambda handler: stub_server.respond(handler, next(statuses), b'ok')
+
+    response = http.get(stub_server.url('/flaky'))
+
+    assert response.status_code == 200
+    times = [when for _, _, when in stub_server.hits('/flaky')]
+    assert len(times) == 3
+    # urllib3 retries the first failure at once, then waits factor * 2 ** (n - 1)
+    assert times[2] - times[1] >= 0.4 * 0.9
+
+
+def test_gives_up_after_the_configured_retries(http_app, stub_server):
+    http_app(HTTP_RETRIES=2, HTTP_BACKOFF_FACTOR=0)
+    stub_server.routes['/down'] = lambda handler: stub_server.respond(handler, 503)
+
+    with pytest.raises(requests.exceptions.RetryError):
+        http.get(stub_server.url('/down'))
+    assert len(stub_server.hits('/down')) == 3
+
+
+def test_read_timeout_is_retried_then_raised(http_app, stub_server):
+    http_app(HTTP_RETRIES=1, HTTP_BACKOFF_FACTOR=0, HTTP_READ_TIMEOUT=0.2)
+    stub_server.routes['/slow'] = lambda handler: (time.sleep(1), stub_server.respond(handler, body=b'late'))
+
+    start = time.monotonic()
+    # requests reports a read timeout that used up the retries as a ConnectionError
+    with pytest.raises(requests.exceptions.ConnectionError, match='Read timed out'):
+        http.get(stub_server.url('/slow'))
+    assert time.monotonic() - start < 0.9
+    assert len(stub_server.hits('/slow')) == 2
+
+
+def test_connect_timeout(http_app):
+    http_app(HTTP_RETRIES=0, HTTP_CONNECT_TIMEOUT=0.2)
+    # A listener that never accepts: once its backlog is full, new SYNs go unanswered
+    listener = socket.socket()
+    listener.bind(('127.0.0.1', 0))
+    listener.listen(0)
+    port = listener.getsockname()[1]
+    fillers = []
+    try:
+        for _ in range(4):
+            filler = socket.socket()
+            filler.setblocking(False)
+            filler.connect_ex(('127.0.0.1', port))
+            fillers.append(filler)
+
+        start = time.monotonic()
+        with pytest.raises(requests.exceptions.ConnectTimeout):
+            http.get(f'http://127.0.0.1:{port}/')
+        assert time.monotonic() - start < 1
+    finally:
+        for sock in fillers + [listener]:
+            sock.close()
+
+
+def test_connections_per_host_are_capped(http_app, stub_server):
+    app = http_app(HTTP_POOL_MAXSIZE=2)
+    stub_server.routes['/work'] = lambda handler: (time.sleep(0.1), stub_server.respond(handler, body=b'done'))
+    bodies = []
+
+    def fetch():
+        with app.app_context():
+            bodies.append(http.get(stub_server.url('/work')).content)
+
+    threads = [threading.Thread(target=fetch) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    hits = stub_server.hits('/work')
+    assert bodies == [b'done'] * 8
+    # Callers beyond the cap wait for a pooled connection rather than open more
+    assert stub_server.max_active == 2
+    assert len({port for _, port, _ in hits}) == 2
+
+
+def test_download_streams_to_the_destination(http_app, stub_server, tmp_path):
+    http_app()
+    body = os.urandom(10 * 1024 + 7)
+    stub_server.routes['/image.png'] = lambda handler: stub_server.respond(handler, body=body)
+    dest = tmp_path / 'out' / 'image.png'
+
+    assert http.download_to_file(stub_server.url('/image.png'), str(dest)) == len(body)
+    assert dest.read_bytes() == body
+    assert os.listdir(dest.parent) == ['image.png']
+
+
+def test_download_cut_off_partway_leaves_nothing_behind(http_app, stub_server, tmp_path):
+    http_app(HTTP_RETRIES=0)
+
+    def truncated(handler):
+        handler.send_response(200)
+        handler.send_header('Content-Length', '100000')
+        handler.end_headers()
+        handler.wfile.write(b'x' * 5000)
+        handler.wfile.flush()
+        handler.close_connection = True
+
+    stub_server.routes['/cut.png'] = truncated
+    dest = tmp_path / 'images' / 'cut.png'
+    dest.parent.mkdir()
+    dest.write_bytes(b'previous')
+
+    with pytest.raises(requests.exceptions.RequestException):
+        http.download_to_file(stub_server.url('/cut.png'), str(dest))
+    # The old file is untouched and the partial temp file is gone
+    assert dest.read_bytes() == b'previous'
+    assert os.listdir(dest.parent) == ['cut.png']
+
+
+def test_download_error_status_writes_nothing(http_app, stub_server, tmp_path):
+    http_app(HTTP_RETRIES=0)
+    stub_server.routes['/missing.png'] = lambda handler: stub_server.respond(handler, 404, b'nope')
+
+    dest = tmp_path / 'images' / 'missing.png'
+    with pytest.raises(Exception, match='404'):
+        http.download_to_file(stub_server.url('/missing.png'), str(dest))
+    assert os.listdir(dest.parent) == []
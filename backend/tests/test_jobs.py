@@ -0,0 +1,72 @@
+# tests/test_jobs.py
+
+from datetime import datetime, timedelta
+
+from models import db, GenerationJob
+
+
+def test_generate_is_accepted_and_settles_done(client, app, make_user, wait_for_job):
+    _, headers = make_user(app, 'jobs@example.com')
+
+    response = client.post('/image/generate', json={'customPrompt': 'a lighthouse'}, headers=headers)
+    assert response.status_code == 202
+    job = response.get_json()['job']
+    assert job['status'] == 'queued'
+    assert job['url'].endswith(f"/image/jobs/{job['id']}")
+
+    job = wait_for_job(client, job['id'], headers)
+    assert job['status'] == 'done'
+    assert job['image']['prompt'] == 'a lighthouse'
+    assert job['started_at'] and job['finished_at']
+
+
+def test_failed_generation_settles_failed(make_app, make_user, wait_for_job):
+    app = make_app(GENERATION_PROVIDERS=[{'name': 'down', 'type': 'fake', 'latency': 0.01, 'errors': [True]}])
+    client = app.test_client()
+    _, headers = make_user(app, 'jobs@example.com')
+
+    job_id = client.post('/image/generate', json={'customPrompt': 'a storm'}, headers=headers).get_json()['job']['id']
+    job = wait_for_job(client, job_id, headers)
+    assert job['status'] == 'failed'
+    assert job['error'] and 'image' not in job
+
+
+def test_jobs_are_private(client, app, make_user, wait_for_job):
+    _, owner = make_user(app, 'owner@example.com')
+    _, other = make_user(app, 'other@example.com')
+
+    job_id = client.post('/image/generate', json={'customPrompt': 'a fox'}, headers=owner).get_json()['job']['id']
+    assert client.get(f'/image/jobs/{job_id}', headers=other).status_code == 404
+    assert client.get(f'/image/jobs/{job_id}/events', headers=other).status_code == 404
+    assert client.get('/image/jobs/no-such-job', headers=owner).status_code == 404
+    assert wait_for_job(client, job_id, owner)['status'] == 'done'
+
+
+def test_startup_fails_jobs_lost_in_a_restart(make_app, make_user):
+    app = make_app()
+    user_id, _ = make_user(app, 'jobs@example.com')
+    long_ago = datetime.utcnow() - timedelta(hours=1)
+    with app.app_context():
+        jobs = {
+            'stale_queued': GenerationJob(user_id=user_id, payload='{}', created_at=long_ago),
+            'stale_running': GenerationJob(user_id=user_id, payload='{}', created_at=long_ago,
+                                           status=GenerationJob.RUNNING, started_at=long_ago),
+            # Queued a while ago but only just picked up
+            'running': GenerationJob(user_id=user_id, payload='{}', created_at=long_ago,
+                                     status=GenerationJob.RUNNING, started_at=datetime.utcnow()),
+            'queued': GenerationJob(user_id=user_id, payload='{}'),
+            'done': GenerationJob(user_id=user_id, payload='{}', created_at=long_ago, status=GenerationJob.DONE),
+        }
+        db.session.add_all(jobs.values())
+        db.session.commit()
+        ids = {name: job.id for name, job in jobs.items()}
+
+    # A new process on the same database sweeps on startup
+    app = make_app(GENERATION_JOB_TIMEOUT=600)
+    with app.app_context():
+        settled = {name: db.session.get(GenerationJob, job_id) for name, job_id in ids.items()}
+        assert {name: job.status for name, job in settled.items()} == {
+            'stale_queued': 'failed', 'stale_running': 'failed', 'running': 'running', 'queued': 'queued',
+            'done': 'done'}
+        assert settled['stale_running'].error == 'Generation was interrupted by a restart'
+        assert settled['stale_running'].finished_at is not None
@@ -0,0 +1,90 @@
+# tests/test_ledger.py
+
+import time
+from datetime import datetime
+
+import pytest
+
+from models import db, GenerationLedgerEntry, GenerationRollup
+from utils.ledger import ALL_USERS, ledger, report, top_users, write_entries
+
+
+def _entry(user_id, created_at, model='m', outcome='ok', cache='miss', model_seconds=2.0, cost=0.01):
+    return {'created_at': created_at, 'user_id': user_id, 'job_id': None, 'image_id': None, 'provider': 'p',
+            'model': model, 'outcome': outcome, 'cache': cache, 'model_seconds': model_seconds,
+            'download_seconds': 0.5 if model_seconds else None, 'bytes': 100, 'cost': cost, 'error': None}
+
+
+def _settle(app, count, timeout=5):
+    """Wait until count ledger entries are written, by the ledger thread or here"""
+    deadline = time.monotonic() + timeout
+    while True:
+        ledger.flush()
+        with app.app_context():
+            if GenerationLedgerEntry.query.count() >= count:
+                return
+        assert time.monotonic() < deadline, "ledger entries were not written"
+        time.sleep(0.02)
+
+
+def test_rollups_add_up_batch_by_batch(app, make_user):
+    alice, _ = make_user(app, 'alice@example.com')
+    bob, _ = make_user(app, 'bob@example.com')
+    with app.app_context():
+        write_entries([_entry(alice, datetime(2024, 5, 1, 10, 5)), _entry(alice, datetime(2024, 5, 1, 10, 55)),
+                       _entry(bob, datetime(2024, 5, 1, 11, 0), outcome='error', model_seconds=None, cost=None)])
+        # A later batch increments the same rows
+        write_entries([_entry(alice, datetime(2024, 5, 1, 10, 30), cache='hit', model_seconds=None, cost=0.0),
+                       _entry(alice, datetime(2024, 5, 2, 9, 0), model='other')])
+
+        hourly = report(alice, 'hour', datetime(2024, 5, 1), datetime(2024, 5, 3))
+        assert [(bucket['bucket'], bucket['model'], bucket['runs']) for bucket in hourly['buckets']] == [
+            ('2024-05-01T10:00:00', 'm', 3), ('2024-05-02T09:00:00', 'other', 1)]
+        assert hourly['models']['m'] == {
+            'runs': 3, 'errors': 0, 'cache_hits': 1, 'model_runs': 2, 'avg_model_seconds': 2.0,
+            'model_seconds': 4.0, 'download_seconds': 1.0, 'bytes': 300, 'cost': 0.02}
+
+        daily = report(ALL_USERS, 'day', datetime(2024, 5, 1), datetime(2024, 5, 2))
+        assert daily['buckets'] == [{'bucket': '2024-05-01T00:00:00', 'model': 'm', **daily['models']['m']}]
+        assert (daily['models']['m']['runs'], daily['models']['m']['errors']) == (4, 1)
+        busiest = top_users('day', datetime(2024, 5, 1), datetime(2024, 5, 3), 10)
+        assert [(row['user_id'], row['runs']) for row in busiest] == [(alice, 4), (bob, 1)]
+
+        # The rollups match the raw ledger they summarize
+        assert GenerationLedgerEntry.query.count() == 5
+        assert sum(row.runs for row in GenerationRollup.query.filter_by(user_id=ALL_USERS, granularity='hour')) == 5
+
+
+def test_generations_are_recorded_and_reported(make_app, make_user, wait_for_job):
+    app = make_app(LEDGER_ENABLED=True, LEDGER_FLUSH_INTERVAL=0.05, GENERATION_RUN_COSTS={'fake': 0.01},
+                   ADMIN_EMAILS={'admin@example.com'},
+                   GENERATION_PROVIDERS=[{'name': 'flaky', 'type': 'fake', 'latency': 0.01,
+                                          'errors': [False, False, True]}])
+    client = app.test_client()
+    user_id, headers = make_user(app, 'ledger@example.com')
+    _, admin = make_user(app, 'admin@example.com')
+
+    statuses = []
+    for prompt in ('a fox', 'a heron', 'an owl'):
+        response = client.post('/image/generate', json={'customPrompt': prompt}, headers=headers)
+        statuses.append(wait_for_job(client, response.get_json()['job']['id'], headers)['status'])
+    assert statuses == ['done', 'done', 'failed']
+    _settle(app, 3)
+
+    stats = client.get('/image/stats', query_string={'period': 'hour'}, headers=headers).get_json()
+    fake = stats['models']['fake']
+    assert (fake['runs'], fake['model_runs'], fake['cost']) == (2, 2, 0.02)
+    assert fake['bytes'] > 0 and fake['avg_model_seconds'] is not None
+    assert stats['models']['none']['errors'] == 1
+
+    overall = client.get('/api/generation-stats', headers=admin).get_json()
+    assert overall['top_users'] == [{'user_id': user_id, 'runs': 3, 'errors': 1, 'model_runs': 2, 'cost': 0.02}]
+
+
+@pytest.mark.parametrize('params', [
+    {'period': 'week'}, {'since': 'yesterday'}, {'since': '2024-05-02T00:00:00', 'until': '2024-05-01T00:00:00'},
+    {'since': '2024-05-01T00:00:00+02:00'}, {'period': 'hour', 'since': '2020-01-01T00:00:00'},
+])
+def test_bad_report_ranges(client, app, make_user, params):
+    _, headers = make_user(app, 'ledger@example.com')
+    assert client.get('/image/stats', query_string=params, headers=headers).status_code == 400
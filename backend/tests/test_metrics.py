@@ -0,0 +1,40 @@
+# tests/test_metrics.py
+
+import os
+import runpy
+from types import SimpleNamespace
+
+import pytest
+
+GUNICORN_CONF = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'gunicorn.conf.py')
+
+
+def test_metrics_are_not_served_without_a_token(client):
+    assert client.get('/metrics').status_code == 404
+
+
+@pytest.mark.parametrize('headers', [{}, {'Authorization': 'Bearer wrong'}, {'Authorization': 'scrape-me'}])
+def test_metrics_need_the_token(make_app, headers):
+    client = make_app(METRICS_TOKEN='scrape-me').test_client()
+    response = client.get('/metrics', headers=headers)
+    assert response.status_code == 401
+    assert response.headers['WWW-Authenticate'] == 'Bearer'
+
+
+def test_metrics_are_served_to_the_scraper(make_app):
+    client = make_app(METRICS_TOKEN='scrape-me').test_client()
+    client.get('/image/api/images')
+
+    response = client.get('/metrics', headers={'Authorization': 'Bearer scrape-me'})
+    assert response.status_code == 200
+    assert b'http_request_duration_seconds' in response.data
+
+
+def test_dead_workers_gauges_are_removed(tmp_path, monkeypatch):
+    monkeypatch.setenv('PROMETHEUS_MULTIPROC_DIR', str(tmp_path))
+    (tmp_path / 'gauge_livesum_4242.db').write_bytes(b'')
+    (tmp_path / 'gauge_livesum_4343.db').write_bytes(b'')
+    (tmp_path / 'counter_4242.db').write_bytes(b'')
+
+    runpy.run_path(GUNICORN_CONF)['child_exit'](None, SimpleNamespace(pid=4242))
+    assert sorted(path.name for path in tmp_path.iterdir()) == ['counter_4242.db', 'gauge_livesum_4343.db']
@@ -0,0 +1,62 @@
+# tests/test_migrations.py
+
+import os
+import sqlite3
+
+from alembic.autogenerate import compare_metadata
+from alembic.migration import MigrationContext
+from flask_migrate import downgrade, upgrade
+
+from models import db
+
+MIGRATIONS = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'migrations')
+
+
+def _tables(path):
+    with sqlite3.connect(path) as conn:
+        return {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+
+
+def _schema_drift():
+    with db.engine.connect() as conn:
+        context = MigrationContext.configure(conn, opts={
+            'include_name': lambda name, type_, parents: not (type_ == 'table' and name.startswith('images_fts'))})
+        return compare_metadata(context, db.metadata)
+
+
+def test_chain_upgrades_and_downgrades_from_empty(make_app, tmp_path):
+    app = make_app(cli=True, create_tables=False)
+    path = tmp_path / 'app.db'
+    with app.app_context():
+        upgrade(directory=MIGRATIONS)
+        assert _schema_drift() == []
+        assert {'images', 'images_fts', 'generation_ledger', 'generation_rollups'} <= _tables(path)
+
+        downgrade(directory=MIGRATIONS, revision='base')
+        assert _tables(path) == {'alembic_version'}
+
+        upgrade(directory=MIGRATIONS)
+        assert _schema_drift() == []
+
+
+def test_images_survive_the_url_column_detour(make_app, tmp_path):
+    # 5e3a8c1f7b24 turns 0abf76e31045's url column back into image_path
+    app = make_app(cli=True, create_tables=False)
+    path = tmp_path / 'app.db'
+    with app.app_context():
+        upgrade(directory=MIGRATIONS, revision='0abf76e31045')
+        with sqlite3.connect(path) as conn:
+            conn.execute("INSERT INTO users (id, username, email, password_hash) VALUES (1, 'a', 'a@x', '!')")
+            conn.execute("INSERT INTO images (prompt, url, created_at, user_id) "
+                         "VALUES ('a cat', 'images/cat.png', '2024-10-29 13:59:13', 1)")
+
+        upgrade(directory=MIGRATIONS)
+        with sqlite3.connect(path) as conn:
+            assert conn.execute("SELECT prompt, image_path, generated_at FROM images").fetchall() == [
+                ('a cat', 'images/cat.png', '2024-10-29 13:59:13')]
+            assert conn.execute("SELECT rowid FROM images_fts WHERE images_fts MATCH 'cat'").fetchall() == [(1,)]
+
+        downgrade(directory=MIGRATIONS, revision='0abf76e31045')
+        with sqlite3.connect(path) as conn:
+            assert conn.execute("SELECT prompt, url, created_at FROM images").fetchall() == [
+                ('a cat', 'images/cat.png', '2024-10-29 13:59:13')]
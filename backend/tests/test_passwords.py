@@ -0,0 +1,89 @@
+# tests/test_passwords.py
+
+import pytest
+from werkzeug.security import generate_password_hash
+
+from models import db, User
+from utils.passwords import passwords
+
+# The cheapest argon2id cost, so tests stay fast
+CHEAP_ARGON2 = {'ARGON2_TIME_COST': 1, 'ARGON2_MEMORY_COST': 8, 'ARGON2_PARALLELISM': 1}
+
+
+def _add_user(app, email, password_hash):
+    with app.app_context():
+        user = User(username=email, email=email, password_hash=password_hash)
+        db.session.add(user)
+        db.session.commit()
+        return user.id
+
+
+def _stored_hash(app, user_id):
+    with app.app_context():
+        return db.session.get(User, user_id).password_hash
+
+
+def _login(client, email, password):
+    return client.post('/auth/login', json={'email': email, 'password': password})
+
+
+@pytest.fixture
+def app(make_app):
+    return make_app(**CHEAP_ARGON2)
+
+
+def test_registration_stores_argon2id(client, app):
+    response = client.post('/auth/register', json={'username': 'new', 'email': 'new@example.com', 'password': 's3cret'})
+    assert response.status_code == 201
+    with app.app_context():
+        assert User.query.filter_by(email='new@example.com').one().password_hash.startswith('$argon2id$v=19$m=8,t=1,')
+
+    assert _login(client, 'new@example.com', 's3cret').get_json()['success']
+    assert _login(client, 'new@example.com', 'wrong').status_code == 401
+
+
+def test_werkzeug_hashes_are_upgraded_on_login(client, app):
+    user_id = _add_user(app, 'old@example.com', generate_password_hash('s3cret'))
+    legacy = _stored_hash(app, user_id)
+
+    # A wrong password never rewrites the stored hash
+    assert _login(client, 'old@example.com', 'wrong').status_code == 401
+    assert _stored_hash(app, user_id) == legacy
+
+    assert _login(client, 'old@example.com', 's3cret').status_code == 200
+    assert _stored_hash(app, user_id).startswith('$argon2id$')
+    assert _login(client, 'old@example.com', 's3cret').status_code == 200
+
+
+def test_argon2_hashes_follow_the_configured_cost(make_app):
+    app = make_app(**CHEAP_ARGON2)
+    with app.app_context():
+        cheap = passwords.hash('s3cret')
+    user_id = _add_user(app, 'argon@example.com', cheap)
+
+    app = make_app(**{**CHEAP_ARGON2, 'ARGON2_TIME_COST': 2})
+    assert _login(app.test_client(), 'argon@example.com', 's3cret').status_code == 200
+    assert '$m=8,t=2,p=1$' in _stored_hash(app, user_id)
+
+
+def test_accounts_without_a_password_cannot_log_in(client, app):
+    _add_user(app, 'google@example.com', '!')
+    assert _login(client, 'google@example.com', '!').status_code == 401
+    assert _login(client, 'nobody@example.com', 's3cret').status_code == 401
+
+
+def test_hashing_runs_in_the_pool_and_sheds_load(make_app):
+    app = make_app(PASSWORD_HASH_WORKERS=1, PASSWORD_HASH_QUEUE=0, PASSWORD_HASH_WAIT_TIMEOUT=0.05, **CHEAP_ARGON2)
+    client = app.test_client()
+    response = client.post('/auth/register', json={'username': 'pool', 'email': 'pool@example.com', 'password': 'pw'})
+    assert response.status_code == 201
+    assert passwords._pool is not None
+
+    # Hold the only slot, as a login already being hashed would
+    assert passwords._slots.acquire(timeout=1)
+    try:
+        response = _login(client, 'pool@example.com', 'pw')
+    finally:
+        passwords._slots.release()
+    assert response.status_code == 503 and response.headers['Retry-After'] == '1'
+    assert _login(client, 'pool@example.com', 'pw').status_code == 200
@@ -0,0 +1,52 @@
+# tests/test_prompts.py
+
+import json
+import timeit
+
+import pytest
+
+from models import db, GenerationJob
+from utils.prompts import CUSTOM_PROMPT_MAX_LENGTH, InvalidPrompt, parse_prompt
+
+
+def test_custom_and_guided_prompts_build_canonical_strings():
+    assert parse_prompt({'customPrompt': '  a red\n\tfox  '}).prompt == 'a red fox'
+    guided = parse_prompt({'subject': ' a fox ', 'style': 'ink', 'mood': 'calm', 'lighting': 'dusk'})
+    assert guided.prompt == 'a fox in ink style with calm mood and dusk lighting'
+    assert parse_prompt({'subject': 'a fox'}).prompt == 'a fox in style with mood and lighting'
+
+
+@pytest.mark.parametrize('payload, error', [
+    (None, 'Prompt must be an object with customPrompt or subject'),
+    ({'customPrompt': ''}, 'customPrompt: '),
+    ({'customPrompt': 'x' * (CUSTOM_PROMPT_MAX_LENGTH + 1)}, 'customPrompt: '),
+    ({'style': 'ink'}, 'subject: '),
+    ({'customPrompt': 'a fox', 'seed': 1}, 'seed: '),
+])
+def test_bad_prompts_name_the_field(payload, error):
+    with pytest.raises(InvalidPrompt, match=f'^{error}'):
+        parse_prompt(payload)
+
+
+def test_validation_stays_within_budget():
+    # Parsing and building runs on every generate request, before any quota or
+    # queue work; it has to stay far below a DB round trip
+    payload = {'subject': 'a lighthouse on a cliff', 'style': 'oil painting', 'mood': 'stormy', 'lighting': 'dusk'}
+    runs = 2000
+    per_call = min(timeit.repeat(lambda: parse_prompt(payload).prompt, number=runs, repeat=5)) / runs
+    assert per_call < 50e-6, f"{per_call * 1e6:.1f}µs per prompt"
+
+
+def test_jobs_carry_the_prompt_built_by_the_route(client, app, make_user, wait_for_job):
+    _, headers = make_user(app, 'prompts@example.com')
+
+    response = client.post('/image/generate', json={'subject': ' a  fox ', 'style': 'ink'}, headers=headers)
+    assert response.status_code == 202
+    job_id = response.get_json()['job']['id']
+    with app.app_context():
+        assert json.loads(db.session.get(GenerationJob, job_id).payload) == {
+            'prompt': 'a fox in ink style with mood and lighting'}
+    assert wait_for_job(client, job_id, headers)['image']['prompt'] == 'a fox in ink style with mood and lighting'
+
+    response = client.post('/image/generate', json={'customPrompt': 'a fox', 'seed': 1}, headers=headers)
+    assert response.status_code == 400 and response.get_json()['error'].startswith('seed: ')
@@ -0,0 +1,103 @@
+# tests/test_providers.py
+"""Routing over scripted FakeProviders: fallback, hedging and timeouts."""
+
+import asyncio
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from utils.providers import RUN_TIMEOUT_GRACE, GenerationError, ProviderRouter
+
+ROUTER_CONFIG = {
+    'GENERATION_BACKEND': 'fake',
+    'GENERATION_ROUTING': 'ordered',
+    'GENERATION_FALLBACK': True,
+    'GENERATION_HEDGE': False,
+    'GENERATION_HEDGE_DELAY': None,
+    'GENERATION_HEDGE_MIN_SAMPLES': 20,
+    'GENERATION_STATS_WINDOW': 100,
+    'GENERATION_PROVIDER_TIMEOUT': 5,
+}
+
+
+def router(providers, **config):
+    """A ProviderRouter over fake provider specs (name, latency, errors, timeout)"""
+    specs = [{'type': 'fake', 'url': f"https://{spec['name']}.test/out.png", **spec} for spec in providers]
+    return ProviderRouter(SimpleNamespace(config={**ROUTER_CONFIG, 'GENERATION_PROVIDERS': specs, **config},
+                                          extensions={}))
+
+
+def run(router):
+    start = time.perf_counter()
+    provider, output = asyncio.run(router.run('a fox'))
+    return provider, time.perf_counter() - start
+
+
+def test_falls_back_to_the_next_provider():
+    providers = router([{'name': 'a', 'latency': 0.01, 'errors': [True]}, {'name': 'b', 'latency': 0.01}])
+    assert run(providers)[0] == 'b'
+    assert providers.snapshot()['a']['error_rate'] == 1.0
+    assert providers.snapshot()['b']['samples'] == 1
+
+
+def test_without_fallback_the_first_error_fails_the_run():
+    providers = router([{'name': 'a', 'latency': 0.01, 'errors': [True]}, {'name': 'b', 'latency': 0.01}],
+                       GENERATION_FALLBACK=False)
+    with pytest.raises(GenerationError, match='a failed'):
+        run(providers)
+    assert providers.snapshot()['b']['samples'] == 0
+
+
+def test_every_provider_failing_reports_each_error():
+    providers = router([{'name': 'a', 'latency': 0.01, 'errors': [True]},
+                        {'name': 'b', 'latency': 0.01, 'errors': [True]}])
+    with pytest.raises(GenerationError, match='a: a failed.*; b: b failed'):
+        run(providers)
+
+
+def test_hedge_wins_and_the_slow_run_is_cancelled():
+    providers = router([{'name': 'slow', 'latency': 2}, {'name': 'fast', 'latency': 0.05}],
+                       GENERATION_HEDGE=True, GENERATION_HEDGE_DELAY=0.1)
+    provider, seconds = run(providers)
+    assert provider == 'fast' and seconds < 1
+    # Cancelled, not failed: the slow provider's stats are untouched
+    assert providers.snapshot()['slow']['samples'] == 0
+
+
+def test_hedge_waits_for_a_p95_without_a_fixed_delay():
+    providers = router([{'name': 'a', 'latency': 0.05}, {'name': 'b', 'latency': 0.01}],
+                       GENERATION_HEDGE=True, GENERATION_HEDGE_MIN_SAMPLES=3)
+    # Too few samples for a p95: no hedge, so a runs every time
+    assert [run(providers)[0] for _ in range(3)] == ['a', 'a', 'a']
+    assert providers.snapshot()['b']['samples'] == 0
+
+
+def test_slow_provider_times_out_and_falls_back():
+    providers = router([{'name': 'stuck', 'latency': 5, 'timeout': 0.1}, {'name': 'b', 'latency': 0.01}])
+    provider, seconds = run(providers)
+    assert provider == 'b' and seconds < 1
+    assert providers.snapshot()['stuck']['error_rate'] == 1.0
+
+    providers = router([{'name': 'stuck', 'latency': 5, 'timeout': 0.1}], GENERATION_FALLBACK=False)
+    with pytest.raises(GenerationError, match=r'stuck timed out after 0\.1s'):
+        run(providers)
+
+
+def test_run_timeout_covers_every_attempt():
+    specs = [{'name': 'a', 'timeout': 10}, {'name': 'b', 'timeout': 30}, {'name': 'c'}]
+    assert router(specs).run_timeout == 10 + 30 + 5 + RUN_TIMEOUT_GRACE
+    assert router(specs, GENERATION_FALLBACK=False).run_timeout == 30 + RUN_TIMEOUT_GRACE
+    assert router(specs, GENERATION_FALLBACK=False, GENERATION_HEDGE=True).run_timeout == 30 + 10 + RUN_TIMEOUT_GRACE
+
+
+def test_job_fails_when_the_run_outlasts_its_bound(make_app, make_user, wait_for_job, monkeypatch):
+    app = make_app(GENERATION_PROVIDERS=[{'name': 'stuck', 'type': 'fake', 'latency': 5}])
+    client = app.test_client()
+    _, headers = make_user(app, 'slow@example.com')
+    monkeypatch.setattr(ProviderRouter, 'run_timeout', 0.2)
+
+    job_id = client.post('/image/generate', json={'customPrompt': 'a fox'}, headers=headers).get_json()['job']['id']
+    job = wait_for_job(client, job_id, headers, timeout=3)
+    assert job['status'] == 'failed'
+    assert 'timed out after 0.2s' in client.get(f'/image/jobs/{job_id}', headers=headers).get_json()['error']
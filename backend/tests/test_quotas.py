@@ -0,0 +1,154 @@
+# tests/test_quotas.py
+"""Token-bucket refill and in-flight caps on both quota backends. The
+Redis one runs its Lua scripts on fakeredis."""
+
+import time
+
+import fakeredis
+import pytest
+import redis
+
+from utils.quotas import MemoryQuotaBackend, QuotaExceeded, Quotas, RedisQuotaBackend
+
+TIERS = {
+    'free': {'per_minute': 60, 'burst': 3, 'concurrent': 2},
+}
+
+
+class Clock:
+    """Stands in for the time module inside utils.quotas"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+    def time(self):
+        return self.now
+
+
+class FakeUser:
+    def __init__(self, id, tier='free'):
+        self.id = id
+        self.tier = tier
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr('utils.quotas.time', clock)
+    return clock
+
+
+@pytest.fixture(params=['memory', 'redis'])
+def backend(request):
+    if request.param == 'redis':
+        return RedisQuotaBackend(fakeredis.FakeRedis())
+    return MemoryQuotaBackend()
+
+
+@pytest.fixture
+def quotas(backend):
+    quotas = Quotas()
+    quotas.backend = backend
+    quotas.tiers = TIERS
+    return quotas
+
+
+def test_bucket_refills_at_the_rate(backend, clock):
+    # 1 token a second, 3 at most
+    assert [backend.take('u', 1, 3, 1) for _ in range(3)] == [0, 0, 0]
+    assert backend.take('u', 1, 3, 1) == pytest.approx(1)
+    clock.now += 0.5
+    assert backend.take('u', 1, 3, 1) == pytest.approx(0.5)
+    clock.now += 0.5
+    assert backend.take('u', 1, 3, 1) == 0
+    # Refill stops at the burst size
+    clock.now += 60
+    assert backend.take('u', 1, 3, 3) == 0
+    assert backend.take('u', 1, 3, 1) == pytest.approx(1)
+    # Buckets are per key
+    assert backend.take('other', 1, 3, 3) == 0
+
+
+def test_slots_are_capped_released_and_expire(backend, clock):
+    assert backend.acquire('u', 'a', 2, 10)
+    assert backend.acquire('u', 'b', 2, 10)
+    assert not backend.acquire('u', 'c', 2, 10)
+    backend.release('u', 'a')
+    assert backend.acquire('u', 'c', 2, 10)
+    # Slots a crashed worker never released lapse after their ttl
+    clock.now += 11
+    assert backend.acquire('u', 'd', 2, 10)
+    assert backend.acquire('u', 'e', 2, 10)
+
+
+def test_rate_limit_refills(quotas, clock):
+    user = FakeUser(1)
+    for _ in range(3):
+        quotas.release(user.id, quotas.acquire(user))
+    with pytest.raises(QuotaExceeded) as excinfo:
+        quotas.acquire(user)
+    assert excinfo.value.retry_after == 1
+    clock.now += 1
+    quotas.release(user.id, quotas.acquire(user))
+
+
+def test_concurrency_cap(quotas, clock):
+    user, other = FakeUser(1), FakeUser(2)
+    held = [quotas.acquire(user), quotas.acquire(user)]
+    with pytest.raises(QuotaExceeded, match='2 generations at a time'):
+        quotas.acquire(user)
+    quotas.acquire(other)
+    quotas.release(user.id, held.pop())
+    quotas.acquire(user)
+
+
+def test_rejected_request_keeps_its_tokens_and_slot(quotas, clock):
+    user = FakeUser(1)
+    held = [quotas.acquire(user), quotas.acquire(user)]
+    with pytest.raises(QuotaExceeded):
+        quotas.acquire(user)
+    for token in held:
+        quotas.release(user.id, token)
+    # The capped attempt spent no token
+    quotas.acquire(user)
+    # The rate-limited one gives its slot back, so a second slot is free
+    with pytest.raises(QuotaExceeded, match='rate limit'):
+        quotas.acquire(user)
+    clock.now += 1
+    quotas.acquire(user)
+    with pytest.raises(QuotaExceeded, match='at a time'):
+        quotas.acquire(user)
+
+
+def test_cost_over_burst_is_refused(quotas, clock):
+    with pytest.raises(ValueError, match='At most 3 images'):
+        quotas.acquire(FakeUser(1), cost=4)
+
+
+@pytest.mark.parametrize('quota_backend', ['memory', 'redis'])
+def test_failed_job_releases_its_slot(make_app, make_user, wait_for_job, monkeypatch, quota_backend):
+    server = fakeredis.FakeServer()
+    monkeypatch.setattr(redis.Redis, 'from_url', lambda url: fakeredis.FakeRedis(server=server))
+    app = make_app(QUOTAS_ENABLED=True, QUOTA_BACKEND=quota_backend, QUOTA_TIERS=TIERS,
+                   GENERATION_PROVIDERS=[{'name': 'down', 'type': 'fake', 'latency': 0.2, 'errors': [True]}])
+    client = app.test_client()
+    _, headers = make_user(app, 'quota@example.com')
+
+    def generate():
+        return client.post('/image/generate', json={'customPrompt': 'a storm'}, headers=headers)
+
+    job_ids = [generate().get_json()['job']['id'] for _ in range(2)]
+    capped = generate()
+    assert capped.status_code == 429 and capped.headers['Retry-After'] == '5'
+
+    for job_id in job_ids:
+        assert wait_for_job(client, job_id, headers)['status'] == 'failed'
+    # on_finish releases the slot just after the job row is marked failed
+    deadline = time.monotonic() + 5
+    while (response := generate()).status_code == 429:
+        assert time.monotonic() < deadline, "slots were not released"
+        time.sleep(0.02)
+    assert response.status_code == 202
@@ -0,0 +1,93 @@
+# tests/test_search.py
+
+import random
+import time
+
+import pytest
+from sqlalchemy import insert
+
+from models import db, Image
+
+
+@pytest.fixture
+def gallery(app, make_user):
+    """The caller's images by prompt, plus one of another user's"""
+    user_id, headers = make_user(app, 'search@example.com')
+    other_id, _ = make_user(app, 'other@example.com')
+    prompts = ['a red fox', 'a red fox running through a long dark forest of tall pine trees', 'a red heron',
+               'a lighthouse at dusk', 'a blue fox in the snow', 'Café in Paris']
+    with app.app_context():
+        images = [Image(prompt=prompt, image_path='images/x.png', user_id=user_id) for prompt in prompts]
+        db.session.add_all(images + [Image(prompt='a red fox', image_path='images/x.png', user_id=other_id)])
+        db.session.commit()
+        return headers, {image.prompt: image.id for image in images}
+
+
+def _search(client, headers, **params):
+    response = client.get('/image/search', query_string=params, headers=headers)
+    assert response.status_code == 200, response.get_json()
+    return [image['prompt'] for image in response.get_json()['images']]
+
+
+def test_every_word_must_match_and_shorter_prompts_rank_first(client, gallery):
+    headers, _ = gallery
+    assert _search(client, headers, q='red fox') == [
+        'a red fox', 'a red fox running through a long dark forest of tall pine trees']
+    assert _search(client, headers, q='RED') == [
+        'a red fox', 'a red heron', 'a red fox running through a long dark forest of tall pine trees']
+    assert _search(client, headers, q='red fox', limit=1) == ['a red fox']
+
+
+def test_prefixes_diacritics_and_fts_syntax(client, gallery):
+    headers, _ = gallery
+    assert _search(client, headers, q='lightho') == ['a lighthouse at dusk']
+    assert _search(client, headers, q='cafe') == ['Café in Paris']
+    # Query words are quoted; FTS operators and columns are just text
+    assert _search(client, headers, q='fox" OR owner : "u2') == []
+    assert _search(client, headers, q='NEAR(fox*') == []
+
+
+def test_the_index_follows_updates_and_deletes(client, app, gallery):
+    headers, ids = gallery
+    with app.app_context():
+        db.session.get(Image, ids['a red heron']).prompt = 'a grey heron'
+        db.session.delete(db.session.get(Image, ids['a red fox']))
+        db.session.commit()
+    assert _search(client, headers, q='heron') == ['a grey heron']
+    assert _search(client, headers, q='red') == ['a red fox running through a long dark forest of tall pine trees']
+
+
+def test_similar_prompts(client, gallery):
+    headers, ids = gallery
+    assert _search(client, headers, q='red fox in snow', mode='similar')[:2] == ['a red fox', 'a blue fox in the snow']
+    similar = client.get('/image/search', query_string={'similar_to': ids['a red fox']}, headers=headers).get_json()
+    assert similar['mode'] == 'similar'
+    assert 'a red fox' not in [image['prompt'] for image in similar['images']]
+    assert similar['images'][0]['score'] >= similar['images'][-1]['score']
+
+
+@pytest.mark.parametrize('params, status', [
+    ({}, 400), ({'q': 'fox', 'limit': 0}, 400), ({'q': 'fox', 'limit': 'x'}, 400),
+    ({'q': 'fox', 'mode': 'fuzzy'}, 400), ({'q': 'x' * 501}, 400), ({'similar_to': 9999}, 404),
+])
+def test_bad_queries(client, gallery, params, status):
+    headers, _ = gallery
+    assert client.get('/image/search', query_string=params, headers=headers).status_code == status
+
+
+def test_large_galleries_answer_in_milliseconds(client, app, make_user):
+    user_id, headers = make_user(app, 'large@example.com')
+    words = ['red', 'blue', 'fox', 'heron', 'castle', 'forest', 'dusk', 'snow', 'river', 'city', 'oil', 'ink']
+    rng = random.Random(0)
+    with app.app_context():
+        db.session.execute(insert(Image), [
+            {'prompt': ' '.join(rng.sample(words, 5)), 'image_path': 'images/x.png', 'user_id': user_id}
+            for _ in range(100_000)])
+        db.session.commit()
+
+    client.get('/image/search', query_string={'q': 'red fox'}, headers=headers)
+    started = time.perf_counter()
+    for query in ('red fox', 'castle dus', 'heron'):
+        assert len(_search(client, headers, q=query)) == 20
+    elapsed = (time.perf_counter() - started) / 3
+    assert elapsed < 0.1, f"{elapsed * 1000:.1f}ms per search"
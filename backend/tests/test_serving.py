@@ -0,0 +1,74 @@
+# tests/test_serving.py
+
+import os
+
+import pytest
+from werkzeug.http import http_date
+
+from utils.storage import IMMUTABLE_CACHE_CONTROL
+
+DIGEST = 'abcd' + '0' * 60
+KEY = f'images/ab/cd/{DIGEST}.png'
+DATA = bytes(range(256)) * 4
+
+
+@pytest.fixture
+def stored(tmp_path):
+    path = tmp_path / 'static' / KEY
+    path.parent.mkdir(parents=True)
+    path.write_bytes(DATA)
+    return path
+
+
+@pytest.fixture(params=[None, 'x-accel'])
+def mode(request):
+    return request.param
+
+
+@pytest.fixture
+def image_client(make_app, stored, mode):
+    return make_app(IMAGE_SENDFILE_MODE=mode, IMAGE_ACCEL_PREFIX='/protected/').test_client()
+
+
+def test_images_carry_their_digest_as_etag(image_client, mode):
+    response = image_client.get(f'/static/{KEY}')
+    assert response.status_code == 200
+    assert response.headers['ETag'] == f'"{DIGEST}"'
+    assert response.headers['Cache-Control'] == IMMUTABLE_CACHE_CONTROL
+    assert response.headers['Accept-Ranges'] == 'bytes'
+    assert response.mimetype == 'image/png'
+    if mode == 'x-accel':
+        assert response.headers['X-Accel-Redirect'] == f'/protected/{KEY}'
+        assert response.data == b''
+    else:
+        assert response.data == DATA
+
+    assert image_client.get('/static/images/ab/cd/missing.png').status_code == 404
+    assert image_client.get('/static/images/../../app.py').status_code == 404
+
+
+def test_revalidation_is_answered_with_304(image_client, stored):
+    for headers in ({'If-None-Match': f'"{DIGEST}"'},
+                    {'If-Modified-Since': http_date(os.stat(stored).st_mtime)}):
+        response = image_client.get(f'/static/{KEY}', headers=headers)
+        assert response.status_code == 304
+        assert response.data == b'' and 'X-Accel-Redirect' not in response.headers
+
+    response = image_client.get(f'/static/{KEY}', headers={'If-None-Match': '"stale"'})
+    assert response.status_code == 200
+
+
+def test_ranges_are_honoured(image_client, mode):
+    response = image_client.get(f'/static/{KEY}', headers={'Range': 'bytes=100-199'})
+    assert response.status_code == 206
+    assert response.headers['Content-Range'] == f'bytes 100-199/{len(DATA)}'
+    if mode is None:
+        assert response.data == DATA[100:200]
+
+    response = image_client.get(f'/static/{KEY}', headers={'Range': f'bytes={len(DATA)}-'})
+    assert response.status_code == 416
+    assert 'X-Accel-Redirect' not in response.headers
+
+    # A range against an older version falls back to the whole file
+    response = image_client.get(f'/static/{KEY}', headers={'Range': 'bytes=0-9', 'If-Range': '"stale"'})
+    assert response.status_code == 200
@@ -0,0 +1,109 @@
+# tests/test_storage.py
+
+import boto3
+import pytest
+from moto import mock_aws
+
+from utils.storage import IMMUTABLE_CACHE_CONTROL, LocalStorage, S3Storage, get_storage
+
+BUCKET = 'images-test'
+
+
+@pytest.fixture
+def aws(monkeypatch):
+    """moto's in-memory S3 with one empty bucket"""
+    for name, value in {'AWS_ACCESS_KEY_ID': 'testing', 'AWS_SECRET_ACCESS_KEY': 'testing',
+                        'AWS_DEFAULT_REGION': 'us-east-1'}.items():
+        monkeypatch.setenv(name, value)
+    with mock_aws():
+        boto3.client('s3', region_name='us-east-1').create_bucket(Bucket=BUCKET)
+        yield
+
+
+@pytest.fixture(params=['local', 's3'])
+def storage(request, tmp_path):
+    if request.param == 'local':
+        yield LocalStorage(str(tmp_path / 'static'))
+    else:
+        request.getfixturevalue('aws')
+        yield S3Storage(BUCKET, prefix='gallery/', region='us-east-1')
+
+
+def _scratch_file(tmp_path, data, name='upload.png'):
+    path = tmp_path / name
+    path.write_bytes(data)
+    return str(path)
+
+
+def test_put_get_and_delete(storage, tmp_path):
+    key = 'images/ab/cd/abcd.png'
+    src = _scratch_file(tmp_path, b'png bytes')
+    assert not storage.exists(key)
+
+    storage.put_file(key, src)
+    assert storage.exists(key)
+    # put_file takes ownership of the local file
+    assert not (tmp_path / 'upload.png').exists()
+
+    with storage.open(key) as f:
+        assert f.read() == b'png bytes'
+    assert b''.join(storage.stream(key, chunk_size=4)) == b'png bytes'
+    storage.fetch(key, str(tmp_path / 'copy.png'))
+    assert (tmp_path / 'copy.png').read_bytes() == b'png bytes'
+    assert [(listed, size) for listed, _, size in storage.iter_keys('images/')] == [(key, 9)]
+
+    storage.delete(key)
+    assert not storage.exists(key)
+    storage.delete(key)  # deleting a missing key is not an error
+    assert list(storage.iter_keys('images/')) == []
+
+
+def test_s3_objects_are_prefixed_and_cacheable(aws, tmp_path):
+    storage = S3Storage(BUCKET, prefix='gallery/', region='us-east-1')
+    storage.put_file('images/ab/cd/abcd.webp', _scratch_file(tmp_path, b'webp'))
+
+    head = boto3.client('s3', region_name='us-east-1').head_object(Bucket=BUCKET, Key='gallery/images/ab/cd/abcd.webp')
+    assert head['ContentType'] == 'image/webp'
+    assert head['CacheControl'] == IMMUTABLE_CACHE_CONTROL
+
+
+def test_s3_urls_are_presigned_unless_public(aws):
+    presigned = S3Storage(BUCKET, region='us-east-1').url_builder()('images/a.png')
+    assert f'{BUCKET}' in presigned and 'Signature' in presigned
+    public = S3Storage(BUCKET, prefix='p/', public_url='https://cdn.example.com/').url_builder()
+    assert public('images/a.png') == 'https://cdn.example.com/p/images/a.png'
+
+
+def test_backend_follows_config(make_app, aws):
+    with make_app().app_context():
+        assert isinstance(get_storage(), LocalStorage)
+    with make_app(STORAGE_BACKEND='s3', S3_BUCKET=BUCKET, S3_PREFIX='gallery/', S3_REGION='us-east-1',
+                  S3_PUBLIC_URL=None, S3_ENDPOINT_URL=None).app_context():
+        storage = get_storage()
+        assert isinstance(storage, S3Storage)
+        assert (storage.bucket, storage.prefix) == (BUCKET, 'gallery/')
+
+
+@pytest.mark.parametrize('backend', ['local', 's3'])
+def test_generated_image_lands_in_the_configured_backend(make_app, make_user, wait_for_job, aws, tmp_path, backend):
+    app = make_app(STORAGE_BACKEND=backend, S3_BUCKET=BUCKET, S3_PREFIX='gallery/', S3_REGION='us-east-1',
+                   S3_PUBLIC_URL=None, S3_ENDPOINT_URL=None)
+    _, headers = make_user(app, 'a@x')
+    client = app.test_client()
+
+    job = client.post('/image/generate', json={'customPrompt': 'a lighthouse'}, headers=headers).get_json()['job']
+    assert wait_for_job(client, job['id'], headers)['status'] == 'done'
+
+    image = client.get('/image/user-images', headers=headers).get_json()['images'][0]
+    key = image['url'].split('/static/')[-1] if backend == 'local' else image['url'].split('?')[0].split('gallery/')[-1]
+    response = client.get(f'/static/{key}')
+    with app.app_context():
+        assert get_storage().exists(key)
+    if backend == 'local':
+        assert (tmp_path / 'static' / key).is_file()
+        assert response.status_code == 200
+    else:
+        objects = boto3.client('s3', region_name='us-east-1').list_objects_v2(Bucket=BUCKET)['Contents']
+        assert [obj['Key'] for obj in objects] == [f'gallery/{key}']
+        # The app hands S3 objects off to the bucket instead of proxying them
+        assert response.status_code == 302 and 'Signature' in response.headers['Location']
@@ -0,0 +1,79 @@
+# tests/test_users.py
+
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+from models import db, User
+from utils.users import UserCache, user_cache
+
+
+@contextmanager
+def count_user_queries(app):
+    """Collect the SQL statements that read the users table"""
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if 'FROM users' in statement:
+            statements.append(statement)
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', record)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, 'before_cursor_execute', record)
+
+
+def test_authenticated_requests_reuse_the_cached_user(client, app, make_user):
+    _, headers = make_user(app, 'cache@example.com')
+    before = user_cache.stats()
+
+    with count_user_queries(app) as statements:
+        for _ in range(3):
+            response = client.get('/auth/user', headers=headers)
+            assert response.get_json()['user']['email'] == 'cache@example.com'
+        assert client.get('/auth/verify-token', headers=headers).get_json()['success']
+    assert len(statements) == 1
+    after = user_cache.stats()
+    assert (after['hits'] - before['hits'], after['misses'] - before['misses']) == (3, 1)
+
+
+def test_committed_changes_invalidate_the_entry(client, app, make_user):
+    user_id, headers = make_user(app, 'cache@example.com')
+    assert client.get('/auth/user', headers=headers).get_json()['user']['username'] == 'cache@example.com'
+
+    with app.app_context():
+        db.session.get(User, user_id).username = 'renamed'
+        db.session.rollback()
+    assert client.get('/auth/user', headers=headers).get_json()['user']['username'] == 'cache@example.com'
+
+    with app.app_context():
+        db.session.get(User, user_id).username = 'renamed'
+        db.session.commit()
+    assert client.get('/auth/user', headers=headers).get_json()['user']['username'] == 'renamed'
+
+    with app.app_context():
+        db.session.delete(db.session.get(User, user_id))
+        db.session.commit()
+    response = client.get('/auth/user', headers=headers)
+    assert response.status_code == 404 and response.get_json()['error'] == 'User not found'
+
+
+def test_entries_expire_and_the_cache_stays_bounded(app, make_user):
+    user_ids = [make_user(app, f'user{n}@example.com')[0] for n in range(4)]
+    cache = UserCache()
+    cache.ttl, cache.max_entries = 0, 3
+
+    with app.app_context():
+        assert cache.get(str(user_ids[0])).email == 'user0@example.com'
+        assert cache.get(user_ids[0]).email == 'user0@example.com'
+        assert cache.stats()['misses'] == 2
+
+        cache.ttl = 60
+        for user_id in user_ids:
+            cache.get(user_id)
+        assert cache.stats()['entries'] <= 3
+        assert cache.get(user_ids[-1]).email == 'user3@example.com'
+        assert cache.get(10_000) is None
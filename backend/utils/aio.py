@@ -0,0 +1,87 @@
+# utils/aio.py
+
+import asyncio
+import os
+import tempfile
+import threading
+
+from flask import current_app
+
+from utils.metrics import DOWNLOAD_BYTES, DOWNLOAD_SECONDS, timed
+
+
+class AsyncRunner:
+    """One event loop on a daemon thread for the network-bound job stages.
+
+    A coroutine waiting on Replicate or a download holds no worker thread,
+    so a single process can keep hundreds of generations in flight.
+    """
+
+    def __init__(self):
+        self._loop = None
+        self._client = None
+        self._lock = threading.Lock()
+
+    @property
+    def loop(self):
+        if self._loop is None:
+            with self._lock:
+                if self._loop is None:
+                    loop = asyncio.new_event_loop()
+                    threading.Thread(target=loop.run_forever, name='aio', daemon=True).start()
+                    self._loop = loop
+        return self._loop
+
+    def submit(self, coro):
+        """Schedule a coroutine on the loop; returns a concurrent Future"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def get_client(self):
+        """Shared httpx.AsyncClient; only call from coroutines on the loop"""
+        if self._client is None:
+            import httpx  # only processes that run async jobs need it
+            config = current_app.config
+            self._client = httpx.AsyncClient(
+                limits=httpx.Limits(max_connections=config['GENERATION_ASYNC_LIMIT'],
+                                    max_keepalive_connections=config['HTTP_POOL_MAXSIZE']),
+                timeout=httpx.Timeout(config['HTTP_READ_TIMEOUT'], connect=config['HTTP_CONNECT_TIMEOUT']),
+                transport=httpx.AsyncHTTPTransport(retries=config['HTTP_RETRIES']),
+                follow_redirects=True,
+            )
+        return self._client
+
+
+aio = AsyncRunner()
+
+
+async def async_download_to_file(url, dest_path):
+    """Async counterpart of utils.http.download_to_file"""
+    dest_dir = os.path.dirname(dest_path) or '.'
+    os.makedirs(dest_dir, exist_ok=True)
+    chunk_size = current_app.config['DOWNLOAD_CHUNK_SIZE']
+
+    with timed(DOWNLOAD_SECONDS):
+        size = await _stream_to_file(url, dest_dir, dest_path, chunk_size)
+    DOWNLOAD_BYTES.inc(size)
+    return size
+
+
+async def _stream_to_file(url, dest_dir, dest_path, chunk_size):
+    async with aio.get_client().stream('GET', url) as response:
+        if response.status_code != 200:
+            raise Exception(f"Failed to download image: {response.status_code}")
+
+        fd, tmp_path = tempfile.mkstemp(dir=dest_dir, suffix='.part')
+        size = 0
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                async for chunk in response.aiter_bytes(chunk_size):
+                    f.write(chunk)
+                    size += len(chunk)
+            os.replace(tmp_path, dest_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    return size
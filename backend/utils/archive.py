@@ -0,0 +1,260 @@
+# utils/archive.py
+
+import json
+import logging
+import os
+import shutil
+import tempfile
+import zipfile
+from collections import Counter
+from datetime import datetime, timezone
+
+from flask import current_app
+from sqlalchemy import func, insert, select, tuple_
+
+from models import db, Image
+from utils.reaper import ORIGINAL_EXTENSIONS
+from utils.storage import STREAM_CHUNK_SIZE, add_reference, get_storage, ingest_image
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = 'manifest.json'
+MANIFEST_VERSION = 1
+# json.load reads the manifest whole; prompts are short, so this is generous
+MANIFEST_MAX_BYTES = 64 * 1024 * 1024
+# Zip timestamps cannot predate 1980
+ZIP_EPOCH = datetime(1980, 1, 1)
+
+
+class InvalidArchive(ValueError):
+    """Raised when an uploaded archive cannot be imported at all"""
+
+
+class _ChunkSink:
+    """Write-only file object for ZipFile; written bytes are handed out by drain().
+
+    It has no tell/seek, so ZipFile writes each member with a data
+    descriptor instead of seeking back to patch its header.
+    """
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        if self._chunks:
+            data = b''.join(self._chunks)
+            self._chunks.clear()
+            yield data
+
+
+def member_name(image_id, image_path):
+    return f"images/{image_id}{os.path.splitext(image_path)[1] or '.png'}"
+
+
+def _zip_info(name, when, compress_type):
+    info = zipfile.ZipInfo(name, date_time=max(when or ZIP_EPOCH, ZIP_EPOCH).timetuple()[:6])
+    info.compress_type = compress_type
+    info.external_attr = 0o644 << 16
+    return info
+
+
+def _image_batches(user_id, max_id, batch_size):
+    """The user's image rows up to max_id, oldest first, batch_size per query.
+
+    Keyset on (generated_at, id) like the gallery, so each batch is an index
+    range read. The session is closed after every batch: a slow download
+    must not pin a pooled connection.
+    """
+    after = None
+    while True:
+        query = select(Image.id, Image.image_path, Image.prompt, Image.generated_at) \
+            .where(Image.user_id == user_id, Image.id <= max_id) \
+            .order_by(Image.generated_at, Image.id) \
+            .limit(batch_size)
+        if after:
+            query = query.where(tuple_(Image.generated_at, Image.id) > tuple_(*after))
+        rows = db.session.execute(query).all()
+        db.session.close()
+        if not rows:
+            return
+        yield rows
+        after = (rows[-1].generated_at, rows[-1].id)
+
+
+def export_archive(user_id):
+    """Yield a zip of the user's gallery, chunk by chunk, as it is built.
+
+    ``manifest.json`` comes first, with each image's file name, prompt and
+    timestamp, then the original files under ``images/``. Rows are read in
+    batches and files streamed from storage, and nothing is written to
+    disk; memory grows only by the central directory record zipfile keeps
+    per member (a few hundred bytes). Images added after the export started
+    are left out; files missing from storage are skipped.
+    """
+    storage = get_storage()
+    batch_size = current_app.config['EXPORT_BATCH_SIZE']
+    max_id = db.session.query(func.max(Image.id)).filter(Image.user_id == user_id).scalar() or 0
+    sink = _ChunkSink()
+
+    with zipfile.ZipFile(sink, 'w') as archive:
+        # First, so an importer knows every file's prompt before reaching the file
+        with archive.open(_zip_info(MANIFEST_NAME, datetime.utcnow(), zipfile.ZIP_DEFLATED), 'w') as manifest:
+            manifest.write(f'{{"version": {MANIFEST_VERSION}, '
+                           f'"exported_at": "{datetime.utcnow().isoformat()}", "images": ['.encode())
+            separator = b'\n'
+            for rows in _image_batches(user_id, max_id, batch_size):
+                for row in rows:
+                    manifest.write(separator + json.dumps({
+                        'id': row.id,
+                        'file': member_name(row.id, row.image_path),
+                        'prompt': row.prompt,
+                        'generated_at': row.generated_at.isoformat() if row.generated_at else None,
+                    }).encode())
+                    separator = b',\n'
+                yield from sink.drain()
+            manifest.write(b'\n]}\n')
+        yield from sink.drain()
+
+        for rows in _image_batches(user_id, max_id, batch_size):
+            for row in rows:
+                # Open before writing the member header, so a missing file is skipped cleanly
+                chunks = storage.stream(row.image_path)
+                try:
+                    first = next(chunks, b'')
+                except Exception as e:
+                    logger.warning("Export skipped image %s (%s): %s", row.id, row.image_path, e)
+                    continue
+                info = _zip_info(member_name(row.id, row.image_path), row.generated_at, zipfile.ZIP_STORED)
+                with archive.open(info, 'w') as member:
+                    member.write(first)
+                    for chunk in chunks:
+                        member.write(chunk)
+                        yield from sink.drain()
+                yield from sink.drain()
+    yield from sink.drain()
+
+
+def _parse_timestamp(value):
+    if value is None:
+        return datetime.utcnow()
+    generated_at = datetime.fromisoformat(value)
+    if generated_at.tzinfo is not None:
+        generated_at = generated_at.astimezone(timezone.utc).replace(tzinfo=None)
+    return generated_at
+
+
+def _ingest_member(archive, info, entry, config):
+    """Copy one archived image into storage the way a generated image is stored"""
+    ext = os.path.splitext(info.filename)[1].lower()
+    if ext not in ORIGINAL_EXTENSIONS:
+        raise ValueError("unsupported file type")
+    if info.file_size > config['IMPORT_MAX_IMAGE_BYTES']:
+        raise ValueError("file too large")
+    prompt = entry.get('prompt')
+    if prompt is not None and not isinstance(prompt, str):
+        raise ValueError("prompt must be a string")
+    generated_at = _parse_timestamp(entry.get('generated_at'))
+
+    from PIL import Image as PILImage
+    fd, path = tempfile.mkstemp(dir=config['IMAGE_SCRATCH_DIR'], suffix=ext)
+    try:
+        with os.fdopen(fd, 'wb') as dest, archive.open(info) as src:
+            shutil.copyfileobj(src, dest, STREAM_CHUNK_SIZE)
+        try:
+            with PILImage.open(path) as image:
+                image.verify()
+        except Exception:
+            raise ValueError("not a readable image")
+        image_path, variants, size = ingest_image(path)
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
+    return {'prompt': prompt, 'generated_at': generated_at,
+            'image_path': image_path, 'variants': variants, 'size': size}
+
+
+def _insert_batch(user_id, batch, stats):
+    """Insert a batch of ingested images, skipping ones the user already has"""
+    existing = {tuple(row) for row in db.session.execute(
+        select(Image.image_path, Image.generated_at)
+        .where(Image.user_id == user_id, Image.image_path.in_({item['image_path'] for item in batch}))
+    )}
+    rows = []
+    for item in batch:
+        identity = (item['image_path'], item['generated_at'])
+        if identity in existing:
+            stats['skipped'] += 1
+            continue
+        existing.add(identity)
+        rows.append(item)
+
+    if rows:
+        db.session.execute(insert(Image), [{
+            'prompt': item['prompt'],
+            'image_path': item['image_path'],
+            'variants': json.dumps(item['variants']) if item['variants'] else None,
+            'generated_at': item['generated_at'],
+            'user_id': user_id,
+        } for item in rows])
+        sizes = {item['image_path']: item['size'] for item in rows}
+        for path, count in Counter(item['image_path'] for item in rows).items():
+            add_reference(path, sizes[path], count)
+    db.session.commit()
+    stats['imported'] += len(rows)
+
+
+def import_archive(user_id, fileobj):
+    """Add the images of an exported zip to the user's gallery.
+
+    fileobj must be seekable, since a zip's index sits at its end. Files
+    are read one at a time and ingested like generated images (deduplicated
+    by content, derivatives built); rows are inserted IMPORT_BATCH_SIZE per
+    commit. An image the user already has, with the same file and
+    timestamp, is skipped, so re-importing an archive is harmless. Returns
+    counts and the files that could not be imported.
+    """
+    config = current_app.config
+    try:
+        archive = zipfile.ZipFile(fileobj)
+    except zipfile.BadZipFile:
+        raise InvalidArchive("Not a zip archive")
+
+    with archive:
+        try:
+            if archive.getinfo(MANIFEST_NAME).file_size > MANIFEST_MAX_BYTES:
+                raise InvalidArchive(f"{MANIFEST_NAME} is too large")
+            with archive.open(MANIFEST_NAME) as f:
+                manifest = json.load(f)
+            entries = {entry['file']: entry for entry in manifest['images']}
+        except InvalidArchive:
+            raise
+        except (KeyError, TypeError, ValueError, zipfile.BadZipFile):
+            raise InvalidArchive(f"Archive has no valid {MANIFEST_NAME}")
+        if len(entries) > config['IMPORT_MAX_IMAGES']:
+            raise InvalidArchive(f"At most {config['IMPORT_MAX_IMAGES']} images per import")
+
+        stats = {'imported': 0, 'skipped': 0, 'failed': []}
+        batch = []
+        for info in archive.infolist():
+            # Files the manifest does not list (and the manifest itself) are ignored
+            entry = entries.get(info.filename)
+            if entry is None or info.is_dir():
+                continue
+            try:
+                batch.append(_ingest_member(archive, info, entry, config))
+            except (TypeError, ValueError, zipfile.BadZipFile) as e:
+                stats['failed'].append({'file': info.filename, 'error': str(e)})
+                continue
+            if len(batch) >= config['IMPORT_BATCH_SIZE']:
+                _insert_batch(user_id, batch, stats)
+                batch = []
+        if batch:
+            _insert_batch(user_id, batch, stats)
+    return stats
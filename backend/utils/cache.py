@@ -0,0 +1,292 @@
+# utils/cache.py
+
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+
+from utils.metrics import CACHE_LOOKUPS
+
+
+def normalize_prompt(prompt):
+    """Canonical form used for cache keys: trimmed, single-spaced, casefolded"""
+    return ' '.join(str(prompt).split()).casefold()
+
+
+def cache_key(final_prompt, model, params=None):
+    """Stable key for a generation: normalized prompt + model id + inputs"""
+    raw = json.dumps({
+        'prompt': normalize_prompt(final_prompt),
+        'model': model,
+        'input': params or {},
+    }, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+class MemoryBackend:
+    """In-process LRU with per-entry TTL"""
+
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at < time.time():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (value, time.time() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def __len__(self):
+        return len(self._data)
+
+
+class SQLiteBackend:
+    """On-disk cache shared by every worker process on the node"""
+
+    def __init__(self, path, max_entries, ttl):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS prompt_cache ('
+                'key TEXT PRIMARY KEY, value TEXT NOT NULL, '
+                'expires_at REAL NOT NULL, last_used REAL NOT NULL)'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS ix_prompt_cache_last_used ON prompt_cache (last_used)')
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        conn = self._connect()
+        now = time.time()
+        row = conn.execute('SELECT value, expires_at FROM prompt_cache WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        if row[1] < now:
+            conn.execute('DELETE FROM prompt_cache WHERE key = ?', (key,))
+            return None
+        conn.execute('UPDATE prompt_cache SET last_used = ? WHERE key = ?', (now, key))
+        return json.loads(row[0])
+
+    def set(self, key, value):
+        conn = self._connect()
+        now = time.time()
+        conn.execute(
+            'INSERT OR REPLACE INTO prompt_cache (key, value, expires_at, last_used) VALUES (?, ?, ?, ?)',
+            (key, json.dumps(value), now + self.ttl, now)
+        )
+        # Drop expired rows, then the least recently used beyond the size cap
+        conn.execute('DELETE FROM prompt_cache WHERE expires_at < ?', (now,))
+        conn.execute(
+            'DELETE FROM prompt_cache WHERE key IN ('
+            'SELECT key FROM prompt_cache ORDER BY last_used DESC LIMIT -1 OFFSET ?)',
+            (self.max_entries,)
+        )
+
+    def delete(self, key):
+        self._connect().execute('DELETE FROM prompt_cache WHERE key = ?', (key,))
+
+    def __len__(self):
+        return self._connect().execute('SELECT COUNT(*) FROM prompt_cache').fetchone()[0]
+
+
+class PromptCache:
+    """Opt-in generation result cache with single-flight coalescing.
+
+    Concurrent callers asking for the same key while it is being computed
+    wait for the first caller's result instead of running the model again.
+    ``get_or_compute`` (threads) and ``get_or_compute_async`` (coroutines on
+    the shared event loop) share one table of in-flight keys, each a
+    ``concurrent.futures.Future``, so a key is computed once whichever side
+    asks first.
+    """
+
+    def __init__(self, app=None):
+        self.backend = None
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.flight_wait = 300
+        self._flights = {}
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.flight_wait = app.config['PROMPT_CACHE_FLIGHT_WAIT']
+        # Rebinding to an app with the cache off must not keep the last backend
+        self.backend = None
+        if app.config['PROMPT_CACHE_ENABLED']:
+            max_entries = app.config['PROMPT_CACHE_MAX_ENTRIES']
+            ttl = app.config['PROMPT_CACHE_TTL']
+            if app.config['PROMPT_CACHE_BACKEND'] == 'sqlite':
+                path = app.config['PROMPT_CACHE_PATH'] or os.path.join(app.instance_path, 'prompt_cache.db')
+                self.backend = SQLiteBackend(path, max_entries, ttl)
+            else:
+                self.backend = MemoryBackend(max_entries, ttl)
+        app.extensions['prompt_cache'] = self
+
+    @property
+    def enabled(self):
+        return self.backend is not None
+
+    def get(self, key, is_valid=None):
+        """Return a valid cached value or None, counting the lookup"""
+        value = self._lookup(key, is_valid)
+        self._count('miss' if value is None else 'hit')
+        return value
+
+    def set(self, key, value):
+        self.backend.set(key, value)
+
+    def _lookup(self, key, is_valid):
+        # A valid cached value or None; nothing is counted here
+        value = self.backend.get(key)
+        if value is not None and (is_valid is None or is_valid(value)):
+            return value
+        if value is not None:
+            # Stale entry, e.g. the cached file has since been deleted
+            self.backend.delete(key)
+        return None
+
+    def _count(self, outcome):
+        with self._lock:
+            if outcome == 'hit':
+                self.hits += 1
+            elif outcome == 'miss':
+                self.misses += 1
+            else:
+                self.coalesced += 1
+        CACHE_LOOKUPS.labels('prompt', outcome).inc()
+
+    def _join(self, key):
+        """Return (flight, leader): the future for key's computation, started
+        here when no other caller is computing it"""
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                return flight, False
+            flight = self._flights[key] = Future()
+            return flight, True
+
+    def _land(self, key, flight, value=None, error=None):
+        with self._lock:
+            del self._flights[key]
+        if error is not None:
+            flight.set_exception(error)
+        else:
+            flight.set_result(value)
+
+    def get_or_compute(self, key, compute, is_valid=None):
+        """Return (value, hit) for key, running compute() at most once at a time"""
+        value = self._lookup(key, is_valid)
+        if value is not None:
+            self._count('hit')
+            return value, True
+
+        flight, leader = self._join(key)
+        if not leader:
+            self._count('coalesced')
+            try:
+                return flight.result(timeout=self.flight_wait), True
+            except FutureTimeoutError:
+                # An async leader needs a free worker thread to finish; if
+                # every worker is waiting here, stop waiting and run it
+                value = compute()
+                self.backend.set(key, value)
+                return value, False
+
+        try:
+            # The previous flight for this key may have landed since the lookup
+            value = self._lookup(key, is_valid)
+            hit = value is not None
+            self._count('hit' if hit else 'miss')
+            if not hit:
+                value = compute()
+                self.backend.set(key, value)
+        except BaseException as e:
+            # Anything that ends the leader early must release its followers
+            self._land(key, flight, error=e)
+            raise
+        self._land(key, flight, value)
+        return value, hit
+
+    async def get_or_compute_async(self, key, compute, run_sync, is_valid=None):
+        """get_or_compute for coroutines: compute is a coroutine function and
+        run_sync(fn, *args) awaits the blocking backend calls off the loop.
+
+        A miss while the key is being computed, by a thread or a coroutine,
+        awaits that flight instead of running compute.
+        """
+        value = await run_sync(self._lookup, key, is_valid)
+        if value is not None:
+            self._count('hit')
+            return value, True
+
+        flight, leader = self._join(key)
+        if not leader:
+            self._count('coalesced')
+            # Shielded: a waiter being cancelled must not cancel the flight
+            return await asyncio.shield(asyncio.wrap_future(flight)), True
+
+        try:
+            value = await run_sync(self._lookup, key, is_valid)
+            hit = value is not None
+            self._count('hit' if hit else 'miss')
+            if not hit:
+                value = await compute()
+                await run_sync(self.backend.set, key, value)
+        except BaseException as e:  # cancellation included
+            self._land(key, flight, error=e)
+            raise
+        self._land(key, flight, value)
+        return value, hit
+
+    def stats(self):
+        # Coalesced callers were served without a model run, so count as hits
+        served = self.hits + self.coalesced
+        lookups = served + self.misses
+        return {
+            'enabled': self.enabled,
+            'entries': len(self.backend) if self.enabled else 0,
+            'hits': self.hits,
+            'misses': self.misses,
+            'coalesced': self.coalesced,
+            'hit_ratio': served / lookups if lookups else 0.0,
+        }
+
+
+prompt_cache = PromptCache()
@@ -0,0 +1,129 @@
+# utils/db.py
+
+import threading
+import time
+
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import QueuePool
+
+from models import db
+from utils.metrics import DB_POOL_TIMEOUTS, DB_POOL_WAIT
+
+
+class PoolMetrics:
+    """Process-wide connection pool counters"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self.connects = 0
+        self.invalidated = 0
+
+    def observe_wait(self, seconds, timed_out=False):
+        with self._lock:
+            if timed_out:
+                self.timeouts += 1
+            else:
+                self.checkouts += 1
+            self.wait_seconds += seconds
+            self.max_wait_seconds = max(self.max_wait_seconds, seconds)
+        if timed_out:
+            DB_POOL_TIMEOUTS.inc()
+        else:
+            DB_POOL_WAIT.observe(seconds)
+
+    def count(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+
+pool_metrics = PoolMetrics()
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that records how long callers wait for a connection"""
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            conn = super()._do_get()
+        except Exception:
+            pool_metrics.observe_wait(time.perf_counter() - start, timed_out=True)
+            raise
+        pool_metrics.observe_wait(time.perf_counter() - start)
+        return conn
+
+
+def engine_options(config):
+    """SQLALCHEMY_ENGINE_OPTIONS for the configured database URI"""
+    url = make_url(config['SQLALCHEMY_DATABASE_URI'])
+    if url.get_backend_name() == 'sqlite':
+        if url.database in (None, '', ':memory:'):
+            # In-memory SQLite lives in a single connection; keep Flask-SQLAlchemy's StaticPool
+            return {}
+        # A local file has no server-side connection to go stale, so skip pings
+        options = {}
+    else:
+        options = {
+            'pool_pre_ping': config['DB_POOL_PRE_PING'],
+            'pool_recycle': config['DB_POOL_RECYCLE'],
+        }
+    options.update({
+        'poolclass': TimedQueuePool,
+        'pool_size': config['DB_POOL_SIZE'],
+        'max_overflow': config['DB_MAX_OVERFLOW'],
+        'pool_timeout': config['DB_POOL_TIMEOUT'],
+    })
+    return options
+
+
+def init_db(app):
+    """Apply the engine profile, bind db to app and hook SQLite pragmas and pool events"""
+    options = engine_options(app.config)
+    # Explicit SQLALCHEMY_ENGINE_OPTIONS entries win over the profile
+    options.update(app.config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = options
+    db.init_app(app)
+
+    with app.app_context():
+        engine = db.engine
+        event.listen(engine, 'connect', lambda conn, record: pool_metrics.count('connects'))
+        event.listen(engine, 'invalidate', lambda conn, record, exc: pool_metrics.count('invalidated'))
+        if engine.dialect.name == 'sqlite':
+            event.listen(engine, 'connect', _sqlite_pragmas(app.config))
+
+
+def _sqlite_pragmas(config):
+    busy_timeout = config['SQLITE_BUSY_TIMEOUT_MS']
+    synchronous = config['SQLITE_SYNCHRONOUS']
+
+    def on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        # WAL lets readers run alongside the single writer; busy_timeout makes
+        # writers wait for the lock instead of failing with "database is locked"
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute(f'PRAGMA busy_timeout={int(busy_timeout)}')
+        cursor.execute(f'PRAGMA synchronous={synchronous}')
+        cursor.close()
+
+    return on_connect
+
+
+def pool_stats():
+    pool = db.engine.pool
+    stats = {
+        'pool': pool.status(),
+        'checkouts': pool_metrics.checkouts,
+        'timeouts': pool_metrics.timeouts,
+        'connects': pool_metrics.connects,
+        'invalidated': pool_metrics.invalidated,
+        'avg_wait_ms': pool_metrics.wait_seconds / pool_metrics.checkouts * 1000 if pool_metrics.checkouts else 0.0,
+        'max_wait_ms': pool_metrics.max_wait_seconds * 1000,
+    }
+    if isinstance(pool, QueuePool):
+        stats.update({'size': pool.size(), 'checked_out': pool.checkedout(), 'overflow': pool.overflow()})
+    return stats
@@ -0,0 +1,128 @@
+# utils/derivatives.py
+
+import json
+import logging
+import multiprocessing
+import os
+import threading
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+
+from flask import current_app
+
+logger = logging.getLogger(__name__)
+
+SAVE_OPTIONS = {
+    'webp': {'format': 'WEBP', 'quality': 80, 'method': 4},
+    'avif': {'format': 'AVIF', 'quality': 60},
+    'png': {'format': 'PNG', 'optimize': True},
+    'jpeg': {'format': 'JPEG', 'quality': 85, 'progressive': True},
+}
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def supported_formats(formats):
+    """Drop formats the installed Pillow cannot encode"""
+    from PIL import features
+    usable = []
+    for fmt in formats:
+        if fmt not in SAVE_OPTIONS or (fmt in ('webp', 'avif') and not features.check(fmt)):
+            logger.warning(f"Skipping unsupported derivative format: {fmt}")
+            continue
+        usable.append(fmt)
+    return usable
+
+
+def make_derivatives(source, work_dir, image_path, widths, formats):
+    """Write resized/re-encoded copies of one image into work_dir.
+
+    Runs inside a worker process, so it only takes plain arguments. Variant
+    names derive from ``image_path`` (the original's storage key). Returns
+    ``{format: {width: relative_path}}``; the source width is always
+    included so every format has a full-size entry.
+    """
+    from PIL import Image as PILImage  # only derivative workers decode images
+    stem = os.path.splitext(image_path)[0]
+    variants = {}
+
+    with PILImage.open(source) as original:
+        original.load()
+        src_width, src_height = original.size
+        targets = sorted({w for w in widths if w < src_width} | {src_width})
+
+        for fmt in formats:
+            options = SAVE_OPTIONS[fmt]
+            ext = 'jpg' if fmt == 'jpeg' else fmt
+            variants[fmt] = {}
+            for width in targets:
+                rel_path = f"{stem}_w{width}.{ext}"
+                dest = os.path.join(work_dir, rel_path)
+                os.makedirs(os.path.dirname(dest), exist_ok=True)
+                if width == src_width:
+                    resized = original
+                else:
+                    resized = original.resize((width, round(src_height * width / src_width)), PILImage.LANCZOS)
+                if fmt == 'jpeg' and resized.mode not in ('RGB', 'L'):
+                    resized = resized.convert('RGB')
+                # Unique temp name: concurrent jobs may derive the same content file
+                tmp = f"{dest}.{uuid.uuid4().hex}.part"
+                resized.save(tmp, **options)
+                os.replace(tmp, dest)
+                variants[fmt][str(width)] = rel_path
+
+    return variants
+
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                # spawn, not fork: the web process already runs job threads
+                _pool = ProcessPoolExecutor(max_workers=current_app.config['DERIVATIVE_WORKERS'],
+                                            mp_context=multiprocessing.get_context('spawn'))
+    return _pool
+
+
+def build_derivatives(source, image_path, work_dir):
+    """Derive variants of a local file on the process pool.
+
+    Returns the ``{format: {width: path}}`` map, or ``{}`` when derivatives
+    are disabled or fail; the original is still served in that case and
+    backfill-variants can retry later.
+    """
+    config = current_app.config
+    if not config['DERIVATIVES_ENABLED']:
+        return {}
+    try:
+        return get_pool().submit(
+            make_derivatives,
+            source,
+            work_dir,
+            image_path,
+            config['DERIVATIVE_WIDTHS'],
+            supported_formats(config['DERIVATIVE_FORMATS']),
+        ).result()
+    except Exception as e:
+        logger.error(f"Derivative generation failed for {image_path}: {str(e)}")
+        return {}
+
+
+def variant_paths(variants):
+    """All relative file paths listed in an Image.variants JSON blob"""
+    if not variants:
+        return []
+    return [path for sizes in json.loads(variants).values() for path in sizes.values()]
+
+
+def srcset(variants, url_for_path):
+    """Turn an Image.variants JSON blob into ``{format: "url 256w, ..."}``"""
+    if not variants:
+        return {}
+    return {
+        fmt: ', '.join(f"{url_for_path(path)} {width}w"
+                       for width, path in sorted(sizes.items(), key=lambda item: int(item[0])))
+        for fmt, sizes in json.loads(variants).items()
+    }
@@ -0,0 +1,102 @@
+# utils/events.py
+
+import json
+import queue
+import threading
+from collections import defaultdict
+
+from flask import current_app
+from itsdangerous import BadSignature, URLSafeTimedSerializer
+
+
+class Subscription:
+    """One listener's inbox on a channel"""
+
+    def __init__(self, hub, channel):
+        self.hub = hub
+        self.channel = channel
+        self.queue = queue.Queue(maxsize=hub.max_pending)
+
+    def get(self, timeout):
+        """Next event, or None if nothing arrived within timeout seconds"""
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self.hub.unsubscribe(self)
+
+
+class EventHub:
+    """In-process publish/subscribe fan-out keyed by channel (a job id).
+
+    A subscriber is just a small queue, so idle listeners cost no CPU. The
+    blocking primitives are the stdlib ones, which gevent monkey-patches into
+    cooperative ones; gunicorn.conf.py runs the gevent worker, so each open
+    stream is a greenlet rather than an OS thread.
+    """
+
+    def __init__(self, max_pending=100):
+        self.max_pending = max_pending
+        self._channels = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def subscribe(self, channel):
+        subscription = Subscription(self, channel)
+        with self._lock:
+            self._channels[channel].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            listeners = self._channels.get(subscription.channel)
+            if listeners is not None:
+                listeners.discard(subscription)
+                if not listeners:
+                    del self._channels[subscription.channel]
+
+    def publish(self, channel, event):
+        with self._lock:
+            listeners = list(self._channels.get(channel, ()))
+        for subscription in listeners:
+            try:
+                subscription.queue.put_nowait(event)
+            except queue.Full:
+                # A stalled client only loses intermediate progress events
+                pass
+
+    def subscriber_count(self):
+        with self._lock:
+            return sum(len(listeners) for listeners in self._channels.values())
+
+
+def _stream_signer():
+    return URLSafeTimedSerializer(current_app.config['JWT_SECRET_KEY'], salt='job-events')
+
+
+def stream_token(job_id, user_id):
+    """Signed token that opens one job's event stream and nothing else.
+
+    EventSource cannot send an Authorization header, and an access token in
+    the URL would end up in proxy and access logs. This one is only good for
+    JOB_EVENTS_TOKEN_TTL seconds and only for this job.
+    """
+    return _stream_signer().dumps({'job': job_id, 'user': user_id})
+
+
+def stream_token_user(token, job_id):
+    """The user a stream token was issued to, or None if it is not valid for job_id"""
+    try:
+        claims = _stream_signer().loads(token, max_age=current_app.config['JOB_EVENTS_TOKEN_TTL'])
+    except BadSignature:  # also covers expired tokens
+        return None
+    return claims['user'] if claims.get('job') == job_id else None
+
+
+def format_sse(data):
+    """Encode one Server-Sent Events message"""
+    return f"data: {json.dumps(data)}\n\n"
+
+
+event_hub = EventHub()
@@ -0,0 +1,211 @@
+# utils/google.py
+
+import base64
+import hashlib
+import json
+import threading
+import time
+
+from flask import current_app
+from sqlalchemy.exc import IntegrityError
+
+from models import db, User
+from utils import http
+from utils.metrics import CACHE_LOOKUPS
+
+
+class InvalidGoogleToken(ValueError):
+    """Raised when Google does not accept an access token"""
+
+
+def token_key(token):
+    # Only a digest is kept, so the cache never holds a usable token
+    return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+
+def token_expiry(token, user_info, expires_in=None):
+    """Unix time the token stops being valid, or None when it can't be told.
+
+    The v3 userinfo answer carries no expiry and Google's access tokens
+    (ya29....) are opaque, so for them this is the expires_in the client
+    received along with the token.
+    """
+    try:
+        if 'exp' in user_info:  # tokeninfo-style responses
+            return float(user_info['exp'])
+        if 'expires_in' in user_info:
+            return time.time() + float(user_info['expires_in'])
+        parts = token.split('.')
+        if len(parts) == 3:
+            # A JWT. Google has just vouched for it, so its unverified exp is
+            # good enough to bound a cache entry
+            payload = json.loads(base64.urlsafe_b64decode(parts[1] + '=' * (-len(parts[1]) % 4)))
+            return float(payload['exp'])
+    except (ValueError, KeyError, TypeError):
+        pass
+    if expires_in is not None:
+        return time.time() + expires_in
+    return None
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class GoogleTokenVerifier:
+    """Looks up Google access tokens at the userinfo endpoint.
+
+    Answers are cached per process by token hash for GOOGLE_TOKEN_CACHE_TTL
+    seconds, never past the token's own expiry when that is known (the
+    client passes it in, as userinfo does not say), and
+    rejections for GOOGLE_TOKEN_NEGATIVE_TTL. Concurrent lookups of one
+    token share a single upstream call, so a client retry storm costs
+    Google one request per token rather than one per retry.
+    """
+
+    def __init__(self, app=None):
+        self.ttl = 300
+        self.negative_ttl = 10
+        self.max_entries = 10000
+        self._data = {}
+        self._flights = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.ttl = app.config['GOOGLE_TOKEN_CACHE_TTL']
+        self.negative_ttl = app.config['GOOGLE_TOKEN_NEGATIVE_TTL']
+        self.max_entries = app.config['GOOGLE_TOKEN_CACHE_MAX_ENTRIES']
+        app.extensions['google_tokens'] = self
+
+    def verify(self, token, expires_in=None):
+        """Return Google's userinfo for token; raises InvalidGoogleToken.
+
+        expires_in is the token's remaining lifetime as the client was told
+        it. It only ever shortens how long the answer is cached.
+        """
+        key = token_key(token)
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[1] > time.time():
+                self.hits += 1
+                flight = None
+            else:
+                flight = self._flights.get(key)
+                leader = flight is None
+                if leader:
+                    flight = self._flights[key] = _Flight()
+                    self.misses += 1
+                else:
+                    self.coalesced += 1
+
+        if flight is None:
+            CACHE_LOOKUPS.labels('google_token', 'hit').inc()
+            return _unwrap(entry[0])
+        CACHE_LOOKUPS.labels('google_token', 'miss' if leader else 'coalesced').inc()
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return _unwrap(flight.value)
+
+        try:
+            value, ttl = self._fetch(token, expires_in)
+            self._store(key, value, ttl)
+            flight.value = value
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+        return _unwrap(value)
+
+    def _fetch(self, token, expires_in=None):
+        """Ask Google; returns (userinfo or InvalidGoogleToken, seconds to cache it)"""
+        response = http.get(current_app.config['GOOGLE_USERINFO_URL'], params={'access_token': token})
+        if response.status_code != 200:
+            # Throttling and server errors say nothing about the token itself
+            ttl = self.negative_ttl if response.status_code < 500 and response.status_code != 429 else 0
+            return InvalidGoogleToken("Failed to fetch user info from Google"), ttl
+
+        user_info = response.json()
+        ttl = self.ttl
+        expires_at = token_expiry(token, user_info, expires_in)
+        if expires_at is not None:
+            ttl = min(ttl, expires_at - time.time())
+        return user_info, ttl
+
+    def _store(self, key, value, ttl):
+        if ttl <= 0:
+            return
+        now = time.time()
+        with self._lock:
+            if len(self._data) >= self.max_entries:
+                self._evict(now)
+            self._data[key] = (value, now + ttl)
+
+    def _evict(self, now):
+        expired = [key for key, (_, expires_at) in self._data.items() if expires_at <= now]
+        for key in expired:
+            del self._data[key]
+        if len(self._data) >= self.max_entries:
+            # Still full of live entries: drop the oldest insertions
+            for key in list(self._data)[:len(self._data) // 10 + 1]:
+                del self._data[key]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        # Coalesced lookups shared another request's call, so count as hits
+        served = self.hits + self.coalesced
+        lookups = served + self.misses
+        return {
+            'entries': len(self._data),
+            'hits': self.hits,
+            'misses': self.misses,
+            'coalesced': self.coalesced,
+            'hit_ratio': served / lookups if lookups else 0.0,
+        }
+
+
+def _unwrap(value):
+    if isinstance(value, InvalidGoogleToken):
+        raise value
+    return value
+
+
+google_tokens = GoogleTokenVerifier()
+
+
+def google_user(email):
+    """The user for a verified Google email, created on its first login.
+
+    Concurrent first logins of one account race to insert; the losers hit
+    the unique email constraint and return the winner's row instead.
+    """
+    user = User.query.filter_by(email=email).first()
+    if user is not None:
+        return user
+    # Google accounts have no local password, and '!' never matches a hash
+    user = User(email=email, username=email[:80], password_hash='!')
+    db.session.add(user)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        user = User.query.filter_by(email=email).first()
+        if user is None:
+            raise  # the conflict was on the username, not the email
+    return user
@@ -0,0 +1,88 @@
+# utils/http.py
+
+import os
+import tempfile
+import threading
+from flask import current_app
+from utils.metrics import DOWNLOAD_BYTES, DOWNLOAD_SECONDS, timed
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def _build_session(config):
+    # requests/urllib3 load with the first outbound call, not at startup
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+
+    retry = Retry(
+        total=config['HTTP_RETRIES'],
+        backoff_factor=config['HTTP_BACKOFF_FACTOR'],
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=frozenset(['GET', 'HEAD']),
+        respect_retry_after_header=True,
+    )
+    # pool_maxsize caps keep-alive connections per host; pool_block makes
+    # extra callers wait for a free connection instead of opening more
+    adapter = HTTPAdapter(
+        pool_connections=config['HTTP_POOL_CONNECTIONS'],
+        pool_maxsize=config['HTTP_POOL_MAXSIZE'],
+        pool_block=True,
+        max_retries=retry,
+    )
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def get_session():
+    """Return the process-wide pooled session, creating it on first use"""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = _build_session(current_app.config)
+    return _session
+
+
+def get_timeout():
+    return (current_app.config['HTTP_CONNECT_TIMEOUT'], current_app.config['HTTP_READ_TIMEOUT'])
+
+
+def get(url, **kwargs):
+    """GET through the shared session with the configured timeouts"""
+    kwargs.setdefault('timeout', get_timeout())
+    return get_session().get(url, **kwargs)
+
+
+def download_to_file(url, dest_path):
+    """Stream url to dest_path in chunks and return the number of bytes written.
+
+    The body goes to a temp file in the destination directory and is renamed
+    into place once complete, so readers never see a partial image.
+    """
+    dest_dir = os.path.dirname(dest_path) or '.'
+    os.makedirs(dest_dir, exist_ok=True)
+    chunk_size = current_app.config['DOWNLOAD_CHUNK_SIZE']
+
+    with timed(DOWNLOAD_SECONDS), get(url, stream=True) as response:
+        if response.status_code != 200:
+            raise Exception(f"Failed to download image: {response.status_code}")
+
+        fd, tmp_path = tempfile.mkstemp(dir=dest_dir, suffix='.part')
+        size = 0
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in response.iter_content(chunk_size=chunk_size):
+                    f.write(chunk)
+                    size += len(chunk)
+            os.replace(tmp_path, dest_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    DOWNLOAD_BYTES.inc(size)
+    return size
@@ -0,0 +1,211 @@
+# utils/jobs.py
+
+import asyncio
+import contextvars
+import inspect
+import json
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, or_
+from sqlalchemy.exc import SQLAlchemyError
+
+from models import db, GenerationJob
+from utils.aio import aio
+from utils.events import event_hub
+from utils.metrics import JOB_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Job being run by the current worker thread or event loop task
+_current_job = contextvars.ContextVar('current_job', default=None)
+
+
+class QueueFullError(Exception):
+    """Raised when the generation queue has no free slots"""
+
+
+def publish_job(job_id, status, **data):
+    """Push a job state change to anyone streaming that job"""
+    event_hub.publish(job_id, {'id': job_id, 'status': status, **data})
+
+
+def current_job_id():
+    """Id of the job being run here, or None outside a job"""
+    return _current_job.get()
+
+
+def report_progress(stage):
+    """Publish a progress stage for the job being run here, if any"""
+    job_id = _current_job.get()
+    if job_id is not None:
+        publish_job(job_id, GenerationJob.RUNNING, stage=stage)
+
+
+class JobQueue:
+    """Bounded pool of background workers that run generation jobs.
+
+    Job state lives in the ``generation_jobs`` table so any web process can
+    answer ``GET /image/jobs/<id>``; the worker threads themselves are
+    per-process. Coroutine handlers run on the shared event loop instead and
+    only borrow a worker thread for their blocking steps (see ``run_sync``).
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self._executor = None
+        self._slots = None
+        self._async_slots = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        workers = app.config['GENERATION_WORKERS']
+        # Running jobs plus those waiting for a worker
+        self._slots = threading.BoundedSemaphore(workers + app.config['GENERATION_QUEUE_SIZE'])
+        self._async_slots = threading.BoundedSemaphore(app.config['GENERATION_ASYNC_LIMIT'])
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='generate')
+        app.extensions['jobs'] = self
+        with app.app_context():
+            self.fail_stale_jobs(app.config['GENERATION_JOB_TIMEOUT'])
+
+    def fail_stale_jobs(self, timeout):
+        """Mark jobs queued or running for over timeout seconds as failed.
+
+        Workers are threads of the process that accepted the job, so a job
+        left behind by a restart would otherwise never settle. Returns how
+        many jobs were failed.
+        """
+        cutoff = datetime.utcnow() - timedelta(seconds=timeout)
+        try:
+            failed = GenerationJob.query.filter(or_(
+                and_(GenerationJob.status == GenerationJob.QUEUED, GenerationJob.created_at < cutoff),
+                and_(GenerationJob.status == GenerationJob.RUNNING, GenerationJob.started_at < cutoff),
+            )).update({'status': GenerationJob.FAILED, 'error': 'Generation was interrupted by a restart',
+                       'finished_at': datetime.utcnow()}, synchronize_session=False)
+            db.session.commit()
+        except SQLAlchemyError as e:
+            # e.g. the table does not exist yet, before the first migration
+            db.session.rollback()
+            logger.warning(f"Could not fail stale generation jobs: {str(e)}")
+            return 0
+        finally:
+            db.session.remove()
+        if failed:
+            logger.warning(f"Marked {failed} stale generation jobs as failed")
+        return failed
+
+    def submit(self, user_id, payload, handler, on_finish=None):
+        """Persist a queued job and hand it to the worker pool or event loop.
+
+        on_finish, if given, is called once the job has settled.
+        """
+        is_async = inspect.iscoroutinefunction(handler)
+        slots = self._async_slots if is_async else self._slots
+        if not slots.acquire(blocking=False):
+            raise QueueFullError("Generation queue is full")
+
+        try:
+            job = GenerationJob(user_id=int(user_id), payload=json.dumps(payload))
+            db.session.add(job)
+            db.session.commit()
+            publish_job(job.id, job.status)
+            if is_async:
+                aio.submit(self._run_async(job.id, handler, on_finish))
+            else:
+                self._executor.submit(self._run, job.id, handler, on_finish)
+        except Exception:
+            slots.release()
+            raise
+
+        return job
+
+    def _start(self, job_id):
+        """Mark a job running and return its (payload, user_id)"""
+        job = db.session.get(GenerationJob, job_id)
+        job.status = GenerationJob.RUNNING
+        job.started_at = datetime.utcnow()
+        db.session.commit()
+        publish_job(job_id, job.status)
+        return json.loads(job.payload), job.user_id
+
+    def _finish(self, job_id, image_id=None, result=None, error=None):
+        job = db.session.get(GenerationJob, job_id)
+        if error is None:
+            job.image_id = image_id
+            job.result = json.dumps(result) if result is not None else None
+            job.status = GenerationJob.DONE
+        else:
+            logger.error(f"Generation job {job_id} failed: {str(error)}")
+            job.status = GenerationJob.FAILED
+            job.error = str(error)
+        job.finished_at = datetime.utcnow()
+        db.session.commit()
+        publish_job(job_id, job.status)
+        JOB_SECONDS.labels(job.status).observe((job.finished_at - job.started_at).total_seconds())
+
+    def _run(self, job_id, handler, on_finish=None):
+        token = _current_job.set(job_id)
+        try:
+            with self.app.app_context():
+                payload, user_id = self._start(job_id)
+                try:
+                    # Handlers return (image_id, result) for single and batch jobs
+                    image_id, result = handler(payload, user_id)
+                except Exception as e:
+                    db.session.rollback()
+                    self._finish(job_id, error=e)
+                else:
+                    self._finish(job_id, image_id, result)
+        except Exception:
+            logger.exception(f"Could not update generation job {job_id}")
+        finally:
+            _current_job.reset(token)
+            self._slots.release()
+            self._call_on_finish(job_id, on_finish)
+
+    async def _run_async(self, job_id, handler, on_finish=None):
+        # Each task runs in its own context, so this does not leak between jobs
+        _current_job.set(job_id)
+        try:
+            payload, user_id = await self.run_sync(self._start, job_id)
+            try:
+                with self.app.app_context():
+                    image_id, result = await handler(payload, user_id)
+            except Exception as e:
+                await self.run_sync(self._finish, job_id, None, None, e)
+            else:
+                await self.run_sync(self._finish, job_id, image_id, result)
+        except Exception:
+            logger.exception(f"Could not update generation job {job_id}")
+        finally:
+            self._async_slots.release()
+            self._call_on_finish(job_id, on_finish)
+
+    def _call_on_finish(self, job_id, on_finish):
+        if on_finish is None:
+            return
+        try:
+            on_finish()
+        except Exception:
+            logger.exception(f"on_finish failed for generation job {job_id}")
+
+    async def run_sync(self, fn, *args):
+        """Run a blocking step of an async job on the worker pool, in an app context"""
+        loop = asyncio.get_running_loop()
+        # Carry the task's context over, so the step still knows its job
+        context = contextvars.copy_context()
+        return await loop.run_in_executor(self._executor, context.run, self._call_in_context, fn, args)
+
+    def _call_in_context(self, fn, args):
+        with self.app.app_context():
+            return fn(*args)
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
+
+
+jobs = JobQueue()
@@ -0,0 +1,271 @@
+# utils/ledger.py
+
+import atexit
+import logging
+import queue
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, insert, select
+from sqlalchemy.exc import IntegrityError
+
+from models import db, GenerationLedgerEntry, GenerationRollup
+from utils.jobs import current_job_id
+from utils.metrics import LEDGER_ENTRIES
+
+logger = logging.getLogger(__name__)
+
+GRANULARITIES = {'hour': timedelta(hours=1), 'day': timedelta(days=1)}
+# Rollup rows with this user_id total every user
+ALL_USERS = 0
+ROLLUP_SUMS = ('runs', 'errors', 'cache_hits', 'model_runs', 'model_seconds', 'download_seconds', 'bytes', 'cost')
+
+
+def bucket_start(when, granularity):
+    if granularity == 'day':
+        return when.replace(hour=0, minute=0, second=0, microsecond=0)
+    return when.replace(minute=0, second=0, microsecond=0)
+
+
+def rollup_deltas(entries):
+    """{(user_id, granularity, bucket, model): {column: increment}} for a batch of entries"""
+    deltas = defaultdict(lambda: dict.fromkeys(ROLLUP_SUMS, 0))
+    for entry in entries:
+        for granularity in GRANULARITIES:
+            bucket = bucket_start(entry['created_at'], granularity)
+            for user_id in (entry['user_id'], ALL_USERS):
+                delta = deltas[(user_id, granularity, bucket, entry['model'] or '')]
+                delta['runs'] += 1
+                delta['errors'] += int(entry['outcome'] == 'error')
+                delta['cache_hits'] += int(entry['cache'] == 'hit')
+                if entry['model_seconds'] is not None:
+                    delta['model_runs'] += 1
+                    delta['model_seconds'] += entry['model_seconds']
+                delta['download_seconds'] += entry['download_seconds'] or 0
+                delta['bytes'] += entry['bytes'] or 0
+                delta['cost'] += entry['cost'] or 0
+    return deltas
+
+
+def _apply_rollup(key, delta):
+    user_id, granularity, bucket, model = key
+    rollup = GenerationRollup.query.filter_by(user_id=user_id, granularity=granularity, bucket=bucket, model=model)
+    increments = {getattr(GenerationRollup, name): getattr(GenerationRollup, name) + value
+                  for name, value in delta.items()}
+    if rollup.update(increments, synchronize_session=False):
+        return
+    try:
+        with db.session.begin_nested():
+            db.session.add(GenerationRollup(user_id=user_id, granularity=granularity, bucket=bucket,
+                                            model=model, **delta))
+    except IntegrityError:
+        # Another process created the row first
+        rollup.update(increments, synchronize_session=False)
+
+
+def write_entries(entries):
+    """Insert ledger entries and fold them into the rollups, in one transaction"""
+    db.session.execute(insert(GenerationLedgerEntry), entries)
+    # Fixed key order, so concurrent writers lock rollup rows in the same order
+    for key, delta in sorted(rollup_deltas(entries).items()):
+        _apply_rollup(key, delta)
+    db.session.commit()
+
+
+class GenerationLedger:
+    """Records every generation attempt without blocking the caller.
+
+    ``record`` only puts the entry on a bounded queue. A background thread
+    takes up to LEDGER_BATCH_SIZE entries, or whatever arrived within
+    LEDGER_FLUSH_INTERVAL seconds, and writes them with one insert plus
+    the matching rollup increments. A full queue drops entries rather than
+    stall a generation; what is still queued at exit is flushed.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.enabled = False
+        self._queue = None
+        self._thread = None
+        self._lock = threading.Lock()
+        self._atexit = False
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        config = app.config
+        self.app = app
+        self.enabled = config['LEDGER_ENABLED']
+        self.batch_size = config['LEDGER_BATCH_SIZE']
+        self.flush_interval = config['LEDGER_FLUSH_INTERVAL']
+        self.costs = config['GENERATION_RUN_COSTS']
+        self._queue = queue.Queue(maxsize=config['LEDGER_QUEUE_SIZE'])
+        if not self._atexit:
+            atexit.register(self.flush)
+            self._atexit = True
+        app.extensions['ledger'] = self
+
+    def record(self, user_id, outcome, cache, result=None, image_id=None, error=None):
+        """Queue the entry for one generation.
+
+        result is the generate_image result (with ``size`` once stored);
+        cache is 'hit', 'miss' or 'off'. A hit ran no model, so it carries
+        no timings and costs nothing.
+        """
+        if not self.enabled:
+            return
+        result = result or {}
+        ran_model = cache != 'hit' and result.get('model_seconds') is not None
+        entry = {
+            'created_at': datetime.utcnow(),
+            'user_id': int(user_id),
+            'job_id': current_job_id(),
+            'image_id': image_id,
+            'provider': result.get('provider'),
+            'model': result.get('model'),
+            'outcome': outcome,
+            'cache': cache,
+            'model_seconds': result.get('model_seconds') if ran_model else None,
+            'download_seconds': result.get('download_seconds') if ran_model else None,
+            'bytes': result.get('size'),
+            'cost': self.costs.get(result.get('model')) if ran_model else (0.0 if cache == 'hit' else None),
+            'error': str(error)[:500] if error is not None else None,
+        }
+        try:
+            self._queue.put_nowait(entry)
+        except queue.Full:
+            LEDGER_ENTRIES.labels('dropped').inc()
+            logger.warning("Ledger queue full; dropped an entry for user %s", user_id)
+            return
+        if self._thread is None:
+            self._start()
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='ledger', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get(timeout=max(0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+            self._write(batch)
+
+    def _write(self, batch):
+        with self.app.app_context():
+            try:
+                write_entries(batch)
+                LEDGER_ENTRIES.labels('written').inc(len(batch))
+            except Exception:
+                db.session.rollback()
+                LEDGER_ENTRIES.labels('failed').inc(len(batch))
+                logger.exception("Writing %d ledger entries failed", len(batch))
+            finally:
+                db.session.remove()
+
+    def flush(self):
+        """Write whatever is queued now, on the calling thread"""
+        if self._queue is None:
+            return
+        batch = []
+        while True:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+            if len(batch) >= self.batch_size:
+                self._write(batch)
+                batch = []
+        if batch:
+            self._write(batch)
+
+
+ledger = GenerationLedger()
+
+
+def parse_range(granularity, since, until, max_buckets):
+    """Validate report arguments (ISO strings or None) into (granularity, since, until).
+
+    The default range is the last 48 hours or 30 days, ending now.
+    """
+    if granularity not in GRANULARITIES:
+        raise ValueError("period must be 'hour' or 'day'")
+    step = GRANULARITIES[granularity]
+    try:
+        until = datetime.fromisoformat(until) if until else datetime.utcnow()
+        since = datetime.fromisoformat(since) if since else until - step * (48 if granularity == 'hour' else 30)
+    except ValueError:
+        raise ValueError("since and until must be ISO 8601 times")
+    if since.tzinfo is not None or until.tzinfo is not None:
+        raise ValueError("since and until are UTC times without an offset")
+    if since >= until or (until - since) / step > max_buckets:
+        raise ValueError(f"The range must be positive and at most {max_buckets} periods")
+    return granularity, bucket_start(since, granularity), until
+
+
+def _summary(sums):
+    return {
+        'runs': sums['runs'],
+        'errors': sums['errors'],
+        'cache_hits': sums['cache_hits'],
+        'model_runs': sums['model_runs'],
+        'avg_model_seconds': round(sums['model_seconds'] / sums['model_runs'], 3) if sums['model_runs'] else None,
+        'model_seconds': round(sums['model_seconds'], 3),
+        'download_seconds': round(sums['download_seconds'], 3),
+        'bytes': sums['bytes'],
+        'cost': round(sums['cost'], 6),
+    }
+
+
+def report(user_id, granularity, since, until):
+    """Rollup rows for one user (or ALL_USERS) from since to until, plus totals.
+
+    Reads only the rollups, a key range per user; entries written in the
+    last LEDGER_FLUSH_INTERVAL seconds may not be counted yet.
+    """
+    rows = db.session.execute(
+        select(GenerationRollup)
+        .where(GenerationRollup.user_id == user_id, GenerationRollup.granularity == granularity,
+               GenerationRollup.bucket >= since, GenerationRollup.bucket < until)
+        .order_by(GenerationRollup.bucket, GenerationRollup.model)
+    ).scalars().all()
+
+    buckets, totals = [], defaultdict(lambda: dict.fromkeys(ROLLUP_SUMS, 0))
+    for row in rows:
+        sums = {name: getattr(row, name) for name in ROLLUP_SUMS}
+        buckets.append({'bucket': row.bucket.isoformat(), 'model': row.model or None, **_summary(sums)})
+        for name, value in sums.items():
+            totals[row.model][name] += value
+    return {
+        'period': granularity,
+        'since': since.isoformat(),
+        'until': until.isoformat(),
+        'buckets': buckets,
+        'models': {model or 'none': _summary(sums) for model, sums in totals.items()},
+    }
+
+
+def top_users(granularity, since, until, limit):
+    """Users with the most runs from since to until, from the per-user rollups"""
+    runs = func.sum(GenerationRollup.runs)
+    rows = db.session.execute(
+        select(GenerationRollup.user_id, runs.label('runs'),
+               func.sum(GenerationRollup.errors).label('errors'),
+               func.sum(GenerationRollup.model_runs).label('model_runs'),
+               func.sum(GenerationRollup.cost).label('cost'))
+        .where(GenerationRollup.granularity == granularity, GenerationRollup.user_id != ALL_USERS,
+               GenerationRollup.bucket >= since, GenerationRollup.bucket < until)
+        .group_by(GenerationRollup.user_id)
+        .order_by(runs.desc())
+        .limit(limit)
+    ).all()
+    return [{'user_id': row.user_id, 'runs': row.runs, 'errors': row.errors,
+             'model_runs': row.model_runs, 'cost': round(row.cost, 6)} for row in rows]
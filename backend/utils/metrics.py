@@ -0,0 +1,131 @@
+# utils/metrics.py
+
+import hmac
+import json
+import logging
+import os
+import random
+import time
+
+from flask import g, has_request_context, request
+from prometheus_client import (CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Histogram,
+                               generate_latest, multiprocess, REGISTRY)
+from sqlalchemy import event
+
+access_logger = logging.getLogger('access')
+
+# Request latency buckets; model runs and downloads take seconds, so they
+# get their own wider buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SLOW_BUCKETS = (0.25, 0.5, 1, 2, 4, 8, 16, 32, 64, 128)
+
+REQUEST_LATENCY = Histogram(
+    'http_request_duration_seconds', 'Request latency by endpoint',
+    ['method', 'endpoint', 'status'], buckets=LATENCY_BUCKETS)
+REQUEST_DB_QUERIES = Histogram(
+    'http_request_db_queries', 'SQL statements run per request',
+    ['endpoint'], buckets=(0, 1, 2, 3, 5, 8, 13, 21, 50))
+REQUEST_DB_SECONDS = Histogram(
+    'http_request_db_seconds', 'Time spent in SQL per request',
+    ['endpoint'], buckets=LATENCY_BUCKETS)
+MODEL_RUN_SECONDS = Histogram(
+    'generation_model_seconds', 'Model run time', ['provider'], buckets=SLOW_BUCKETS)
+DOWNLOAD_SECONDS = Histogram(
+    'image_download_seconds', 'Generated image download time', buckets=SLOW_BUCKETS)
+DOWNLOAD_BYTES = Counter(
+    'image_download_bytes', 'Bytes of generated images downloaded')
+PROVIDER_RUNS = Counter(
+    'generation_provider_runs', 'Model runs by provider and outcome', ['provider', 'result'])
+JOB_SECONDS = Histogram(
+    'generation_job_seconds', 'Time from job start to settle', ['status'], buckets=SLOW_BUCKETS)
+CACHE_LOOKUPS = Counter(
+    'cache_lookups', 'Cache lookups by outcome', ['cache', 'result'])
+DB_POOL_WAIT = Histogram(
+    'db_pool_wait_seconds', 'Time spent waiting for a pooled connection',
+    buckets=(0.0001, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5))
+DB_POOL_TIMEOUTS = Counter(
+    'db_pool_timeouts', 'Connection checkouts that timed out')
+LEDGER_ENTRIES = Counter(
+    'generation_ledger_entries', 'Ledger entries by result', ['result'])
+
+
+class timed:
+    """Context manager observing elapsed seconds on a histogram (or child)"""
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start)
+
+
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context():
+        context._metrics_start = time.perf_counter()
+
+
+def _finish_query(conn, cursor, statement, parameters, context, executemany):
+    start = getattr(context, '_metrics_start', None)
+    if start is not None:
+        g._db_queries = g.get('_db_queries', 0) + 1
+        g._db_seconds = g.get('_db_seconds', 0.0) + time.perf_counter() - start
+
+
+def init_metrics(app, engine):
+    """Time every request, count its SQL, and serve /metrics to holders of METRICS_TOKEN"""
+    config = app.config
+    sample_rate = config['ACCESS_LOG_SAMPLE_RATE']
+    slow_seconds = config['ACCESS_LOG_SLOW_SECONDS']
+
+    event.listen(engine, 'before_cursor_execute', _count_query)
+    event.listen(engine, 'after_cursor_execute', _finish_query)
+
+    @app.before_request
+    def start_timer():
+        g._request_start = time.perf_counter()
+
+    @app.after_request
+    def record_request(response):
+        start = g.pop('_request_start', None)
+        if start is None:
+            return response
+        elapsed = time.perf_counter() - start
+        # The URL rule, not the path, keeps label cardinality bounded
+        endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+        queries = g.get('_db_queries', 0)
+        REQUEST_LATENCY.labels(request.method, endpoint, response.status_code).observe(elapsed)
+        REQUEST_DB_QUERIES.labels(endpoint).observe(queries)
+        REQUEST_DB_SECONDS.labels(endpoint).observe(g.get('_db_seconds', 0.0))
+
+        # Errors and slow requests are always logged, the rest sampled
+        if response.status_code >= 500 or elapsed >= slow_seconds or random.random() < sample_rate:
+            access_logger.info(json.dumps({
+                'method': request.method,
+                'endpoint': endpoint,
+                'path': request.path,
+                'status': response.status_code,
+                'ms': round(elapsed * 1000, 2),
+                'db_queries': queries,
+            }))
+        return response
+
+    @app.route('/metrics')
+    def metrics():
+        # Route names, queue depths and cache sizes are not for the public
+        token = config['METRICS_TOKEN']
+        if not token:
+            return 'Not Found', 404
+        scheme, _, supplied = request.headers.get('Authorization', '').partition(' ')
+        if scheme != 'Bearer' or not hmac.compare_digest(supplied.encode(), token.encode()):
+            return 'Unauthorized', 401, {'WWW-Authenticate': 'Bearer'}
+        if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+            # gunicorn workers each write their own files; aggregate them here
+            registry = CollectorRegistry()
+            multiprocess.MultiProcessCollector(registry)
+        else:
+            registry = REGISTRY
+        return generate_latest(registry), 200, {'Content-Type': CONTENT_TYPE_LATEST}
@@ -0,0 +1,101 @@
+# utils/passwords.py
+
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+
+class PasswordHashBusy(Exception):
+    """Raised when too many password hashes are already waiting"""
+
+
+def _argon2(params):
+    from argon2 import PasswordHasher, Type
+    time_cost, memory_cost, parallelism = params
+    return PasswordHasher(time_cost=time_cost, memory_cost=memory_cost,
+                          parallelism=parallelism, type=Type.ID)
+
+
+def hash_password(password, scheme, params):
+    if scheme == 'argon2':
+        return _argon2(params).hash(password)
+    return generate_password_hash(password)
+
+
+def verify_password(password_hash, password, scheme, params):
+    """Return (matches, needs_rehash) for a stored hash of either scheme.
+
+    Top-level and argument-only so it can run in a worker process.
+    """
+    if password_hash.startswith('$argon2'):
+        from argon2.exceptions import InvalidHashError, VerificationError
+        hasher = _argon2(params)
+        try:
+            hasher.verify(password_hash, password)
+        except (VerificationError, InvalidHashError):
+            return False, False
+        return True, scheme != 'argon2' or hasher.check_needs_rehash(password_hash)
+    # werkzeug pbkdf2/scrypt, or '!' for accounts without a local password
+    matches = check_password_hash(password_hash, password)
+    return matches, matches and scheme == 'argon2'
+
+
+class Passwords:
+    """Password hashing off the request thread.
+
+    Hashes are argon2id with the configured cost (or werkzeug's default
+    scheme) and run in a small process pool, so a login storm costs pool
+    CPU rather than holding the GIL of the web workers. At most
+    PASSWORD_HASH_QUEUE hashes wait for the pool; beyond that callers get
+    PasswordHashBusy instead of queueing without bound. With
+    PASSWORD_HASH_WORKERS=0 hashes run inline.
+    """
+
+    def __init__(self, app=None):
+        self._pool = None
+        self._pool_lock = threading.Lock()
+        self._slots = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        config = app.config
+        self.scheme = config['PASSWORD_HASHER']
+        if self.scheme not in ('argon2', 'werkzeug'):
+            raise ValueError(f"Unknown PASSWORD_HASHER {self.scheme!r}")
+        self.params = (config['ARGON2_TIME_COST'], config['ARGON2_MEMORY_COST'], config['ARGON2_PARALLELISM'])
+        self.workers = config['PASSWORD_HASH_WORKERS']
+        self.wait_timeout = config['PASSWORD_HASH_WAIT_TIMEOUT']
+        self._slots = threading.BoundedSemaphore(max(1, self.workers) + config['PASSWORD_HASH_QUEUE'])
+        app.extensions['passwords'] = self
+
+    def _get_pool(self):
+        if self._pool is None:
+            with self._pool_lock:
+                if self._pool is None:
+                    # spawn, not fork: the web process already runs job threads
+                    self._pool = ProcessPoolExecutor(max_workers=self.workers,
+                                                     mp_context=multiprocessing.get_context('spawn'))
+        return self._pool
+
+    def _call(self, fn, *args):
+        if not self.workers:
+            return fn(*args)
+        if not self._slots.acquire(timeout=self.wait_timeout):
+            raise PasswordHashBusy("Too many logins in progress, try again shortly")
+        try:
+            return self._get_pool().submit(fn, *args).result()
+        finally:
+            self._slots.release()
+
+    def hash(self, password):
+        return self._call(hash_password, password, self.scheme, self.params)
+
+    def verify(self, password_hash, password):
+        """Return (matches, needs_rehash)"""
+        return self._call(verify_password, password_hash, password, self.scheme, self.params)
+
+
+passwords = Passwords()
@@ -0,0 +1,78 @@
+# utils/prompts.py
+
+from typing import Annotated, Union
+
+from pydantic import BaseModel, ConfigDict, Discriminator, StringConstraints, Tag, TypeAdapter, ValidationError
+
+CUSTOM_PROMPT_MAX_LENGTH = 500
+SUBJECT_MAX_LENGTH = 200
+MODIFIER_MAX_LENGTH = 100
+
+# Bound once at import; formatting is then a single C call per request
+GUIDED_TEMPLATE = "{subject} in {style} style with {mood} mood and {lighting} lighting".format
+
+Text = Annotated[str, StringConstraints(strip_whitespace=True, max_length=MODIFIER_MAX_LENGTH)]
+
+
+class InvalidPrompt(ValueError):
+    """Raised when a generation payload does not match a prompt schema"""
+
+
+def _canonical(text):
+    # Runs of whitespace collapse to one space, so equivalent prompts share a cache key
+    return ' '.join(text.split())
+
+
+class CustomPrompt(BaseModel):
+    """{"customPrompt": "..."}"""
+    model_config = ConfigDict(extra='forbid', frozen=True)
+
+    customPrompt: Annotated[str, StringConstraints(strip_whitespace=True, min_length=1,
+                                                   max_length=CUSTOM_PROMPT_MAX_LENGTH)]
+
+    @property
+    def prompt(self):
+        return _canonical(self.customPrompt)
+
+
+class GuidedPrompt(BaseModel):
+    """{"subject": ..., "style": ..., "mood": ..., "lighting": ...}; only subject is required"""
+    model_config = ConfigDict(extra='forbid', frozen=True)
+
+    subject: Annotated[str, StringConstraints(strip_whitespace=True, min_length=1, max_length=SUBJECT_MAX_LENGTH)]
+    style: Text = ''
+    mood: Text = ''
+    lighting: Text = ''
+
+    @property
+    def prompt(self):
+        return _canonical(GUIDED_TEMPLATE(subject=self.subject, style=self.style,
+                                          mood=self.mood, lighting=self.lighting))
+
+
+def _prompt_kind(data):
+    if isinstance(data, dict):
+        return 'custom' if 'customPrompt' in data else 'guided'
+    return None
+
+
+# Both schemas compile into one validator; the discriminator picks the branch
+# without trying each in turn
+_prompt_adapter = TypeAdapter(Annotated[
+    Union[Annotated[CustomPrompt, Tag('custom')], Annotated[GuidedPrompt, Tag('guided')]],
+    Discriminator(_prompt_kind, custom_error_type='invalid_prompt',
+                  custom_error_message='Prompt must be an object with customPrompt or subject'),
+])
+
+
+def parse_prompt(data):
+    """Validate a custom or guided prompt payload; raises InvalidPrompt"""
+    try:
+        return _prompt_adapter.validate_python(data)
+    except ValidationError as e:
+        error = e.errors(include_url=False, include_context=False, include_input=False)[0]
+        # Drop the union tag from the location, e.g. ('custom', 'customPrompt')
+        field = '.'.join(str(part) for part in error['loc'][1:])
+        raise InvalidPrompt(f"{field}: {error['msg']}" if field else error['msg']) from None
+
+
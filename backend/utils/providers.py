@@ -0,0 +1,281 @@
+# utils/providers.py
+
+import asyncio
+import itertools
+import logging
+import threading
+import time
+from collections import deque
+
+from utils.metrics import MODEL_RUN_SECONDS, PROVIDER_RUNS
+
+logger = logging.getLogger(__name__)
+
+# Slack on top of the provider timeouts for scheduling and cancellation
+RUN_TIMEOUT_GRACE = 5
+
+
+class GenerationError(Exception):
+    """Raised when no provider produced an image"""
+
+
+class ReplicateProvider:
+    """A model hosted on Replicate; returns the URL of the first output"""
+
+    def __init__(self, name, model, input=None):
+        self.name = name
+        self.model = model
+        self.input = input or {}
+
+    async def run(self, prompt):
+        import replicate  # the SDK is slow to import; load it on the first run
+        output = await replicate.async_run(self.model, input={"prompt": prompt, **self.input})
+        if not (output and isinstance(output, list) and len(output) > 0):
+            raise GenerationError("No image generated from API")
+        return str(output[0])
+
+
+class FakeProvider:
+    """Offline provider for load tests and routing checks.
+
+    ``latency`` is seconds or a list cycled per call, and ``errors`` a list
+    of booleans cycled the same way, so a deployment can script e.g. a cold
+    start followed by fast runs. Returns ``url`` (None means the placeholder).
+    """
+
+    def __init__(self, name, latency=2.0, errors=None, url=None, model='fake'):
+        self.name = name
+        self.model = model
+        self.url = url
+        self._latency = itertools.cycle(latency if isinstance(latency, list) else [latency])
+        self._errors = itertools.cycle(errors or [False])
+
+    async def run(self, prompt):
+        latency, fail = next(self._latency), next(self._errors)
+        await asyncio.sleep(latency)
+        if fail:
+            raise GenerationError(f"{self.name} failed (scripted)")
+        return self.url
+
+
+PROVIDER_TYPES = {
+    'replicate': ReplicateProvider,
+    'fake': FakeProvider,
+}
+
+
+class ProviderStats:
+    """Recent outcomes for one provider; a sliding window of run times"""
+
+    def __init__(self, window):
+        self.latencies = deque(maxlen=window)
+        self.outcomes = deque(maxlen=window)  # True for success
+
+    def record(self, seconds, ok):
+        if ok:
+            self.latencies.append(seconds)
+        self.outcomes.append(ok)
+
+    def percentile(self, pct):
+        latencies = sorted(self.latencies)
+        if not latencies:
+            return None
+        return latencies[min(len(latencies) - 1, int(len(latencies) * pct / 100))]
+
+    def error_rate(self):
+        return self.outcomes.count(False) / len(self.outcomes) if self.outcomes else 0.0
+
+    def expected_seconds(self):
+        """Median run time scaled by retries implied by the error rate; 0 when unknown"""
+        median = self.percentile(50)
+        if median is None:
+            return 0.0 if not self.outcomes else float('inf')
+        return median / max(0.1, 1 - self.error_rate())
+
+
+class ProviderRouter:
+    """Picks model providers for each prompt.
+
+    Routing is ``ordered`` (configuration order) or ``latency`` (lowest
+    expected run time from recent outcomes; untried providers go first).
+    On error, or after the provider's timeout, the next provider is tried
+    when fallback is on. With hedging a second provider is started once the
+    first has run longer than the hedge delay (a fixed number, or the first
+    provider's recent p95) and whichever finishes second is cancelled.
+
+    Runs are coroutines on the shared loop (``utils.aio``), so cancelling the
+    loser really aborts its request; stats are per process.
+    """
+
+    def __init__(self, app=None):
+        self.providers = []
+        self.stats = {}
+        self.timeouts = {}
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        config = app.config
+        specs = config['GENERATION_PROVIDERS'] or self._default_specs(config)
+        self.providers = [self._build(spec) for spec in specs]
+        self.timeouts = {provider.name: spec.get('timeout', config['GENERATION_PROVIDER_TIMEOUT'])
+                         for provider, spec in zip(self.providers, specs)}
+        self.stats = {provider.name: ProviderStats(config['GENERATION_STATS_WINDOW']) for provider in self.providers}
+        self.routing = config['GENERATION_ROUTING']
+        self.fallback = config['GENERATION_FALLBACK']
+        self.hedge = config['GENERATION_HEDGE'] and len(self.providers) > 1
+        self.hedge_delay = config['GENERATION_HEDGE_DELAY']
+        self.hedge_min_samples = config['GENERATION_HEDGE_MIN_SAMPLES']
+        if self.routing not in ('ordered', 'latency'):
+            raise ValueError(f"Unknown GENERATION_ROUTING {self.routing!r}")
+        app.extensions['generation_providers'] = self
+
+    @staticmethod
+    def _default_specs(config):
+        # GENERATION_BACKEND picks a single provider when none are configured
+        if config['GENERATION_BACKEND'] == 'fake':
+            return [{'name': 'fake', 'type': 'fake', 'latency': config['FAKE_GENERATION_LATENCY'],
+                     'url': config['FAKE_GENERATION_URL']}]
+        return [{'name': 'replicate', 'type': 'replicate', 'model': 'black-forest-labs/flux-schnell'}]
+
+    @staticmethod
+    def _build(spec):
+        spec = dict(spec)
+        spec.pop('timeout', None)
+        kind = spec.pop('type', 'replicate')
+        if kind not in PROVIDER_TYPES:
+            raise ValueError(f"Unknown provider type {kind!r}")
+        return PROVIDER_TYPES[kind](**spec)
+
+    @property
+    def model_id(self):
+        """Identifies the configured models; part of the prompt cache key"""
+        return ','.join(sorted({provider.model for provider in self.providers}))
+
+    @property
+    def model_input(self):
+        """Extra model inputs by model; also part of the prompt cache key"""
+        return {provider.model: provider.input for provider in self.providers if getattr(provider, 'input', None)}
+
+    @property
+    def run_timeout(self):
+        """Upper bound on one ``run``: each attempt it can make, at its timeout.
+
+        Fallback may try every provider in turn; without it a run makes one
+        attempt, or two once hedged. Hedges start while the first attempt is
+        still running, so they never add to the bound.
+        """
+        timeouts = sorted(self.timeouts.values(), reverse=True)
+        attempts = len(timeouts) if self.fallback else (2 if self.hedge else 1)
+        return sum(timeouts[:attempts]) + RUN_TIMEOUT_GRACE
+
+    def model_of(self, name):
+        """The model a provider runs, by provider name"""
+        for provider in self.providers:
+            if provider.name == name:
+                return provider.model
+        return None
+
+    def order(self):
+        """Providers in the order they should be tried"""
+        if self.routing == 'latency':
+            with self._lock:
+                # sorted() is stable, so ties keep configuration order
+                return sorted(self.providers, key=lambda p: self.stats[p.name].expected_seconds())
+        return list(self.providers)
+
+    def _hedge_after(self, provider):
+        if self.hedge_delay is not None:
+            return self.hedge_delay
+        with self._lock:
+            stats = self.stats[provider.name]
+            if len(stats.latencies) < self.hedge_min_samples:
+                return None
+            return stats.percentile(95)
+
+    async def _timed_run(self, provider, prompt):
+        start = time.perf_counter()
+        timeout = self.timeouts[provider.name]
+        try:
+            output = await asyncio.wait_for(provider.run(prompt), timeout)
+        except asyncio.CancelledError:
+            PROVIDER_RUNS.labels(provider.name, 'cancelled').inc()
+            raise
+        except asyncio.TimeoutError:
+            self._record(provider, time.perf_counter() - start, False)
+            raise GenerationError(f"{provider.name} timed out after {timeout:g}s")
+        except Exception:
+            self._record(provider, time.perf_counter() - start, False)
+            raise
+        self._record(provider, time.perf_counter() - start, True)
+        return output
+
+    def _record(self, provider, seconds, ok):
+        with self._lock:
+            self.stats[provider.name].record(seconds, ok)
+        PROVIDER_RUNS.labels(provider.name, 'ok' if ok else 'error').inc()
+        if ok:
+            MODEL_RUN_SECONDS.labels(provider.name).observe(seconds)
+
+    async def run(self, prompt):
+        """Run prompt on the routed providers; returns (provider name, output)"""
+        candidates = iter(self.order())
+        pending = {}
+        errors = []
+        hedged = False
+
+        def launch():
+            provider = next(candidates, None)
+            if provider is not None:
+                pending[asyncio.ensure_future(self._timed_run(provider, prompt))] = provider
+            return provider
+
+        launch()
+        try:
+            while pending:
+                timeout = None
+                if self.hedge and not hedged and len(pending) == 1:
+                    (running,) = pending.values()
+                    timeout = self._hedge_after(running)
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    hedged = True
+                    if launch() is not None:
+                        PROVIDER_RUNS.labels(running.name, 'hedged').inc()
+                    continue
+
+                for task in done:
+                    provider = pending.pop(task)
+                    if task.exception() is None:
+                        return provider.name, task.result()
+                    logger.warning("Provider %s failed: %s", provider.name, task.exception())
+                    errors.append(f"{provider.name}: {task.exception()}")
+
+                if not pending and self.fallback:
+                    launch()
+        finally:
+            for task in pending:
+                task.cancel()
+
+        raise GenerationError("Image generation failed: " + "; ".join(errors))
+
+    def snapshot(self):
+        """Per-provider p50/p95, error rate and sample count"""
+        with self._lock:
+            return {
+                name: {
+                    'p50': _round(stats.percentile(50)),
+                    'p95': _round(stats.percentile(95)),
+                    'error_rate': round(stats.error_rate(), 3),
+                    'samples': len(stats.outcomes),
+                }
+                for name, stats in self.stats.items()
+            }
+
+
+def _round(seconds):
+    return round(seconds, 4) if seconds is not None else None
+
+
+providers = ProviderRouter()
@@ -0,0 +1,164 @@
+# utils/quotas.py
+
+import math
+import threading
+import time
+import uuid
+
+
+class QuotaExceeded(Exception):
+    """Raised when a user is over their rate or concurrency limit"""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+class MemoryQuotaBackend:
+    """Per-process counters; enough for a single web process"""
+
+    def __init__(self):
+        self._buckets = {}
+        self._slots = {}
+        self._lock = threading.Lock()
+
+    def take(self, key, rate, burst, cost):
+        """Token bucket: return 0 if cost tokens were taken, else seconds to wait"""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated) * rate)
+            if tokens < cost:
+                self._buckets[key] = (tokens, now)
+                return (cost - tokens) / rate
+            self._buckets[key] = (tokens - cost, now)
+            return 0
+
+    def acquire(self, key, token, limit, ttl):
+        now = time.monotonic()
+        with self._lock:
+            slots = self._slots.setdefault(key, {})
+            for held, expires_at in list(slots.items()):
+                if expires_at <= now:
+                    del slots[held]
+            if len(slots) >= limit:
+                return False
+            slots[token] = now + ttl
+            return True
+
+    def release(self, key, token):
+        with self._lock:
+            self._slots.get(key, {}).pop(token, None)
+
+
+# KEYS[1] bucket hash; ARGV: rate, burst, cost, now. Returns wait time (string)
+TAKE_SCRIPT = """
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local rate, burst, cost, now = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3]), tonumber(ARGV[4])
+local tokens = tonumber(bucket[1]) or burst
+local updated = tonumber(bucket[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - updated) * rate)
+local wait = 0
+if tokens < cost then
+    wait = (cost - tokens) / rate
+else
+    tokens = tokens - cost
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'updated', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+return tostring(wait)
+"""
+
+# KEYS[1] sorted set of held slots scored by expiry; ARGV: token, limit, now, ttl
+ACQUIRE_SCRIPT = """
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', ARGV[3])
+if redis.call('ZCARD', KEYS[1]) >= tonumber(ARGV[2]) then
+    return 0
+end
+redis.call('ZADD', KEYS[1], tonumber(ARGV[3]) + tonumber(ARGV[4]), ARGV[1])
+redis.call('EXPIRE', KEYS[1], ARGV[4])
+return 1
+"""
+
+
+class RedisQuotaBackend:
+    """Counters shared by every process through Redis; one round trip per call.
+
+    Held slots expire after ``ttl`` so a crashed worker cannot leak them.
+    """
+
+    def __init__(self, client, prefix='quota:'):
+        self.client = client
+        self.prefix = prefix
+        self._take = client.register_script(TAKE_SCRIPT)
+        self._acquire = client.register_script(ACQUIRE_SCRIPT)
+
+    def take(self, key, rate, burst, cost):
+        return float(self._take(keys=[f"{self.prefix}rate:{key}"], args=[rate, burst, cost, time.time()]))
+
+    def acquire(self, key, token, limit, ttl):
+        return bool(self._acquire(keys=[f"{self.prefix}slots:{key}"], args=[token, limit, time.time(), ttl]))
+
+    def release(self, key, token):
+        self.client.zrem(f"{self.prefix}slots:{key}", token)
+
+
+class Quotas:
+    """Generation rate limits and in-flight caps, looked up by user tier"""
+
+    def __init__(self, app=None):
+        self.backend = None
+        self.tiers = {}
+        self.slot_ttl = 900
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        config = app.config
+        self.tiers = config['QUOTA_TIERS']
+        self.slot_ttl = config['QUOTA_SLOT_TTL']
+        if not config['QUOTAS_ENABLED']:
+            self.backend = None
+        elif config['QUOTA_BACKEND'] == 'redis':
+            import redis
+            self.backend = RedisQuotaBackend(redis.Redis.from_url(config['QUOTA_REDIS_URL']))
+        else:
+            self.backend = MemoryQuotaBackend()
+        app.extensions['quotas'] = self
+
+    @property
+    def enabled(self):
+        return self.backend is not None
+
+    def limits_for(self, user):
+        return self.tiers.get(getattr(user, 'tier', None)) or self.tiers['free']
+
+    def acquire(self, user, cost=1):
+        """Charge cost generations and hold one in-flight slot.
+
+        Returns a token for ``release``, or None when quotas are disabled.
+        Raises QuotaExceeded with a Retry-After hint when over a limit.
+        """
+        if not self.enabled:
+            return None
+        limits = self.limits_for(user)
+        if cost > limits['burst']:
+            # Could never be satisfied, however long the client waits
+            raise ValueError(f"At most {limits['burst']} images per request on this plan")
+
+        # Check the cap first so a rejected request does not spend tokens
+        token = uuid.uuid4().hex
+        if not self.backend.acquire(user.id, token, limits['concurrent'], self.slot_ttl):
+            raise QuotaExceeded(f"At most {limits['concurrent']} generations at a time", 5)
+        wait = self.backend.take(user.id, limits['per_minute'] / 60, limits['burst'], cost)
+        if wait:
+            self.backend.release(user.id, token)
+            raise QuotaExceeded("Generation rate limit exceeded", wait)
+        return token
+
+    def release(self, user_id, token):
+        if token is not None:
+            self.backend.release(user_id, token)
+
+
+quotas = Quotas()
@@ -0,0 +1,181 @@
+# utils/reaper.py
+
+import itertools
+import logging
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+from models import db, Image, StoredFile
+from utils.storage import get_storage, remove_files
+
+logger = logging.getLogger(__name__)
+
+# Derivatives are <stem>_w<width>.<ext>, next to an original <stem>.<ext>
+VARIANT_PATTERN = re.compile(r'^(.+)_w\d+\.[a-z]+$')
+ORIGINAL_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.webp')
+# Shipped with the app rather than generated; never collected
+KEEP = {'images/placeholder.png'}
+
+
+def _batches(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(itertools.islice(iterator, size)):
+        yield batch
+
+
+def referenced_paths(paths):
+    """The subset of paths an Image row or a StoredFile row still points at"""
+    paths = list(paths)
+    if not paths:
+        return set()
+    referenced = {row[0] for row in db.session.query(Image.image_path).filter(Image.image_path.in_(paths)).distinct()}
+    referenced |= {row[0] for row in db.session.query(StoredFile.path).filter(StoredFile.path.in_(paths))}
+    return referenced
+
+
+def _owners(key):
+    """Original keys a derivative could belong to; empty for non-derivatives"""
+    match = VARIANT_PATTERN.match(key)
+    return [match.group(1) + ext for ext in ORIGINAL_EXTENSIONS] if match else []
+
+
+class FileReaper:
+    """Deletes stored files off the request path.
+
+    Deletes commit first and hand the orphaned paths over here; a single
+    worker thread re-checks that nothing references them again (identical
+    bytes may have been generated meanwhile) and removes them. Work queued
+    when the process dies is picked up by the next ``storage-gc`` run.
+    With STORAGE_GC_INTERVAL set the same worker also runs that GC
+    periodically.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self._executor = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='reaper')
+        interval = app.config['STORAGE_GC_INTERVAL']
+        if interval > 0:
+            threading.Thread(target=self._schedule_gc, args=(interval,), name='storage-gc', daemon=True).start()
+        app.extensions['reaper'] = self
+
+    def enqueue(self, files):
+        """Queue {image_path: [variant paths]} whose last reference was committed away"""
+        if files:
+            self._executor.submit(self._reap, files)
+
+    def _reap(self, files):
+        with self.app.app_context():
+            try:
+                in_use = referenced_paths(files)
+                remove_files([path for key, variants in files.items() if key not in in_use
+                              for path in [key, *variants]])
+            except Exception:
+                logger.exception("Reaping %d files failed", len(files))
+            finally:
+                db.session.remove()
+
+    def _schedule_gc(self, interval):
+        while True:
+            time.sleep(interval)
+            self._executor.submit(self._gc)
+
+    def _gc(self):
+        with self.app.app_context():
+            try:
+                config = current_app.config
+                stats = collect_garbage(config['STORAGE_GC_BATCH_SIZE'], config['STORAGE_GC_GRACE'])
+                logger.info("Storage GC: %s", stats)
+            except Exception:
+                logger.exception("Storage GC failed")
+            finally:
+                db.session.remove()
+
+
+reaper = FileReaper()
+
+
+def collect_garbage(batch_size=500, grace=3600, dry_run=False):
+    """Remove stored files under images/ that no row refers to.
+
+    The listing is streamed and checked batch_size keys at a time, so
+    neither side is ever held in memory whole. Files younger than grace
+    seconds are skipped: a generation stores its file before its row commits.
+    """
+    storage = get_storage()
+    cutoff = time.time() - grace
+    stats = {'scanned': 0, 'orphaned': 0, 'bytes': 0}
+
+    for batch in _batches(storage.iter_keys('images/'), batch_size):
+        stats['scanned'] += len(batch)
+        candidates = [(key, size) for key, mtime, size in batch if mtime < cutoff and key not in KEEP]
+        in_use = referenced_paths({key for key, _ in candidates} |
+                                  {owner for key, _ in candidates for owner in _owners(key)})
+        orphans = [(key, size) for key, size in candidates
+                   if key not in in_use and not any(owner in in_use for owner in _owners(key))]
+        # End the read transaction between batches
+        db.session.commit()
+
+        stats['orphaned'] += len(orphans)
+        stats['bytes'] += sum(size for _, size in orphans)
+        if orphans and not dry_run:
+            remove_files([key for key, _ in orphans])
+    return stats
+
+
+def find_missing_files(batch_size=500, delete=False):
+    """Walk the images table by id and report rows whose file is gone.
+
+    With delete, those rows and their StoredFile counts are dropped too.
+    """
+    storage = get_storage()
+    stats = {'rows': 0, 'missing': 0}
+    last_id = 0
+
+    while True:
+        rows = db.session.query(Image.id, Image.image_path) \
+            .filter(Image.id > last_id).order_by(Image.id).limit(batch_size).all()
+        if not rows:
+            break
+        last_id = rows[-1].id
+        stats['rows'] += len(rows)
+
+        missing = {path for path in {row.image_path for row in rows} if not storage.exists(path)}
+        ids = [row.id for row in rows if row.image_path in missing]
+        stats['missing'] += len(ids)
+        if ids and delete:
+            Image.query.filter(Image.id.in_(ids)).delete(synchronize_session=False)
+            StoredFile.query.filter(StoredFile.path.in_(missing)) \
+                .filter(~StoredFile.path.in_(db.session.query(Image.image_path))) \
+                .delete(synchronize_session=False)
+        db.session.commit()
+    return stats
+
+
+@click.command('storage-gc')
+@click.option('--batch-size', default=500, show_default=True, help='Keys or rows checked per batch.')
+@click.option('--grace', default=3600, show_default=True, help='Skip files modified in the last N seconds.')
+@click.option('--dry-run', is_flag=True, help='Report orphaned files without removing them.')
+@click.option('--missing-rows', type=click.Choice(['skip', 'report', 'delete']), default='report',
+              show_default=True, help='What to do with image rows whose file is gone.')
+@with_appcontext
+def storage_gc_command(batch_size, grace, dry_run, missing_rows):
+    """Reconcile stored image files with the images table."""
+    stats = collect_garbage(batch_size, grace, dry_run)
+    verb = 'Found' if dry_run else 'Removed'
+    click.echo(f"Scanned {stats['scanned']} files. {verb} {stats['orphaned']} orphaned ({stats['bytes']} bytes)")
+
+    if missing_rows != 'skip':
+        stats = find_missing_files(batch_size, delete=missing_rows == 'delete' and not dry_run)
+        click.echo(f"Checked {stats['rows']} rows, {stats['missing']} point at missing files")
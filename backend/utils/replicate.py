@@ -1,62 +1,92 @@
 # utils/replicate.py
 
 import os
-import replicate
-import requests
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from utils.aio import aio, async_download_to_file
+from utils.http import download_to_file
+from utils.jobs import report_progress
+from utils.providers import providers, GenerationError
 from flask import current_app
 from datetime import datetime
+import shutil
+import time
+import uuid
 
-def generate_image(prompt_data, user_id):
-    """Generate image using Replicate API and save it locally"""
+PLACEHOLDER_IMAGE = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'static', 'images', 'placeholder.png')
+
+def scratch_filename(user_id):
+    """Unique name for a download; concurrent batch items may share a timestamp"""
+    return f"user_{user_id}_{datetime.now().strftime('%Y%m%d%H%M%S%f')}_{uuid.uuid4().hex[:8]}.png"
+
+def _fetch(output, image_path):
+    if output is None:
+        # Fake providers without a URL stand in the placeholder
+        shutil.copyfile(PLACEHOLDER_IMAGE, image_path)
+    else:
+        # Stream the image to scratch space through the shared pooled session
+        download_to_file(output, image_path)
+
+async def _async_fetch(output, image_path):
+    if output is None:
+        shutil.copyfile(PLACEHOLDER_IMAGE, image_path)
+    else:
+        await async_download_to_file(output, image_path)
+
+def generate_image(final_prompt, user_id):
+    """Run a built prompt (see utils.prompts) on the routed model providers and
+    download the output to scratch space"""
+    report_progress('model_running')
+    # Model runs always live on the shared event loop, where a hedged
+    # request's loser can actually be cancelled; this thread just waits,
+    # no longer than the providers' timeouts allow
+    start = time.perf_counter()
+    future = aio.submit(providers.run(final_prompt))
+    try:
+        provider, output = future.result(timeout=providers.run_timeout)
+    except FutureTimeoutError:
+        future.cancel()
+        raise GenerationError(f"Image generation timed out after {providers.run_timeout:g}s")
+    model_seconds = time.perf_counter() - start
+
+    image_path = os.path.join(current_app.config['IMAGE_SCRATCH_DIR'], scratch_filename(user_id))
+    report_progress('downloading')
+    start = time.perf_counter()
     try:
-        # Construct the prompt based on the input type
-        if isinstance(prompt_data, dict):
-            if 'customPrompt' in prompt_data:
-                # Custom prompt
-                final_prompt = prompt_data['customPrompt']
-            else:
-                # Guided prompt - combine all parameters into one prompt
-                style = prompt_data.get('style', '')
-                subject = prompt_data.get('subject', '')
-                mood = prompt_data.get('mood', '')
-                lighting = prompt_data.get('lighting', '')
-                final_prompt = f"{subject} in {style} style with {mood} mood and {lighting} lighting"
-        else:
-            final_prompt = str(prompt_data)
-
-        # Run the model
-        output = replicate.run(
-            "black-forest-labs/flux-schnell",
-            input={
-                "prompt": final_prompt,
-            }
-        )
-        
-        # Get the image URL from the output
-        if output and isinstance(output, list) and len(output) > 0:
-            image_url = output[0]
-            
-            # Create directory if it doesn't exist
-            os.makedirs('static/images', exist_ok=True)
-            
-            # Generate unique filename
-            filename = f"user_{user_id}_{datetime.now().strftime('%Y%m%d%H%M%S%f')}.png"
-            image_path = os.path.join('static/images', filename)
-            
-            # Download and save the image
-            response = requests.get(image_url)
-            if response.status_code == 200:
-                with open(image_path, 'wb') as f:
-                    f.write(response.content)
-                
-                return {
-                    'image_path': f"images/{filename}",
-                    'final_prompt': final_prompt
-                }
-            else:
-                raise Exception(f"Failed to download image: {response.status_code}")
-        else:
-            raise Exception("No image generated from API")
-            
+        _fetch(output, image_path)
     except Exception as e:
-        raise Exception(f"Image generation failed: {str(e)}")
+        raise GenerationError(f"Image generation failed: {str(e)}") from e
+
+    return {
+        'image_path': image_path,
+        'final_prompt': final_prompt,
+        'provider': provider,
+        'model': providers.model_of(provider),
+        # Wall time as the caller saw it, hedges and fallbacks included
+        'model_seconds': model_seconds,
+        'download_seconds': time.perf_counter() - start,
+    }
+
+async def async_generate_image(final_prompt, user_id):
+    """generate_image for the event loop: awaits the providers and the download"""
+    report_progress('model_running')
+    start = time.perf_counter()
+    provider, output = await providers.run(final_prompt)
+    model_seconds = time.perf_counter() - start
+
+    image_path = os.path.join(current_app.config['IMAGE_SCRATCH_DIR'], scratch_filename(user_id))
+    report_progress('downloading')
+    start = time.perf_counter()
+    try:
+        await _async_fetch(output, image_path)
+    except Exception as e:
+        raise GenerationError(f"Image generation failed: {str(e)}") from e
+
+    return {
+        'image_path': image_path,
+        'final_prompt': final_prompt,
+        'provider': provider,
+        'model': providers.model_of(provider),
+        # Wall time as the caller saw it, hedges and fallbacks included
+        'model_seconds': model_seconds,
+        'download_seconds': time.perf_counter() - start,
+    }
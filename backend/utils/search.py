@@ -0,0 +1,111 @@
+# utils/search.py
+
+import re
+
+from sqlalchemy import DDL, event, select, text
+
+from models import db, Image
+
+# FTS5 copy of every prompt plus an owner token ("u<user_id>"), so a
+# user's matches come from intersecting two posting lists instead of
+# filtering every user's hits. Kept current by triggers on images.
+SEARCH_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS images_fts USING fts5("
+    "prompt, owner, tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+    "CREATE TRIGGER IF NOT EXISTS images_fts_insert AFTER INSERT ON images BEGIN "
+    "INSERT INTO images_fts(rowid, prompt, owner) VALUES (new.id, coalesce(new.prompt, ''), 'u' || new.user_id); END",
+    "CREATE TRIGGER IF NOT EXISTS images_fts_delete AFTER DELETE ON images BEGIN "
+    "DELETE FROM images_fts WHERE rowid = old.id; END",
+    "CREATE TRIGGER IF NOT EXISTS images_fts_update AFTER UPDATE OF prompt, user_id ON images BEGIN "
+    "UPDATE images_fts SET prompt = coalesce(new.prompt, ''), owner = 'u' || new.user_id WHERE rowid = new.id; END",
+]
+
+# db.create_all() (tests, benchmarks, fresh dev databases) gets the index
+# too; existing databases get it from the migration
+for statement in SEARCH_DDL:
+    event.listen(Image.__table__, 'after_create', DDL(statement).execute_if(dialect='sqlite'))
+
+TOKEN_PATTERN = re.compile(r'\w+')
+# Candidates fetched from the index for similar-prompt ranking
+SIMILAR_CANDIDATES = 200
+SIMILAR_QUERY_TOKENS = 6
+
+
+def uses_fts():
+    return db.engine.dialect.name == 'sqlite'
+
+
+def _match_expression(user_id, tokens, any_token=False):
+    # Tokens are quoted, so user input never reaches FTS syntax; the last
+    # one also matches as a prefix, for search-as-you-type
+    quoted = [f'"{token}"' for token in tokens]
+    quoted[-1] += '*'
+    terms = (' OR ' if any_token else ' AND ').join(quoted)
+    return f'owner : "u{int(user_id)}" AND prompt : ({terms})'
+
+
+def _fts_search(user_id, tokens, limit, any_token=False):
+    """(image id, bm25 score) pairs, best first; lower bm25 is better"""
+    rows = db.session.execute(text(
+        "SELECT rowid, bm25(images_fts, 1.0, 0.0) AS score FROM images_fts "
+        "WHERE images_fts MATCH :match ORDER BY score LIMIT :limit"
+    ), {'match': _match_expression(user_id, tokens, any_token), 'limit': limit}).all()
+    return [(row.rowid, -row.score) for row in rows]
+
+
+def _like_search(user_id, tokens, limit):
+    # Databases without FTS5: every token must appear somewhere, newest first
+    query = select(Image.id).where(Image.user_id == user_id)
+    for token in tokens:
+        query = query.where(Image.prompt.ilike(f'%{token}%'))
+    ids = db.session.execute(query.order_by(Image.generated_at.desc()).limit(limit)).scalars()
+    return [(image_id, None) for image_id in ids]
+
+
+def ngrams(value, n=3):
+    """Character n-grams of the normalized prompt, padded so short words count"""
+    value = f" {' '.join(TOKEN_PATTERN.findall(value.lower()))} "
+    return {value[i:i + n] for i in range(max(1, len(value) - n + 1))}
+
+
+def similarity(a, b):
+    """Jaccard similarity of two n-gram sets"""
+    return len(a & b) / len(a | b) if a and b else 0.0
+
+
+def search_images(user_id, query, limit):
+    """Ids and relevance of the user's images whose prompt matches every query word"""
+    tokens = [token.lower() for token in TOKEN_PATTERN.findall(query)]
+    if not tokens:
+        return []
+    if uses_fts():
+        return _fts_search(user_id, tokens, limit)
+    return _like_search(user_id, tokens, limit)
+
+
+def similar_images(user_id, prompt, limit, exclude_id=None):
+    """Ids and similarity of the user's images with prompts close to prompt.
+
+    The index supplies candidates sharing any word (or word prefix); those
+    are re-ranked by character-trigram Jaccard similarity, which also
+    tolerates reordering and small edits.
+    """
+    # Longer words are rarer, so they make the cheapest candidate query
+    tokens = sorted({token.lower() for token in TOKEN_PATTERN.findall(prompt) if len(token) > 2},
+                    key=lambda token: (-len(token), token))[:SIMILAR_QUERY_TOKENS]
+    if not tokens:
+        return []
+    if uses_fts():
+        candidates = [image_id for image_id, _ in _fts_search(user_id, tokens, SIMILAR_CANDIDATES, any_token=True)]
+    else:
+        candidates = [image_id for image_id, _ in _like_search(user_id, tokens[:1], SIMILAR_CANDIDATES)]
+    if exclude_id is not None:
+        candidates = [image_id for image_id in candidates if image_id != exclude_id]
+    if not candidates:
+        return []
+
+    target = ngrams(prompt)
+    prompts = db.session.execute(select(Image.id, Image.prompt).where(Image.id.in_(candidates))).all()
+    scored = [(row.id, round(similarity(target, ngrams(row.prompt or '')), 4)) for row in prompts]
+    scored.sort(key=lambda item: item[1], reverse=True)
+    return scored[:limit]
@@ -0,0 +1,75 @@
+# utils/serving.py
+
+import mimetypes
+import os
+
+from flask import abort, current_app, redirect, request, send_from_directory
+from werkzeug.security import safe_join
+from werkzeug.utils import send_file
+
+from utils.storage import IMMUTABLE_CACHE_CONTROL, LocalStorage, get_storage, is_content_path
+
+
+def _mimetype(key):
+    return mimetypes.guess_type(key)[0] or 'application/octet-stream'
+
+
+def _etag_for(key, stat):
+    # Content-addressed keys carry their own hash; legacy flat files never
+    # change after being written, so inode data is stable enough for them
+    if is_content_path(key):
+        return os.path.splitext(os.path.basename(key))[0]
+    return f"{int(stat.st_mtime)}-{stat.st_size}"
+
+
+def send_stored_image(key):
+    """Serve a stored image with strong ETag, Range and immutable caching.
+
+    With IMAGE_SENDFILE_MODE set the transfer is handed to the front proxy
+    (nginx X-Accel-Redirect or Apache/lighttpd X-Sendfile).
+    """
+    storage = get_storage()
+    if not isinstance(storage, LocalStorage):
+        # Objects live in the bucket; let the client fetch them there
+        return redirect(storage.url_builder()(key), code=302)
+
+    path = safe_join(storage.root, key)
+    if path is None or not os.path.isfile(path):
+        abort(404)
+
+    config = current_app.config
+    stat = os.stat(path)
+    etag = _etag_for(key, stat)
+
+    if config['IMAGE_SENDFILE_MODE'] == 'x-accel':
+        response = current_app.response_class(mimetype=_mimetype(key))
+        response.set_etag(etag)
+        response.last_modified = stat.st_mtime
+        response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+        # Same 304/412/416 and If-Range decisions as send_file below; nginx
+        # then serves the bytes, and the range, from the internal location
+        response.make_conditional(request.environ, accept_ranges=True, complete_length=stat.st_size)
+        if response.status_code in (304, 412):
+            return response
+        response.headers['X-Accel-Redirect'] = f"{config['IMAGE_ACCEL_PREFIX'].rstrip('/')}/{key}"
+        return response
+
+    response = send_file(
+        path,
+        request.environ,
+        mimetype=_mimetype(key),
+        use_x_sendfile=config['IMAGE_SENDFILE_MODE'] == 'x-sendfile',
+        response_class=current_app.response_class,
+        etag=etag,
+        last_modified=stat.st_mtime,
+        conditional=True,  # 304s and byte ranges
+    )
+    response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+    return response
+
+
+def send_index(directory):
+    """Serve the SPA shell; it changes on every deploy, so cache it briefly"""
+    response = send_from_directory(directory, 'index.html', max_age=current_app.config['INDEX_MAX_AGE'])
+    response.cache_control.must_revalidate = True
+    return response
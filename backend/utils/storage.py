@@ -0,0 +1,414 @@
+# utils/storage.py
+
+import hashlib
+import json
+import logging
+import mimetypes
+import os
+import shutil
+import tempfile
+
+import click
+from flask import current_app, url_for
+from flask.cli import with_appcontext
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+
+from models import db, Image, StoredFile
+from utils.derivatives import build_derivatives, get_pool, make_derivatives, supported_formats, variant_paths
+
+logger = logging.getLogger(__name__)
+
+HASH_CHUNK_SIZE = 1024 * 1024
+STREAM_CHUNK_SIZE = 64 * 1024
+# Stored keys are content hashes, so the bytes behind a key never change
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+
+class LocalStorage:
+    """Image bytes on the local filesystem, served by the app under /static"""
+
+    def __init__(self, root):
+        self.root = root
+
+    def path(self, key):
+        return os.path.join(self.root, key)
+
+    def exists(self, key):
+        return os.path.exists(self.path(key))
+
+    def put_file(self, key, src):
+        """Move a local file into storage under key"""
+        dest = self.path(key)
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        shutil.move(src, dest)
+
+    def open(self, key):
+        return open(self.path(key), 'rb')
+
+    def stream(self, key, chunk_size=STREAM_CHUNK_SIZE):
+        with self.open(key) as f:
+            for chunk in iter(lambda: f.read(chunk_size), b''):
+                yield chunk
+
+    def fetch(self, key, dest):
+        """Copy a stored object to a local path"""
+        shutil.copyfile(self.path(key), dest)
+
+    def delete(self, key):
+        try:
+            os.remove(self.path(key))
+        except FileNotFoundError:
+            pass
+
+    def iter_keys(self, prefix=''):
+        """Yield (key, mtime, size) for every file under prefix, one directory at a time"""
+        pending = [self.path(prefix)]
+        while pending:
+            try:
+                entries = os.scandir(pending.pop())
+            except FileNotFoundError:
+                continue
+            with entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        pending.append(entry.path)
+                    elif entry.is_file(follow_symlinks=False):
+                        stat = entry.stat()
+                        key = os.path.relpath(entry.path, self.root).replace(os.sep, '/')
+                        yield key, stat.st_mtime, stat.st_size
+
+    def url_builder(self):
+        """Return a key -> URL function; the prefix is resolved once per call"""
+        prefix = url_for('static', filename='', _external=True)
+        return lambda key: prefix + key
+
+
+class S3Storage:
+    """Image bytes in an S3-API bucket; clients download via presigned URLs"""
+
+    def __init__(self, bucket, prefix='', endpoint_url=None, region=None, public_url=None,
+                 presign_expires=3600, multipart_threshold=8 * 1024 * 1024,
+                 multipart_chunksize=8 * 1024 * 1024):
+        import boto3
+        from boto3.s3.transfer import TransferConfig
+
+        self.bucket = bucket
+        self.prefix = prefix
+        self.public_url = public_url.rstrip('/') if public_url else None
+        self.presign_expires = presign_expires
+        self.client = boto3.client('s3', endpoint_url=endpoint_url, region_name=region)
+        # upload_file switches to parallel multipart uploads above the threshold
+        self.transfer_config = TransferConfig(multipart_threshold=multipart_threshold,
+                                              multipart_chunksize=multipart_chunksize)
+
+    def _key(self, key):
+        return self.prefix + key
+
+    def exists(self, key):
+        from botocore.exceptions import ClientError
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self._key(key))
+            return True
+        except ClientError as e:
+            if e.response['Error']['Code'] in ('404', 'NoSuchKey', 'NotFound'):
+                return False
+            raise
+
+    def put_file(self, key, src):
+        """Upload a local file under key and remove the local copy"""
+        content_type = mimetypes.guess_type(key)[0] or 'application/octet-stream'
+        self.client.upload_file(src, self.bucket, self._key(key),
+                                ExtraArgs={'ContentType': content_type,
+                                           'CacheControl': IMMUTABLE_CACHE_CONTROL},
+                                Config=self.transfer_config)
+        os.remove(src)
+
+    def open(self, key):
+        return self.client.get_object(Bucket=self.bucket, Key=self._key(key))['Body']
+
+    def stream(self, key, chunk_size=STREAM_CHUNK_SIZE):
+        body = self.open(key)
+        try:
+            for chunk in body.iter_chunks(chunk_size):
+                yield chunk
+        finally:
+            body.close()
+
+    def fetch(self, key, dest):
+        self.client.download_file(self.bucket, self._key(key), dest, Config=self.transfer_config)
+
+    def delete(self, key):
+        self.client.delete_object(Bucket=self.bucket, Key=self._key(key))
+
+    def iter_keys(self, prefix=''):
+        """Yield (key, mtime, size) for every object under prefix, a listing page at a time"""
+        paginator = self.client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self._key(prefix)):
+            for obj in page.get('Contents', []):
+                yield obj['Key'][len(self.prefix):], obj['LastModified'].timestamp(), obj['Size']
+
+    def url_builder(self):
+        if self.public_url:
+            return lambda key: f"{self.public_url}/{self._key(key)}"
+        # Presigning is a local HMAC computation, no request to S3
+        return lambda key: self.client.generate_presigned_url(
+            'get_object', Params={'Bucket': self.bucket, 'Key': self._key(key)}, ExpiresIn=self.presign_expires)
+
+
+def init_storage(app):
+    config = app.config
+    if config['STORAGE_BACKEND'] == 's3':
+        backend = S3Storage(
+            config['S3_BUCKET'],
+            prefix=config['S3_PREFIX'],
+            endpoint_url=config['S3_ENDPOINT_URL'],
+            region=config['S3_REGION'],
+            public_url=config['S3_PUBLIC_URL'],
+            presign_expires=config['S3_PRESIGN_EXPIRES'],
+            multipart_threshold=config['S3_MULTIPART_THRESHOLD'],
+            multipart_chunksize=config['S3_MULTIPART_CHUNKSIZE'],
+        )
+    else:
+        backend = LocalStorage(config['IMAGE_STORAGE_ROOT'])
+    os.makedirs(config['IMAGE_SCRATCH_DIR'], exist_ok=True)
+    app.extensions['storage'] = backend
+    return backend
+
+
+def get_storage():
+    return current_app.extensions['storage']
+
+
+def file_digest(path):
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def content_path(digest, ext):
+    """Sharded storage key for a digest: images/ab/cd/<digest><ext>"""
+    return f"images/{digest[:2]}/{digest[2:4]}/{digest}{ext}"
+
+
+def is_content_path(image_path):
+    parts = image_path.split('/')
+    return len(parts) == 4 and parts[0] == 'images' and parts[3].startswith(parts[1] + parts[2])
+
+
+def _put_if_missing(storage, key, src):
+    if storage.exists(key):
+        os.remove(src)
+    else:
+        storage.put_file(key, src)
+
+
+def ingest_image(src):
+    """Move a freshly written local file into content-addressed storage.
+
+    Derivatives are built from the local copy before upload. If identical
+    bytes are already stored the new copy is dropped and the known variants
+    are reused. Returns ``(key, variants, size)``.
+    """
+    storage = get_storage()
+    scratch = current_app.config['IMAGE_SCRATCH_DIR']
+    key = content_path(file_digest(src), os.path.splitext(src)[1].lower() or '.png')
+    size = os.path.getsize(src)
+
+    known = db.session.query(Image.variants) \
+        .filter(Image.image_path == key, Image.variants.isnot(None)).first()
+    if known and storage.exists(key):
+        os.remove(src)
+        return key, json.loads(known[0]), size
+
+    # Private work dir: concurrent jobs may ingest identical bytes
+    work_dir = tempfile.mkdtemp(dir=scratch)
+    try:
+        variants = build_derivatives(src, key, work_dir)
+        for path in variant_paths(json.dumps(variants)):
+            _put_if_missing(storage, path, os.path.join(work_dir, path))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    _put_if_missing(storage, key, src)
+    return key, variants, size
+
+
+def add_reference(image_path, size=None, count=1):
+    """Count more Image rows pointing at image_path (caller commits)"""
+    updated = StoredFile.query.filter_by(path=image_path) \
+        .update({StoredFile.refcount: StoredFile.refcount + count}, synchronize_session=False)
+    if updated:
+        return
+    try:
+        with db.session.begin_nested():
+            db.session.add(StoredFile(path=image_path, size=size, refcount=count))
+    except IntegrityError:
+        # Another worker inserted the row first
+        StoredFile.query.filter_by(path=image_path) \
+            .update({StoredFile.refcount: StoredFile.refcount + count}, synchronize_session=False)
+
+
+def release_reference(image_path):
+    """Drop one reference and return how many remain (caller commits).
+
+    Paths written before reference counting existed have no StoredFile row;
+    for those the remaining Image rows are counted instead.
+    """
+    stored = db.session.get(StoredFile, image_path, with_for_update=True)
+    if stored is None:
+        return Image.query.filter(Image.image_path == image_path).count() - 1
+
+    stored.refcount -= 1
+    if stored.refcount <= 0:
+        db.session.delete(stored)
+        return 0
+    return stored.refcount
+
+
+def release_references(counts):
+    """Drop counts[path] references for each path after their Image rows
+    were deleted; return the paths nothing refers to any more (caller commits)"""
+    paths = list(counts)
+    stored = {row.path: row for row in
+              StoredFile.query.filter(StoredFile.path.in_(paths)).with_for_update()}
+    orphaned = []
+    for path, row in stored.items():
+        row.refcount -= counts[path]
+        if row.refcount <= 0:
+            db.session.delete(row)
+            orphaned.append(path)
+
+    # Pre-refcount paths: the rows are gone already, so count what is left
+    legacy = [path for path in paths if path not in stored]
+    if legacy:
+        remaining = dict(db.session.query(Image.image_path, func.count())
+                         .filter(Image.image_path.in_(legacy)).group_by(Image.image_path))
+        orphaned += [path for path in legacy if not remaining.get(path)]
+    return orphaned
+
+
+def remove_files(paths):
+    """Delete stored objects, ignoring ones that are already gone"""
+    storage = get_storage()
+    for path in paths:
+        try:
+            storage.delete(path)
+        except Exception as e:
+            logger.error(f"Error deleting file {path}: {str(e)}")
+
+
+@click.command('storage-migrate')
+@click.option('--batch-size', default=500, show_default=True, help='Distinct paths handled per batch.')
+@with_appcontext
+def storage_migrate_command(batch_size):
+    """Move flat static/images files into content-addressed storage."""
+    root = current_app.config['IMAGE_STORAGE_ROOT']
+    moved = missing = 0
+    last_path = ''
+
+    while True:
+        paths = [row[0] for row in db.session.query(Image.image_path)
+                 .filter(Image.image_path > last_path)
+                 .distinct().order_by(Image.image_path).limit(batch_size)]
+        if not paths:
+            break
+        last_path = paths[-1]
+
+        for old_path in paths:
+            if is_content_path(old_path):
+                new_path = old_path
+            elif not os.path.exists(os.path.join(root, old_path)):
+                missing += 1
+                logger.warning(f"Skipping missing file: {old_path}")
+                continue
+            else:
+                old_variants = db.session.query(Image.variants) \
+                    .filter(Image.image_path == old_path, Image.variants.isnot(None)).first()
+                new_path, variants, _ = ingest_image(os.path.join(root, old_path))
+                Image.query.filter(Image.image_path == old_path) \
+                    .update({Image.image_path: new_path, Image.variants: json.dumps(variants) if variants else None},
+                            synchronize_session=False)
+                # Variants named after the flat file are superseded
+                if old_variants:
+                    for path in variant_paths(old_variants[0]):
+                        if os.path.exists(os.path.join(root, path)):
+                            os.remove(os.path.join(root, path))
+                moved += 1
+
+            refs = Image.query.filter(Image.image_path == new_path).count()
+            stored = db.session.get(StoredFile, new_path)
+            if stored is None:
+                db.session.add(StoredFile(path=new_path, refcount=refs))
+            else:
+                stored.refcount = refs
+            db.session.flush()
+        db.session.commit()
+        click.echo(f"Processed paths up to {last_path}")
+
+    click.echo(f"Migration complete: {moved} moved, {missing} missing")
+
+
+@click.command('backfill-variants')
+@click.option('--batch-size', default=200, show_default=True, help='Rows loaded per batch.')
+@click.option('--force', is_flag=True, help='Rebuild variants for rows that already have them.')
+@with_appcontext
+def backfill_variants_command(batch_size, force):
+    """Generate derivatives for existing images."""
+    storage = get_storage()
+    config = current_app.config
+    scratch = config['IMAGE_SCRATCH_DIR']
+    formats = supported_formats(config['DERIVATIVE_FORMATS'])
+    pool = get_pool()
+    last_id = 0
+    done = failed = 0
+
+    while True:
+        query = Image.query.filter(Image.id > last_id)
+        if not force:
+            query = query.filter(Image.variants.is_(None))
+        batch = query.order_by(Image.id).limit(batch_size).all()
+        if not batch:
+            break
+        last_id = batch[-1].id
+
+        # Rows sharing a file are derived once
+        work_dir = tempfile.mkdtemp(dir=scratch)
+        futures = {}
+        for image in batch:
+            if image.image_path in futures:
+                continue
+            source = os.path.join(work_dir, 'src_' + os.path.basename(image.image_path))
+            try:
+                storage.fetch(image.image_path, source)
+            except Exception as e:
+                logger.error(f"Could not fetch {image.image_path}: {str(e)}")
+                futures[image.image_path] = None
+                continue
+            futures[image.image_path] = pool.submit(make_derivatives, source, work_dir, image.image_path,
+                                                    config['DERIVATIVE_WIDTHS'], formats)
+
+        results = {}
+        for image_path, future in futures.items():
+            if future is None:
+                continue
+            try:
+                variants = future.result()
+                for path in variant_paths(json.dumps(variants)):
+                    storage.put_file(path, os.path.join(work_dir, path))
+                results[image_path] = json.dumps(variants)
+            except Exception as e:
+                logger.error(f"Derivative generation failed for {image_path}: {str(e)}")
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+        for image in batch:
+            if image.image_path in results:
+                image.variants = results[image.image_path]
+                done += 1
+            else:
+                failed += 1
+        db.session.commit()
+        click.echo(f"Processed up to image {last_id} ({done} done, {failed} failed)")
+
+    click.echo(f"Backfill complete: {done} done, {failed} failed")
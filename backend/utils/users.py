@@ -0,0 +1,121 @@
+# utils/users.py
+
+import threading
+import time
+
+from flask_login import UserMixin
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from models import db, User
+from utils.metrics import CACHE_LOOKUPS
+
+
+class CachedUser(UserMixin):
+    """Read-only snapshot of a User row, safe to share across requests"""
+
+    __slots__ = ('id', 'username', 'email', 'tier')
+
+    def __init__(self, user):
+        self.id = user.id
+        self.username = user.username
+        self.email = user.email
+        self.tier = user.tier
+
+
+class UserCache:
+    """Process-wide TTL cache of users by id.
+
+    flask_jwt_extended already keeps the loaded user for the rest of the
+    request, so this layer only has to spare the query across requests.
+    Writes through the ORM invalidate entries once they commit; the TTL
+    bounds staleness for changes made by other processes.
+    """
+
+    def __init__(self, app=None):
+        self.ttl = 60
+        self.max_entries = 10000
+        self._data = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.ttl = app.config['USER_CACHE_TTL']
+        self.max_entries = app.config['USER_CACHE_MAX_ENTRIES']
+        app.extensions['user_cache'] = self
+
+    def get(self, user_id):
+        """Return a CachedUser for user_id, or None if no such user exists"""
+        user_id = int(user_id)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(user_id)
+            if entry is not None and entry[1] > now:
+                self.hits += 1
+                CACHE_LOOKUPS.labels('user', 'hit').inc()
+                return entry[0]
+            self.misses += 1
+        CACHE_LOOKUPS.labels('user', 'miss').inc()
+
+        # Missing users are not cached, so a new account is visible at once
+        user = db.session.get(User, user_id)
+        if user is None:
+            return None
+        cached = CachedUser(user)
+        with self._lock:
+            if len(self._data) >= self.max_entries:
+                self._evict(now)
+            self._data[user_id] = (cached, now + self.ttl)
+        return cached
+
+    def _evict(self, now):
+        expired = [key for key, (_, expires_at) in self._data.items() if expires_at <= now]
+        for key in expired:
+            del self._data[key]
+        if len(self._data) >= self.max_entries:
+            # Still full of live entries: drop the oldest insertions
+            for key in list(self._data)[:len(self._data) // 10 + 1]:
+                del self._data[key]
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._data.pop(int(user_id), None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self._data),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': self.hits / lookups if lookups else 0.0,
+        }
+
+
+user_cache = UserCache()
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_changed_users(session, flush_context):
+    # new/dirty/deleted still hold their pre-flush contents here
+    changed = session.info.setdefault('changed_user_ids', set())
+    for obj in session.new | session.dirty | session.deleted:
+        if isinstance(obj, User) and obj.id is not None:
+            changed.add(obj.id)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_changed_users(session):
+    for user_id in session.info.pop('changed_user_ids', ()):
+        user_cache.invalidate(user_id)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_changed_users(session):
+    session.info.pop('changed_user_ids', None)
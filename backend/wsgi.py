@@ -1,4 +1,8 @@
-from app import app
+from app import create_app
+
+# Web workers only serve requests; migrations and maintenance commands
+# run through `flask` with the full app
+app = create_app(cli=False)
 
 if __name__=="__main__":
     app.run()
\ No newline at end of file
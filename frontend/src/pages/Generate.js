@@ -6,9 +6,14 @@ import { useLoading } from '../context/LoadingContext';
 import { BackgroundGradient } from '../components/BackgroundGradient';
 import api from "../utils/axios";
 
+// Give up on a job after as long as the server keeps its event stream open
+const JOB_POLL_TIMEOUT_MS = 10 * 60 * 1000;
+const JOB_POLL_INTERVAL_MS = 1500;
+
 const Generate= () => {
   const [ setSelectedFile] = useState(null);
   const [generatedImages, setGeneratedImages] = useState([]);
+  const [nextCursor, setNextCursor] = useState(null);
   const { isLoading, setIsLoading } = useLoading();
   const toast = useToast();
   const [promptType, setPromptType] = useState('guided');
@@ -30,7 +35,7 @@ const Generate= () => {
     config: { tension: 200, friction: 15 },
   });
 
-  const fetchImages = async () => {
+  const fetchImages = async (cursor = null) => {
     try {
       const token = localStorage.getItem('token');
       if (!token) {
@@ -41,11 +46,14 @@ const Generate= () => {
       const response = await api.get('/image/user-images', {
           headers: {
               'Authorization': `Bearer ${token}`
-          }
+          },
+          params: cursor ? { cursor } : {}
       });
 
       if (Array.isArray(response.data.images)) {
-          setGeneratedImages(response.data.images);
+          // A cursor means "next page": append instead of replacing
+          setGeneratedImages((prevImages) => cursor ? [...prevImages, ...response.data.images] : response.data.images);
+          setNextCursor(response.data.next_cursor);
       } else {
           console.error('Expected an array of images, but got:', response.data.images);
           setGeneratedImages([]);
@@ -68,6 +76,36 @@ const Generate= () => {
     }
   };
 
+  const pollJob = async (jobId) => {
+    const deadline = Date.now() + JOB_POLL_TIMEOUT_MS;
+    while (Date.now() < deadline) {
+      const { data } = await api.get(`/image/jobs/${jobId}`);
+      if (data.status === 'done' || data.status === 'failed') {
+        return data;
+      }
+      await new Promise((resolve) => setTimeout(resolve, JOB_POLL_INTERVAL_MS));
+    }
+    throw new Error('Timed out waiting for the image');
+  };
+
+  const waitForJob = (job) => new Promise((resolve, reject) => {
+    // Server-Sent Events push each state change. EventSource cannot set
+    // headers, so events_url carries a short-lived token for this job only
+    const source = new EventSource(job.events_url);
+    source.onmessage = (event) => {
+      const data = JSON.parse(event.data);
+      if (data.status === 'done' || data.status === 'failed') {
+        source.close();
+        resolve(data);
+      }
+    };
+    source.onerror = () => {
+      // Stream dropped (proxy timeout, old server): fall back to polling
+      source.close();
+      pollJob(job.id).then(resolve, reject);
+    };
+  });
+
   const handleGenerate = async (useCustomPrompt = false) => {
     setIsLoading(true);
     try {
@@ -87,8 +125,11 @@ const Generate= () => {
             });
 
         if (response.data.success) {
-          const generatedImageUrl = response.data.image.url; // Adjust based on your API response structure
-          setGeneratedImages((prevImages) => [...prevImages, generatedImageUrl]); // Add to the list of generated images
+          // Generation runs in the background; poll the job until it settles
+          const job = await waitForJob(response.data.job);
+          if (job.status !== 'done') {
+            throw new Error(job.error || 'Image generation failed');
+          }
           fetchImages();
 
             toast({
@@ -303,6 +344,9 @@ const handleDeleteImage = async () => {
         </Box>
     ))}
 </SimpleGrid>
+              {nextCursor && (
+                <Button mt={6} onClick={() => fetchImages(nextCursor)}>Load more</Button>
+              )}
             </>
           )}
         </Box>
@@ -40,7 +40,9 @@ const handleGoogleSignIn = useGoogleLogin({
     try {
       // Send the access token to your backend for verification and user creation
       const res = await api.post('/auth/google-login', {
-        token: response.access_token
+        token: response.access_token,
+        // Google's userinfo answer has no expiry; this bounds the server's cache of it
+        expires_in: response.expires_in
       });
       if (res.data.success) {
         localStorage.setItem('token', res.data.token);
@@ -37,7 +37,9 @@ const handleSubmit = async (event) => {
       console.log("Access Token:", response.access_token);
       try {
         const res = await api.post('/auth/google-login', {
-          token: response.access_token
+          token: response.access_token,
+          // Google's userinfo answer has no expiry; this bounds the server's cache of it
+          expires_in: response.expires_in
         });
         if (res.data.success) {
           localStorage.setItem('token', res.data.token);